@@ -15,15 +15,34 @@ from sentence_transformers import SentenceTransformer
 from streamlit_js_eval import streamlit_js_eval
 from yaml.loader import SafeLoader
 import google.cloud.logging
+import numpy as np
 
-from prompts.openai_summarise import system_prompt, user_prompt
+from prompts.openai_summarise import clustered_user_prompt, system_prompt
+from src.collection_utils.deduplicate import count_records, get_duplicate_members
 from src.collection_utils.query_collection import (
-    filter_search,
-    get_semantically_similar_results,
+    count_results,
+    count_similar_results,
+    fetch_results_page,
+    parse_keywords,
+    search_results_page,
 )
+from src.collection_utils.theme_index import get_themes, load_theme_index
 from src.common import renaming_dict, urgency_translate
 from src.utils.call_openai_summarise import Summariser
-from src.utils.utils import process_csv_file, process_txt_file, replace_env_variables
+from src.utils.context_selection import format_context_record, select_context
+from src.utils.process_results import (
+    DATE_COLUMN,
+    SCORE_COLUMN,
+    format_results_for_display,
+    results_to_dataframe,
+)
+from src.utils.timing import span, start_metrics_server, time_stream
+from src.utils.utils import (
+    get_qdrant_transport_config,
+    process_csv_file,
+    process_txt_file,
+    replace_env_variables,
+)
 
 
 # get env vars
@@ -37,6 +56,15 @@ QDRANT_HOST = os.getenv("QDRANT_HOST")  # "localhost" if running locally
 QDRANT_PORT = os.getenv("QDRANT_PORT")
 STREAMLIT_PASSWORD = os.getenv("STREAMLIT_PASSWORD")
 STREAMLIT_COOKIE_KEY = os.getenv("STREAMLIT_COOKIE_KEY")
+METRICS_PORT = os.getenv("METRICS_PORT")  # Serve timing histograms if set
+# Search modes offered for the search term
+SEARCH_MODES = {
+    "Similar meaning": "semantic",
+    "Exact words": "keyword",
+    "Exact words, most similar first": "hybrid",
+}
+# Precomputed themes, from collection/build_theme_index.py
+THEME_INDEX_PATH = os.getenv("THEME_INDEX_PATH", "data/theme_index.json")
 
 st.set_page_config(
     layout="wide",
@@ -93,7 +121,9 @@ authenticator = stauth.Authenticate(
 # TODO: Replace with call to HF Inferece API or OpenAI API
 @st.cache_resource()
 def load_qdrant_client():
-    client = QdrantClient(QDRANT_HOST, port=QDRANT_PORT)
+    client = QdrantClient(
+        QDRANT_HOST, port=QDRANT_PORT, **get_qdrant_transport_config()
+    )
     return client
 
 
@@ -132,6 +162,22 @@ def get_filters_metadata():
         print(f"Error running metadata script: {e}")
 
 
+@st.cache_resource()
+def load_themes(path):
+    if not os.path.exists(path):
+        print(f"No theme index found at {path}")
+        return None
+    return load_theme_index(path)
+
+
+@st.cache_resource()
+def load_metrics_server(port):
+    try:
+        return start_metrics_server(int(port))
+    except Exception as e:
+        print(f"Error starting metrics server: {e}")
+
+
 def get_session_id():
     """Get session id from context.
 
@@ -147,6 +193,8 @@ def get_session_id():
 
 
 logger = set_logger()
+if METRICS_PORT:
+    load_metrics_server(METRICS_PORT)
 client = load_qdrant_client()
 model = load_model(HF_MODEL_NAME)
 
@@ -160,7 +208,10 @@ seed = int(config.get("openai_seed"))
 stream = config.get("openai_stream")
 similarity_threshold = float(config.get("similarity_threshold_1"))
 max_context_records = int(config.get("max_records_for_summarisation"))
+context_similarity_threshold = float(config.get("context_similarity_threshold", 0.92))
 min_records_for_summarisation = int(config.get("min_records_for_summarisation"))
+results_page_size = int(config.get("results_page_size", 100))
+max_search_results = int(config.get("max_search_results", 10000))
 
 summariser = Summariser(
     OPENAI_API_KEY,
@@ -175,6 +226,7 @@ print(f"Using similarity threshold: {similarity_threshold}")
 # Run the script to get metadata for filters
 get_filters_metadata()
 filter_options = load_filter_dropdown_values(FILTER_OPTIONS_PATH)
+theme_index = load_themes(THEME_INDEX_PATH)
 
 
 def main():
@@ -266,6 +318,15 @@ def main():
 
         search_terms = search_term_input.strip().lower()
 
+        search_mode = st.sidebar.radio(
+            "Match feedback by",
+            list(SEARCH_MODES.keys()),
+            index=0,
+            key="search_mode",
+            help="Exact words finds feedback containing every word of the search, e.g. a form number. Separate alternatives with commas.",
+        )
+        search_mode = SEARCH_MODES[search_mode]
+
         st.sidebar.header("By URL(s)")
 
         # List of all pages for dropdown and filtering
@@ -410,23 +471,66 @@ def main():
         if search_button:
             if len(search_term_input) > 0:
                 logger.info(
-                    f"user_id:{browser_session_id} | session_id:{session_id} | running semantic search for '{search_terms}' with filters {filter_dict}..."
+                    f"user_id:{browser_session_id} | session_id:{session_id} | running {search_mode} search for '{search_terms}' with filters {filter_dict}..."
+                )
+                # Keyword and hybrid searches pre-filter on the full-text index
+                keywords = (
+                    parse_keywords(search_terms) if search_mode != "semantic" else None
                 )
-                query_embedding = model.encode(search_terms)
+                query_embedding = None
+                if search_mode != "keyword":
+                    with span("encode", logger, browser_session_id, session_id):
+                        query_embedding = model.encode(search_terms)
                 # Call the search function with filters
-                print(f"Running semantic search on {COLLECTION_NAME}...")
+                print(f"Running {search_mode} search on {COLLECTION_NAME}...")
                 try:
-                    with st.spinner("Running search..."):
-                        search_results = get_semantically_similar_results(
-                            client=client,
-                            collection_name=COLLECTION_NAME,
-                            query_embedding=query_embedding,
-                            score_threshold=similarity_threshold,
-                            filter_dict=filter_dict,
-                        )
-                    results = [dict(result) for result in search_results]
+                    with st.spinner("Running search..."), span(
+                        f"{search_mode}_search", logger, browser_session_id, session_id
+                    ) as timing:
+                        # Only count the results here, pages are fetched from
+                        # Qdrant as they are shown. Keyword matches need no
+                        # similarity threshold.
+                        search_query = {
+                            "filter_dict": filter_dict,
+                            "query_embedding": query_embedding,
+                            "score_threshold": similarity_threshold
+                            if search_mode == "semantic"
+                            else None,
+                            "start_date": start_date,
+                            "end_date": end_date,
+                            "keywords": keywords,
+                        }
+                        if search_mode == "semantic":
+                            # The count API can't apply a score threshold
+                            n_results, n_records = count_similar_results(
+                                client,
+                                COLLECTION_NAME,
+                                limit=max_search_results,
+                                **search_query,
+                            )
+                            capped = n_results >= max_search_results
+                        else:
+                            n_results = count_results(
+                                client,
+                                COLLECTION_NAME,
+                                filter_dict,
+                                start_date,
+                                end_date,
+                                keywords,
+                            )
+                            # Deduplicated points stand for several records
+                            n_records = count_records(
+                                client,
+                                COLLECTION_NAME,
+                                filter_dict,
+                                start_date,
+                                end_date,
+                                keywords,
+                            )
+                            capped = False
+                        timing["n_results"] = n_results
                     logger.info(
-                        f"user_id:{browser_session_id} | session_id:{session_id} | running semantic search for '{search_terms}' returned {len(results)} results"
+                        f"user_id:{browser_session_id} | session_id:{session_id} | running {search_mode} search for '{search_terms}' returned {n_results} results"
                     )
                 except Exception as e:
                     st.error(f"Error running search, try again...: {e}")
@@ -443,16 +547,26 @@ def main():
                 )
                 # Call the filter function
                 try:
-                    with st.spinner("Running search..."):
-                        search_results = filter_search(
-                            client=client,
-                            collection_name=COLLECTION_NAME,
-                            filter_dict=filter_dict,
+                    with st.spinner("Running search..."), span(
+                        "filter_search", logger, browser_session_id, session_id
+                    ) as timing:
+                        # Most recent first, as there is no similarity score
+                        search_query = {
+                            "filter_dict": filter_dict,
+                            "start_date": start_date,
+                            "end_date": end_date,
+                        }
+                        n_results = count_results(
+                            client, COLLECTION_NAME, **search_query
                         )
-                    data, _ = search_results
-                    results = [dict(result) for result in data]
+                        # Deduplicated points stand for several records
+                        n_records = count_records(
+                            client, COLLECTION_NAME, **search_query
+                        )
+                        capped = False
+                        timing["n_results"] = n_results
                     logger.info(
-                        f"user_id | {browser_session_id} | session_id:{session_id} | running filter search with filters {filter_dict} returned {len(results)} results"
+                        f"user_id | {browser_session_id} | session_id:{session_id} | running filter search with filters {filter_dict} returned {n_results} results"
                     )
                 except Exception as e:
                     st.error(f"Error running search, try again...: {e}")
@@ -466,107 +580,93 @@ def main():
                 )
                 st.stop()
 
-            filtered_list = []
-            # Extract and append key-value pairs
-            for result in results:
-                payload = result["payload"]
-                for key in payload:
-                    if key in renaming_dict:
-                        for (
-                            key,
-                            value,
-                        ) in (
-                            renaming_dict.items()
-                        ):  # Check if the key exists in keys_to_extract
-                            result[value] = payload[key]
-
-                result_ordered = {key: result[key] for key in renaming_dict.values()}
-                result_ordered["Similarity score"] = (
-                    result["score"] if "score" in result else float(1)
-                )
-
-                result_ordered["created_date"] = datetime.datetime.strptime(
-                    result_ordered[renaming_dict["created"]], "%Y-%m-%d"
-                ).date()
-
-                # Reformat urgency to human readable
-                inverted_urgency_translate = {
-                    v: k for k, v in urgency_translate.items()
-                }
-                numeric_urgency = str(result_ordered["Urgency"])
-                if numeric_urgency in inverted_urgency_translate:
-                    result_ordered["Urgency"] = inverted_urgency_translate[
-                        numeric_urgency
-                    ]
-
-                # Filter on date and similarity score
-                if (
-                    result_ordered["Similarity score"] > similarity_threshold
-                    and start_date <= result_ordered["created_date"] <= end_date
-                ):
-                    filtered_list.append(result_ordered)
-
-            # Sort descending by similairty score, then date, to get the most similar results first, then the most recent where similarity is the same
-            filtered_sorted_list = sorted(
-                filtered_list,
-                key=lambda d: (d["Similarity score"], d["created_date"]),
-                reverse=True,
+            # Keep the query across reruns, so pages can be fetched on demand
+            st.session_state["search_results"] = {
+                "query": search_query,
+                "n_results": n_results,
+                "n_records": n_records,
+                "capped": capped,
+            }
+            st.session_state["summary"] = None
+            st.session_state["results_page"] = 1
+            # Precomputed themes are shown when browsing by URL or organisation
+            st.session_state["themes"] = (
+                get_themes(theme_index, user_input_pages, org_input)
+                if theme_index is not None and len(search_term_input) == 0
+                else {}
             )
 
             # Topic summary where > n records returned
             if (
                 get_summary
-                and len(filtered_sorted_list) > min_records_for_summarisation
+                and n_records > min_records_for_summarisation
             ):
-                available_feedback_for_context = [
-                    record[renaming_dict["feedback"]] for record in filtered_sorted_list
-                ]
-                # Limit the number of feedback records to summarise, if number exceeds max_context_records
-                num_feedback_for_context = (
-                    len(available_feedback_for_context)
-                    if len(available_feedback_for_context) <= max_context_records
-                    else max_context_records
-                )
-                feedback_for_context = available_feedback_for_context[
-                    :num_feedback_for_context
-                ]
+                # Only the most relevant records can be summarised, so only
+                # fetch their feedback, with vectors to group near-duplicates
+                with span(
+                    "fetch_context", logger, browser_session_id, session_id
+                ) as timing:
+                    # The top k, selected by Qdrant, without ranking the rest
+                    context_results = search_results_page(
+                        client,
+                        COLLECTION_NAME,
+                        limit=max_context_records,
+                        payload_fields=["feedback", "duplicate_count"],
+                        with_vectors=True,
+                        **search_query,
+                    )
+                    timing["n_records"] = len(context_results)
 
                 openai_user_query_id = uuid.uuid4()
-                user_prompt_context = user_prompt.format(feedback_for_context)
-                num_tokens_system_prompt = summariser.get_num_tokens_from_string(
-                    str(system_prompt), openai_model_name
-                )
-                num_tokens_user_prompt = summariser.get_num_tokens_from_string(
-                    str(user_prompt_context), openai_model_name
-                )
-                logger.info(
-                    f"user_id | {browser_session_id} | session_id:{session_id} | OpenAI user_query_id {str(openai_user_query_id)} | Number of tokens total {num_tokens_system_prompt+num_tokens_user_prompt}, with system prompt: {num_tokens_system_prompt} and user prompt: {num_tokens_user_prompt}"
-                )
-                # While the total number of tokens exceeds the token limit, reduce the number of feedback records to summarise
-
-                if (
-                    num_tokens_system_prompt + num_tokens_user_prompt
-                    > context_token_limit
-                ):
-                    st.warning(
-                        f"Too many feedback records to summarise ({num_tokens_system_prompt + num_tokens_user_prompt} tokens) - token limit exceeded. Reducing number of feedback records to summarise..."
+                with span(
+                    "context_selection", logger, browser_session_id, session_id
+                ) as timing:
+                    num_tokens_system_prompt = summariser.get_num_tokens_from_string(
+                        str(system_prompt), openai_model_name
                     )
-                while (
-                    num_tokens_system_prompt + num_tokens_user_prompt
-                    > context_token_limit
-                ):
-                    logger.info(
-                        f"user_id | {browser_session_id} | session_id:{session_id} | OpenAI user_query_id {str(openai_user_query_id)} | Token limit {context_token_limit} exceeded: {num_tokens_system_prompt + num_tokens_user_prompt} tokens. Reducing number of feedback records to summarise..."
+                    num_tokens_prompt_template = summariser.get_num_tokens_from_string(
+                        clustered_user_prompt.format(""), openai_model_name
+                    )
+                    context_weights = [
+                        result["payload"].get("duplicate_count", 1)
+                        for result in context_results
+                    ]
+                    # Pick one record per group of near-identical feedback,
+                    # largest groups first, within the token limit
+                    selected_context = select_context(
+                        [result["payload"]["feedback"] for result in context_results],
+                        np.array([result["vector"] for result in context_results]),
+                        lambda text: summariser.get_num_tokens_from_string(
+                            text, openai_model_name
+                        ),
+                        token_budget=context_token_limit
+                        - num_tokens_system_prompt
+                        - num_tokens_prompt_template,
+                        similarity_threshold=context_similarity_threshold,
+                        weights=context_weights,
                     )
-                    # Reduce number of feedback records to summarise
-                    num_feedback_for_context = round(num_feedback_for_context * 0.8)
-                    feedback_for_context = available_feedback_for_context[
-                        :num_feedback_for_context
+                    feedback_for_context = [
+                        format_context_record(record["feedback"], record["count"])
+                        for record in selected_context
                     ]
-                    user_prompt_context = user_prompt.format(feedback_for_context)
+                    n_records_for_context = sum(
+                        record["count"] for record in selected_context
+                    )
+                    user_prompt_context = clustered_user_prompt.format(
+                        feedback_for_context
+                    )
                     num_tokens_user_prompt = summariser.get_num_tokens_from_string(
                         str(user_prompt_context), openai_model_name
                     )
+                    logger.info(
+                        f"user_id | {browser_session_id} | session_id:{session_id} | OpenAI user_query_id {str(openai_user_query_id)} | Number of tokens total {num_tokens_system_prompt+num_tokens_user_prompt}, with system prompt: {num_tokens_system_prompt} and user prompt: {num_tokens_user_prompt}"
+                    )
+                    if n_records_for_context < sum(context_weights):
+                        st.warning(
+                            f"Too many feedback records to summarise - token limit exceeded. Summarising {n_records_for_context} of {sum(context_weights)} records..."
+                        )
+                    timing["n_records"] = n_records_for_context
+                    timing["n_groups"] = len(selected_context)
 
                 prompt_tokens = num_tokens_system_prompt + num_tokens_user_prompt
                 summary = None
@@ -574,31 +674,48 @@ def main():
                     if stream:
                         try:
                             st.subheader(
-                                f"Top themes based on {len(feedback_for_context)} most relevant records of user feedback"
+                                f"Top themes based on {n_records_for_context} most relevant records of user feedback"
                             )
                             st.write(
                                 "Identified and summarised by AI technology. Please verify the outputs with other data sources to ensure accuracy of information."
                             )
-                            st.write_stream(
-                                summariser.create_openai_summary_stream(
-                                    system_prompt=system_prompt,
-                                    user_prompt=user_prompt_context,
+                            summary_text = st.write_stream(
+                                time_stream(
+                                    summariser.create_openai_summary_stream(
+                                        system_prompt=system_prompt,
+                                        user_prompt=user_prompt_context,
+                                    ),
+                                    "openai_summary",
+                                    logger,
+                                    browser_session_id,
+                                    session_id,
                                 )
                             )
                             status = "success"
                             summary = "STREAMING"
+                            st.session_state["summary"] = {
+                                "n_records": n_records_for_context,
+                                "text": summary_text,
+                            }
                         except Exception as e:
                             status = f"error: OpenAI request failed: {e}"
                             st.error(f"An error occurred: {status}")
                     else:
-                        completion, status = summariser.create_openai_summary(
-                            system_prompt=system_prompt,
-                            user_prompt=user_prompt_context,
-                        )
+                        with span(
+                            "openai_summary", logger, browser_session_id, session_id
+                        ):
+                            completion, status = summariser.create_openai_summary(
+                                system_prompt=system_prompt,
+                                user_prompt=user_prompt_context,
+                            )
                         if status == "success":
                             # Display the summary in your Streamlit app
                             st.write(completion)
                             summary = completion
+                            st.session_state["summary"] = {
+                                "n_records": n_records_for_context,
+                                "text": completion,
+                            }
                         else:
                             st.error(f"An error occurred: {status}")
 
@@ -609,12 +726,12 @@ def main():
                         f"user_id | {browser_session_id} | session_id:{session_id} | OpenAI user_query_id {str(openai_user_query_id)} | OpenAI summary: {str(summary)}"
                     )
                     logger.info(
-                        f"user_id | {browser_session_id} | session_id:{session_id} | OpenAI user_query_id {str(openai_user_query_id)} | OpenAI summary generated on {str(len(feedback_for_context))} feedback records with model {openai_model_name}, {str(prompt_tokens)} prompt tokens and {str(sum(summariser.completion_tokens))} completion tokens"
+                        f"user_id | {browser_session_id} | session_id:{session_id} | OpenAI user_query_id {str(openai_user_query_id)} | OpenAI summary generated on {str(n_records_for_context)} feedback records in {str(len(feedback_for_context))} groups with model {openai_model_name}, {str(prompt_tokens)} prompt tokens and {str(sum(summariser.completion_tokens))} completion tokens"
                     )
                 st.text("")
             elif (
                 get_summary
-                and len(filtered_sorted_list) <= min_records_for_summarisation
+                and n_records <= min_records_for_summarisation
             ):
                 st.write(
                     "There's not enough feedback matching your search criteria to identify top themes.\n\
@@ -622,7 +739,7 @@ def main():
                 )
             elif (
                 not get_summary
-                and len(filtered_sorted_list) > min_records_for_summarisation
+                and n_records > min_records_for_summarisation
             ):
                 st.write(
                     "No summary requested. Check box to get an AI-generated summary of relevant feedback."
@@ -631,18 +748,90 @@ def main():
                 st.write(
                     "No summary requested. Insufficient feedback records for summarisation."
                 )
+
+        if "search_results" in st.session_state:
+            search_results = st.session_state["search_results"]
+            summary = st.session_state.get("summary")
+            # Show the last summary again when paging through results
+            if not search_button and summary:
+                st.subheader(
+                    f"Top themes based on {summary['n_records']} most relevant records of user feedback"
+                )
+                st.write(
+                    "Identified and summarised by AI technology. Please verify the outputs with other data sources to ensure accuracy of information."
+                )
+                st.write(summary["text"])
+                st.text("")
+
+            themes = st.session_state.get("themes")
+            if themes:
+                st.subheader("Themes in all feedback on these pages and organisations")
+                st.write(
+                    "Precomputed by clustering all feedback, so not limited to the date range or filters above."
+                )
+                for group, group_themes in themes.items():
+                    with st.expander(f"{group}: {len(group_themes)} themes"):
+                        examples = fetch_results_page(
+                            client,
+                            COLLECTION_NAME,
+                            [theme["representative_ids"][0] for theme in group_themes],
+                            [1.0] * len(group_themes),
+                            payload_fields=["feedback"],
+                        )
+                        example_feedback = {
+                            result["id"]: result["payload"].get("feedback")
+                            for result in examples
+                        }
+                        total = sum(theme["size"] for theme in group_themes)
+                        st.dataframe(
+                            [
+                                {
+                                    "Keywords": ", ".join(theme["keywords"]),
+                                    "Records": theme["size"],
+                                    "Share": f"{theme['size'] / total:.0%}",
+                                    "Example feedback": example_feedback.get(
+                                        theme["representative_ids"][0]
+                                    ),
+                                }
+                                for theme in group_themes
+                            ],
+                            use_container_width=True,
+                        )
+
+            n_results = search_results["n_results"]
+            n_records = search_results["n_records"]
+            # Semantic searches are only counted up to max_search_results
+            at_least = "At least " if search_results["capped"] else ""
             st.subheader(
-                f"{len(filtered_sorted_list)} user feedback comments based on your search criteria"
+                f"{at_least}{n_records} user feedback comments based on your search criteria"
             )
+            if n_records != n_results:
+                st.write(
+                    f"Near-identical comments are grouped, so {n_results} are listed. The number of similar comments grouped into each is shown."
+                )
 
-            # remove created_date from the dictionary, as duplicated with date
-            for d in filtered_sorted_list:
-                d.pop("created_date", None)
-                # Reformat similarity score as percentage, to no decimal places
-                d["Similarity score"] = f"{d['Similarity score']*100:.0f}%"
-            # Write out the data
+            # Only fetch and render one page of results at a time
+            n_pages = max(1, -(-n_results // results_page_size))
+            page = st.number_input(
+                f"Page (of {n_pages})",
+                min_value=1,
+                max_value=n_pages,
+                step=1,
+                key="results_page",
+            )
+            start = (page - 1) * results_page_size
+            with span("fetch_page", logger, browser_session_id, session_id) as timing:
+                page_results = search_results_page(
+                    client,
+                    COLLECTION_NAME,
+                    offset=start,
+                    limit=results_page_size,
+                    payload_fields=list(renaming_dict.keys()) + ["duplicate_count"],
+                    **search_results["query"],
+                )
+                timing["n_results"] = len(page_results)
             st.dataframe(
-                filtered_sorted_list,
+                format_results_for_display(results_to_dataframe(page_results)),
                 column_config={
                     "Date": st.column_config.DateColumn(
                         "Date",
@@ -650,6 +839,40 @@ def main():
                     ),
                 },
             )
+
+            # Comments grouped into a result, kept in the duplicates collection
+            grouped_results = {
+                result["id"]: result["payload"].get("feedback") or ""
+                for result in page_results
+                if (result["payload"] or {}).get("duplicate_count", 1) > 1
+            }
+            if grouped_results:
+                selected_id = st.selectbox(
+                    "Show the similar comments grouped into a result",
+                    options=[None] + list(grouped_results),
+                    format_func=lambda point_id: (
+                        "" if point_id is None else grouped_results[point_id][:100]
+                    ),
+                    key="grouped_result",
+                )
+                if selected_id is not None:
+                    members = get_duplicate_members(
+                        client,
+                        COLLECTION_NAME,
+                        selected_id,
+                        payload_fields=list(renaming_dict.keys()),
+                    )
+                    st.dataframe(
+                        results_to_dataframe(
+                            [{"payload": member.payload} for member in members]
+                        ).drop(columns=[SCORE_COLUMN, DATE_COLUMN]),
+                        column_config={
+                            "Date": st.column_config.DateColumn(
+                                "Date",
+                                format="DD/MM/YYYY",
+                            ),
+                        },
+                    )
     elif st.session_state["authentication_status"] is False:
         st.error("Username/password is incorrect")
     elif st.session_state["authentication_status"] is None:
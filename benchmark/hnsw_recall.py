@@ -0,0 +1,201 @@
+from src.collection_utils.local_search import LocalSearchClient, export_collection
+from src.collection_utils.search_benchmark import (
+    create_benchmark_collection,
+    generate_synthetic_workload,
+    hash_query_embedding,
+    measure_recall,
+    parse_query_log,
+    summarise_recall,
+)
+from src.utils.utils import load_qdrant_client
+
+from dotenv import load_dotenv
+import argparse
+import os
+
+import pandas as pd
+
+load_dotenv()
+
+HF_MODEL_NAME = os.getenv("HF_MODEL_NAME")
+BENCHMARK_COLLECTION_NAME = "search_benchmark"
+
+
+def main(
+    log_files: list[str] = None,
+    n_queries: int = 200,
+    k: list[int] = None,
+    hnsw_ef: list[int] = None,
+    qdrant_host: str = "localhost",
+    qdrant_port: int = 6333,
+    collection_name: str = BENCHMARK_COLLECTION_NAME,
+    n_points: int = 10000,
+    local_path: str = "data/local_collections",
+    reexport: bool = False,
+    use_model: bool = False,
+    output_path: str = None,
+):
+    """
+    Measure the recall of Qdrant's HNSW search against an exact, in-process
+    search of the same collection, per filter combination
+
+    Args:
+        log_files (list[str], optional): app log files to replay. A synthetic
+            workload is generated if none are given.
+        n_queries (int): number of queries in a synthetic workload
+        k (list[int], optional): numbers of results to compare. Defaults to
+            [10, 100].
+        hnsw_ef (list[int], optional): HNSW search beam sizes to try. None
+            uses the collection's setting. Defaults to [None].
+        qdrant_host (str): Qdrant server host, e.g. the docker-compose
+            service on localhost. Local mode (":memory:") searches by brute
+            force, without an HNSW index, so is refused.
+        qdrant_port (int): Qdrant port
+        collection_name (str): collection to search. The benchmark collection
+            of random points is created if it doesn't exist.
+        n_points (int): points in the benchmark collection, if it is created
+        local_path (str): directory of local collections
+        reexport (bool): export the collection even if a local copy exists
+        use_model (bool): encode search terms with the encoder model, rather
+            than hashing them to random vectors
+        output_path (str): csv file to write the summaries to
+    """
+    if qdrant_host == ":memory:":
+        raise ValueError(
+            "Qdrant's local mode has no HNSW index, so its recall is always 1. "
+            "Measure recall against a Qdrant server."
+        )
+    k = k or [10, 100]
+    hnsw_ef = hnsw_ef or [None]
+
+    if log_files:
+        workload = []
+        for log_file in log_files:
+            with open(log_file, "r", encoding="utf-8") as f:
+                workload.extend(parse_query_log(f))
+        print(f"Loaded {len(workload)} queries from {len(log_files)} log files")
+    else:
+        workload = generate_synthetic_workload(n_queries, filter_search_share=0)
+        print(f"Generated a synthetic workload of {len(workload)} queries")
+
+    client = load_qdrant_client(qdrant_host, port=qdrant_port)
+    created = not client.collection_exists(collection_name)
+    if created:
+        create_benchmark_collection(client, collection_name, n_points)
+
+    # Segments not yet indexed are searched exactly, which overstates recall
+    collection_info = client.get_collection(collection_name)
+    if (collection_info.indexed_vectors_count or 0) < (
+        collection_info.points_count or 0
+    ):
+        print(
+            f"Warning: only {collection_info.indexed_vectors_count} of "
+            f"{collection_info.points_count} points are in the HNSW index. The "
+            "rest are searched exactly, so recall is overstated. Wait for "
+            "indexing to finish, or use more points than the indexing threshold."
+        )
+
+    # A newly created collection is always exported
+    local_client = LocalSearchClient(local_path)
+    if reexport or created or not local_client.collection_exists(collection_name):
+        export_collection(
+            client, collection_name, os.path.join(local_path, collection_name)
+        )
+
+    size = local_client.get_collection(collection_name).meta["size"]
+    if use_model:
+        from src.utils.utils import load_model
+
+        model = load_model(HF_MODEL_NAME)
+        query_embeddings = model.encode(
+            [query["search_terms"] for query in workload]
+        ).tolist()
+    else:
+        query_embeddings = [
+            hash_query_embedding(query["search_terms"], size=size) for query in workload
+        ]
+
+    summaries = []
+    for n_results in k:
+        for ef in hnsw_ef:
+            print(f"Measuring recall at {n_results} with hnsw_ef {ef} ...")
+            results = measure_recall(
+                client,
+                local_client,
+                collection_name,
+                workload,
+                query_embeddings,
+                k=n_results,
+                hnsw_ef=ef,
+            )
+            for summary in summarise_recall(results):
+                summaries.append({"k": n_results, "hnsw_ef": ef, **summary})
+
+    summary_df = pd.DataFrame(summaries)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(summary_df.round(3).to_string(index=False))
+
+    if output_path:
+        summary_df.to_csv(output_path, index=False)
+        print(f"Recall summary saved to {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure HNSW recall against an exact in-process search"
+    )
+    parser.add_argument(
+        "--log_files",
+        nargs="*",
+        default=[],
+        help="App log files to replay. Defaults to a synthetic workload.",
+    )
+    parser.add_argument("--n_queries", type=int, default=200)
+    parser.add_argument("--k", type=int, nargs="+", default=[10, 100])
+    parser.add_argument(
+        "--hnsw_ef",
+        type=int,
+        nargs="+",
+        default=[None],
+        help="HNSW search beam sizes. Defaults to the collection's setting.",
+    )
+    parser.add_argument(
+        "--qdrant_host",
+        type=str,
+        default="localhost",
+        help="Qdrant server host. Defaults to localhost, the docker-compose service.",
+    )
+    parser.add_argument("--qdrant_port", type=int, default=6333)
+    parser.add_argument(
+        "--collection_name", type=str, default=BENCHMARK_COLLECTION_NAME
+    )
+    parser.add_argument(
+        "--n_points",
+        type=int,
+        default=10000,
+        help="Points in the benchmark collection, if it is created.",
+    )
+    parser.add_argument("--local_path", type=str, default="data/local_collections")
+    parser.add_argument(
+        "--reexport",
+        action="store_true",
+        default=False,
+        help="Export the collection again, even if a local copy exists.",
+    )
+    parser.add_argument("--use_model", action="store_true", default=False)
+    parser.add_argument("--output_path", type=str, default=None)
+    args = parser.parse_args()
+    main(
+        log_files=args.log_files,
+        n_queries=args.n_queries,
+        k=args.k,
+        hnsw_ef=args.hnsw_ef,
+        qdrant_host=args.qdrant_host,
+        qdrant_port=args.qdrant_port,
+        collection_name=args.collection_name,
+        n_points=args.n_points,
+        local_path=args.local_path,
+        reexport=args.reexport,
+        use_model=args.use_model,
+        output_path=args.output_path,
+    )
@@ -0,0 +1,187 @@
+from src.collection_utils.search_benchmark import (
+    DEFAULT_FILTER_VALUES,
+    create_benchmark_collection,
+    generate_synthetic_workload,
+    hash_query_embedding,
+    parse_query_log,
+    run_workload,
+    summarise_results,
+)
+from src.utils.utils import load_qdrant_client
+
+from dotenv import load_dotenv
+import argparse
+import json
+import os
+
+import pandas as pd
+
+load_dotenv()
+
+HF_MODEL_NAME = os.getenv("HF_MODEL_NAME")
+BENCHMARK_COLLECTION_NAME = "search_benchmark"
+
+
+def load_filter_values(filter_options_path: str) -> dict:
+    """
+    Build the filter values for a synthetic workload from the app's filter
+    options json, falling back to DEFAULT_FILTER_VALUES
+
+    Args:
+        filter_options_path (str): path to the filter options json, or None
+
+    Returns:
+        dict: filter key to the values it can take
+    """
+    if not filter_options_path or not os.path.exists(filter_options_path):
+        return DEFAULT_FILTER_VALUES
+    with open(filter_options_path, "r") as f:
+        filter_options = json.load(f)
+    filter_values = dict(DEFAULT_FILTER_VALUES)
+    filter_values["url"] = filter_options["subject_page_path"]
+    filter_values["primary_department"] = filter_options["organisation"]
+    filter_values["document_type"] = filter_options["document_type"]
+    return filter_values
+
+
+def main(
+    log_files: list[str] = None,
+    n_queries: int = 200,
+    concurrency: list[int] = None,
+    score_threshold: float = 0.5,
+    qdrant_host: str = "localhost",
+    qdrant_port: int = 6333,
+    collection_name: str = BENCHMARK_COLLECTION_NAME,
+    n_points: int = 10000,
+    filter_options_path: str = None,
+    use_model: bool = False,
+    output_path: str = None,
+):
+    """
+    Replay a query workload against a Qdrant collection and report latency
+    percentiles, throughput and result sizes per filter combination
+
+    Args:
+        log_files (list[str], optional): app log files to replay. A synthetic
+            workload is generated if none are given.
+        n_queries (int): number of queries in a synthetic workload
+        concurrency (list[int], optional): concurrency levels to run the
+            workload at. Defaults to [1, 4, 16].
+        score_threshold (float): the minimum score for semantic searches
+        qdrant_host (str): Qdrant server host, e.g. the docker-compose service
+            on localhost. Local mode (":memory:") runs searches in this Python
+            process, without HNSW or payload indexes, so is refused.
+        qdrant_port (int): Qdrant port
+        collection_name (str): collection to search
+        n_points (int): points in the benchmark collection, if it is created
+        filter_options_path (str): filter options json for synthetic queries
+            and points
+        use_model (bool): encode search terms with the encoder model, rather
+            than hashing them to random vectors
+        output_path (str): csv file to write the summaries to
+    """
+    if qdrant_host == ":memory:":
+        raise ValueError(
+            "Qdrant's local mode searches in this Python process, without HNSW "
+            "or payload indexes, so its latencies don't reflect a server. "
+            "Benchmark against a Qdrant server."
+        )
+    concurrency = concurrency or [1, 4, 16]
+    filter_values = load_filter_values(filter_options_path)
+
+    if log_files:
+        workload = []
+        for log_file in log_files:
+            with open(log_file, "r", encoding="utf-8") as f:
+                workload.extend(parse_query_log(f))
+        print(f"Loaded {len(workload)} queries from {len(log_files)} log files")
+    else:
+        workload = generate_synthetic_workload(n_queries, filter_values)
+        print(f"Generated a synthetic workload of {len(workload)} queries")
+
+    client = load_qdrant_client(qdrant_host, port=qdrant_port)
+    if not client.collection_exists(collection_name):
+        create_benchmark_collection(client, collection_name, n_points, filter_values)
+
+    # Encode search terms up front, so only search time is measured
+    if use_model:
+        from src.utils.utils import load_model
+
+        model = load_model(HF_MODEL_NAME)
+        query_embeddings = model.encode(
+            [query["search_terms"] for query in workload]
+        ).tolist()
+    else:
+        query_embeddings = [
+            hash_query_embedding(query["search_terms"]) for query in workload
+        ]
+
+    summaries = []
+    for n_concurrent in concurrency:
+        print(f"Running {len(workload)} queries with concurrency {n_concurrent} ...")
+        results, wall_time = run_workload(
+            client,
+            collection_name,
+            workload,
+            query_embeddings,
+            score_threshold=score_threshold,
+            concurrency=n_concurrent,
+        )
+        for summary in summarise_results(results, wall_time):
+            summaries.append({"concurrency": n_concurrent, **summary})
+
+    summary_df = pd.DataFrame(summaries)
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(summary_df.round(2).to_string(index=False))
+
+    if output_path:
+        summary_df.to_csv(output_path, index=False)
+        print(f"Benchmark summary saved to {output_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark search latency by replaying a query workload"
+    )
+    parser.add_argument(
+        "--log_files",
+        nargs="*",
+        default=[],
+        help="App log files to replay. Defaults to a synthetic workload.",
+    )
+    parser.add_argument("--n_queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--score_threshold", type=float, default=0.5)
+    parser.add_argument(
+        "--qdrant_host",
+        type=str,
+        default="localhost",
+        help="Qdrant server host. Defaults to localhost, the docker-compose service.",
+    )
+    parser.add_argument("--qdrant_port", type=int, default=6333)
+    parser.add_argument(
+        "--collection_name", type=str, default=BENCHMARK_COLLECTION_NAME
+    )
+    parser.add_argument(
+        "--n_points",
+        type=int,
+        default=10000,
+        help="Points in the benchmark collection, if it is created.",
+    )
+    parser.add_argument("--filter_options_path", type=str, default=None)
+    parser.add_argument("--use_model", action="store_true", default=False)
+    parser.add_argument("--output_path", type=str, default=None)
+    args = parser.parse_args()
+    main(
+        log_files=args.log_files,
+        n_queries=args.n_queries,
+        concurrency=args.concurrency,
+        score_threshold=args.score_threshold,
+        qdrant_host=args.qdrant_host,
+        qdrant_port=args.qdrant_port,
+        collection_name=args.collection_name,
+        n_points=args.n_points,
+        filter_options_path=args.filter_options_path,
+        use_model=args.use_model,
+        output_path=args.output_path,
+    )
@@ -0,0 +1,132 @@
+from src.collection_utils.query_collection import get_semantically_similar_results
+from src.collection_utils.search_benchmark import hash_query_embedding
+from src.collection_utils.set_collection import (
+    create_collection,
+    create_vectors_from_data,
+)
+from src.utils.synthetic_data import FEEDBACK_SCHEMA, generate_feedback_batches
+from src.utils.utils import load_qdrant_client
+
+from dotenv import load_dotenv
+from qdrant_client.http.models import Distance
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+load_dotenv()
+
+QDRANT_HOST = os.getenv("QDRANT_HOST", "localhost")
+QDRANT_PORT = os.getenv("QDRANT_PORT", 6333)
+QDRANT_GRPC_PORT = os.getenv("QDRANT_GRPC_PORT", 6334)
+
+
+def benchmark_transport(
+    prefer_grpc: bool,
+    n_points: int,
+    batch_size: int,
+    n_searches: int,
+    score_threshold: float,
+) -> dict:
+    """
+    Time upserts and large-result searches over one transport
+
+    Args:
+        prefer_grpc (bool): Use gRPC rather than HTTP.
+        n_points (int): Number of synthetic points to upsert.
+        batch_size (int): Points per upsert request.
+        n_searches (int): Number of searches to time.
+        score_threshold (float): Minimum score, low enough to return many results.
+
+    Returns:
+        dict: throughput and latency results
+    """
+    transport = "grpc" if prefer_grpc else "http"
+    collection_name = f"transport_benchmark_{transport}"
+    client = load_qdrant_client(
+        QDRANT_HOST,
+        port=QDRANT_PORT,
+        prefer_grpc=prefer_grpc,
+        grpc_port=int(QDRANT_GRPC_PORT),
+    )
+    create_collection(
+        client, collection_name, size=768, distance_metric=Distance.COSINE
+    )
+
+    # Only time the upsert requests, not generating and converting the points
+    upsert_time = 0.0
+    for batch in generate_feedback_batches(n_points, batch_size=batch_size):
+        points = create_vectors_from_data(
+            batch.to_pylist(), id_key="feedback_record_id", embedding_key="embeddings"
+        )
+        start = time.perf_counter()
+        client.upsert(collection_name=collection_name, points=points, wait=True)
+        upsert_time += time.perf_counter() - start
+
+    latencies = []
+    n_results = []
+    for idx in range(n_searches):
+        start = time.perf_counter()
+        results = get_semantically_similar_results(
+            client,
+            collection_name,
+            hash_query_embedding(f"query {idx}"),
+            score_threshold,
+        )
+        latencies.append(time.perf_counter() - start)
+        n_results.append(len(results))
+
+    client.delete_collection(collection_name)
+    p50, p95 = np.percentile(np.array(latencies) * 1000, [50, 95])
+    return {
+        "transport": transport,
+        "upsert_points_per_s": n_points / upsert_time,
+        "search_p50_ms": p50,
+        "search_p95_ms": p95,
+        "mean_results": np.mean(n_results),
+    }
+
+
+def main(
+    n_points: int = 50000,
+    batch_size: int = 500,
+    n_searches: int = 20,
+    score_threshold: float = -1.0,
+):
+    """
+    Compare upsert throughput and large-result search latency over HTTP and
+    gRPC, against a running Qdrant (e.g. from docker-compose)
+
+    Args:
+        n_points (int): Number of synthetic points to upsert.
+        batch_size (int): Points per upsert request.
+        n_searches (int): Number of searches to time.
+        score_threshold (float): Minimum score. Defaults to -1, returning every point.
+    """
+    print(f"Benchmarking {len(FEEDBACK_SCHEMA)}-field payloads on {QDRANT_HOST}...")
+    summaries = [
+        benchmark_transport(
+            prefer_grpc, n_points, batch_size, n_searches, score_threshold
+        )
+        for prefer_grpc in [False, True]
+    ]
+    print(pd.DataFrame(summaries).round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare Qdrant HTTP and gRPC transports"
+    )
+    parser.add_argument("--n_points", type=int, default=50000)
+    parser.add_argument("--batch_size", type=int, default=500)
+    parser.add_argument("--n_searches", type=int, default=20)
+    parser.add_argument("--score_threshold", type=float, default=-1.0)
+    args = parser.parse_args()
+    main(
+        n_points=args.n_points,
+        batch_size=args.batch_size,
+        n_searches=args.n_searches,
+        score_threshold=args.score_threshold,
+    )
@@ -0,0 +1,73 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+
+from src.collection_utils.theme_index import (
+    build_theme_index,
+    save_theme_index,
+    scroll_collection,
+)
+from src.utils.utils import load_qdrant_client
+
+load_dotenv()
+
+COLLECTION_NAME = os.getenv("COLLECTION_NAME")
+QDRANT_HOST = os.getenv("QDRANT_HOST")
+QDRANT_PORT = os.getenv("QDRANT_PORT")
+
+parser = argparse.ArgumentParser(
+    description="Precompute feedback themes per url prefix and organisation"
+)
+parser.add_argument(
+    "--collection_name",
+    type=str,
+    default=COLLECTION_NAME,
+    help="Collection to cluster. Defaults to COLLECTION_NAME.",
+)
+parser.add_argument(
+    "--output_path",
+    type=str,
+    default="data/theme_index.json",
+    help="JSON file to write the index to. Defaults to data/theme_index.json.",
+)
+parser.add_argument(
+    "--url_depth",
+    type=int,
+    default=1,
+    help="Path segments in a url prefix, e.g. 1 for /browse. Defaults to 1.",
+)
+parser.add_argument(
+    "--min_group_size",
+    type=int,
+    default=20,
+    help="Smallest url prefix or organisation to find themes for. Defaults to 20.",
+)
+parser.add_argument(
+    "--max_clusters",
+    type=int,
+    default=20,
+    help="Most themes per url prefix or organisation. Defaults to 20.",
+)
+parser.add_argument("--seed", type=int, default=0)
+args = parser.parse_args()
+
+client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
+
+print(f"Reading points from {args.collection_name}...")
+ids, vectors, payloads = scroll_collection(
+    client,
+    args.collection_name,
+    payload_fields=["url", "primary_department", "feedback"],
+)
+
+index = build_theme_index(
+    ids,
+    vectors,
+    payloads,
+    url_depth=args.url_depth,
+    min_group_size=args.min_group_size,
+    max_clusters=args.max_clusters,
+    seed=args.seed,
+)
+save_theme_index(index, args.output_path)
@@ -2,10 +2,16 @@ import os
 from dotenv import load_dotenv
 import argparse
 
-from qdrant_client.http.models import Distance
+from qdrant_client.http.models import Distance, PayloadSchemaType
 
+from src.collection_utils.deduplicate import (
+    deduplicate_records,
+    duplicates_collection_name,
+)
 from src.collection_utils.set_collection import (
+    PAYLOAD_INDEXES,
     create_collection,
+    create_payload_indexes,
     create_vectors_from_data,
     upsert_to_collection_from_vectors,
     restore_collection_from_snapshot,
@@ -53,6 +59,23 @@ parser.add_argument(
     help="Set to True to enable restoring from a snapshot. Defaults to False.",
 )
 
+# Add arg for collapsing near-duplicate feedback
+parser.add_argument(
+    "--dedup",
+    action="store_true",
+    default=False,
+    dest="dedup",
+    help="Set to True to store one point per cluster of near-duplicate feedback in the main collection, with the duplicates in a companion collection. Defaults to False.",
+)
+
+parser.add_argument(
+    "--dedup-threshold",
+    type=float,
+    default=0.97,
+    dest="dedup_threshold",
+    help="Cosine similarity at which feedback counts as a near-duplicate. Defaults to 0.97.",
+)
+
 args = parser.parse_args()
 
 client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
@@ -74,6 +97,9 @@ else:
 
 for name, query in collections:
     print(f"Running for collection {name}...")
+    # Only the main collection is deduplicated. The evaluation ground truth
+    # includes every labelled record, so they must all stay searchable.
+    dedup = args.dedup and name == COLLECTION_NAME
     if args.restore_from_snapshot:
         print("Attempting to restore from snapshot...")
         operation = restore_collection_from_snapshot(
@@ -83,6 +109,17 @@ for name, query in collections:
             distance_metric,
         )
         print(f"Restore from snapshot: {operation['success']}, {operation['message']}")
+        # The representatives need their duplicates, so restore both or neither
+        if dedup and operation["success"]:
+            operation = restore_collection_from_snapshot(
+                client,
+                duplicates_collection_name(name),
+                size,
+                distance_metric,
+            )
+            print(
+                f"Restore duplicates from snapshot: {operation['success']}, {operation['message']}"
+            )
         print(f"Collections available: {client.get_collections()}")
     else:
         operation = {"success": False}
@@ -99,6 +136,38 @@ for name, query in collections:
             query,
         )
 
+        if dedup:
+            docs, duplicates = deduplicate_records(
+                docs,
+                id_key="feedback_record_id",
+                embedding_key="embeddings",
+                threshold=args.dedup_threshold,
+            )
+            duplicates_name = duplicates_collection_name(name)
+            print(
+                f"Creating collection {duplicates_name} with {len(duplicates)} duplicates..."
+            )
+            create_collection(
+                client, duplicates_name, size=size, distance_metric=distance_metric
+            )
+            upsert_to_collection_from_vectors(
+                client,
+                duplicates_name,
+                data=create_vectors_from_data(
+                    duplicates, id_key="feedback_record_id", embedding_key="embeddings"
+                ),
+            )
+            # Indexed like the main collection, as record counts filter it too
+            create_payload_indexes(
+                client,
+                duplicates_name,
+                payload_indexes={
+                    **PAYLOAD_INDEXES,
+                    "duplicate_of": PayloadSchemaType.INTEGER,
+                },
+            )
+            client.create_snapshot(collection_name=duplicates_name, wait=True)
+
         print(f"Creating collection {name} with {len(docs)} documents...")
         create_collection(client, name, size=size, distance_metric=distance_metric)
 
@@ -107,6 +176,7 @@ for name, query in collections:
             docs, id_key="feedback_record_id", embedding_key="embeddings"
         )
         upsert_to_collection_from_vectors(client, name, data=points_to_upsert)
+        create_payload_indexes(client, name)
         print(
             f"Collection {name} created and upserted with {len(points_to_upsert)} points"
         )
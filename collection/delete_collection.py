@@ -1,7 +1,8 @@
 import os
 
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
+
+from src.utils.utils import load_qdrant_client
 
 load_dotenv()
 QDRANT_HOST = os.getenv("QDRANT_HOST")
@@ -9,7 +10,7 @@ QDRANT_PORT = os.getenv("QDRANT_PORT")
 COLLECTION_NAME = os.getenv("COLLECTION_NAME")
 EVAL_COLLECTION_NAME = os.getenv("EVAL_COLLECTION_NAME")
 
-client = QdrantClient(QDRANT_HOST, port=QDRANT_PORT)
+client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
 
 collections = [COLLECTION_NAME, EVAL_COLLECTION_NAME]
 
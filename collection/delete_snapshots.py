@@ -1,6 +1,7 @@
 import os
 from dotenv import load_dotenv
 
+from src.collection_utils.deduplicate import duplicates_collection_name
 from src.collection_utils.set_collection import get_latest_snapshot_location
 from src.utils.utils import load_qdrant_client
 
@@ -12,7 +13,11 @@ QDRANT_PORT = os.getenv("QDRANT_PORT")
 
 client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
 
-for name in [COLLECTION_NAME, EVAL_COLLECTION_NAME]:
+for name in [
+    COLLECTION_NAME,
+    duplicates_collection_name(COLLECTION_NAME),
+    EVAL_COLLECTION_NAME,
+]:
     try:
         snapshots = client.list_snapshots(name)
         print(f"{len(snapshots)} snapshots found for collection {name}")
@@ -0,0 +1,77 @@
+import argparse
+import os
+
+from dotenv import load_dotenv
+from qdrant_client.http.models import Distance
+
+from src.collection_utils.set_collection import (
+    create_collection,
+    create_payload_indexes,
+    create_vectors_from_data,
+    upsert_to_collection_from_vectors,
+)
+from src.utils.synthetic_data import read_feedback_batches, write_synthetic_feedback
+from src.utils.utils import load_qdrant_client
+
+load_dotenv()
+
+QDRANT_HOST = os.getenv("QDRANT_HOST")
+QDRANT_PORT = os.getenv("QDRANT_PORT")
+
+# Qdrant args
+size = 768
+distance_metric = Distance.COSINE
+
+parser = argparse.ArgumentParser(
+    description="Generate synthetic feedback records with the query_all_feedback schema"
+)
+parser.add_argument(
+    "--n_rows",
+    type=int,
+    default=100000,
+    help="Number of records to generate. Defaults to 100000.",
+)
+parser.add_argument(
+    "--output_path",
+    type=str,
+    default="data/synthetic_feedback.parquet",
+    help="Parquet file to write. Defaults to data/synthetic_feedback.parquet.",
+)
+parser.add_argument(
+    "--batch_size",
+    type=int,
+    default=20000,
+    help="Records generated, written and upserted at a time. Defaults to 20000.",
+)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument(
+    "--collection_name",
+    type=str,
+    default=None,
+    help="If set, (re)create this Qdrant collection and upsert the records to it.",
+)
+args = parser.parse_args()
+
+output_dir = os.path.dirname(args.output_path)
+if output_dir:
+    os.makedirs(output_dir, exist_ok=True)
+
+print(f"Generating {args.n_rows} synthetic records to {args.output_path}...")
+write_synthetic_feedback(
+    args.output_path, args.n_rows, batch_size=args.batch_size, seed=args.seed
+)
+
+if args.collection_name:
+    client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
+    create_collection(
+        client, args.collection_name, size=size, distance_metric=distance_metric
+    )
+    for docs in read_feedback_batches(args.output_path, batch_size=args.batch_size):
+        points_to_upsert = create_vectors_from_data(
+            docs, id_key="feedback_record_id", embedding_key="embeddings"
+        )
+        upsert_to_collection_from_vectors(
+            client, args.collection_name, data=points_to_upsert
+        )
+    create_payload_indexes(client, args.collection_name)
+    print(f"Collection {args.collection_name} upserted with {args.n_rows} points")
@@ -1,15 +1,20 @@
 from dotenv import load_dotenv
 import os
-import pickle
+import numpy as np
 import streamlit as st
 import subprocess
 import plotly.graph_objs as go
 from src.collection_utils.evaluate_collection import (
-    create_precision_boxplot_data,
-    create_recall_boxplot_data,
-    create_precision_line_data,
-    create_recall_line_data,
+    create_boxplot_data,
+    create_line_data,
 )
+from src.collection_utils.evaluation_results import (
+    evaluation_results_exist,
+    label_rankings_exist,
+    load_evaluation_results,
+    load_label_rankings,
+)
+from src.collection_utils.retrieval_curves import rankings_to_metric_matrices
 
 load_dotenv()
 
@@ -20,24 +25,11 @@ HF_MODEL_NAME = os.getenv("HF_MODEL_NAME")
 PUBLISHING_PROJECT_ID = os.getenv("PUBLISHING_PROJECT_ID")
 EVALUATION_TABLE = os.getenv("EVALUATION_TABLE")
 EVALUATION_TABLE = f"`{EVALUATION_TABLE}`"
+EVALUATION_RESULTS_DIR = "data/evaluation_results"
+EVALUATION_RANKINGS_DIR = "data/evaluation_results/rankings"
 
 
-# Check if the pickle files exist via a cached function
-def check_pickle_files():
-    data_path = "data"
-    required_files = [
-        "regex_ids.pkl",
-        "precision_values.pkl",
-        "recall_values.pkl",
-        "f2_scores.pkl",
-    ]
-    files_exist = os.path.isdir(data_path) and all(
-        os.path.exists(os.path.join(data_path, file)) for file in required_files
-    )
-    return files_exist
-
-
-# Create the pickle files (no caching so it checks every time)
+# Create the evaluation results (no caching so it checks every time)
 def create_files():
     print("Running evaluation/create_eval_json.py ...")
     subprocess.run(
@@ -45,51 +37,167 @@ def create_files():
     )
 
 
-# Check if the pickle files exists
-if not check_pickle_files():
+# Check if the evaluation results exist
+if not evaluation_results_exist(EVALUATION_RESULTS_DIR):
     create_files()
 
 
-# Load the pickle files via a cached function
-@st.cache_data
-def load_pickle_data(file_path):
-    with open(file_path, "rb") as file:
-        data = pickle.load(file)
-    return data
+# Memory-map the evaluation results once per process
+@st.cache_resource
+def load_results(results_dir):
+    return load_evaluation_results(results_dir)
+
+
+# Memory-map the label rankings once per process, if they were saved
+@st.cache_resource
+def load_rankings(rankings_dir):
+    if label_rankings_exist(rankings_dir):
+        return load_label_rankings(rankings_dir)
+    return None, None
+
+
+results = load_results(EVALUATION_RESULTS_DIR)
+_, rankings = load_rankings(EVALUATION_RANKINGS_DIR)
+
 
+# Box plots stay on this grid whatever the line resolution, so the figures
+# have a handful of traces rather than one per fine threshold
+BOXPLOT_RESOLUTION = 0.1
 
-# Load the pickle files
-# TODO: can I parameterise the list of files so I don't type here and in the check_pickle_files function?
-regex_ids = load_pickle_data("data/regex_ids.pkl")  # TODO: Do I need this?
-recall_values = load_pickle_data("data/recall_values.pkl")
-precision_values = load_pickle_data("data/precision_values.pkl")
-f2scores = load_pickle_data("data/f2_scores.pkl")
 
-# Create the data for the box plots and line plots
-precision_boxplot_data = create_precision_boxplot_data(precision_values)
-recall_boxplot_data = create_recall_boxplot_data(recall_values)
-precision_line_data = create_precision_line_data(precision_values)
-recall_line_data = create_recall_line_data(recall_values)
-f2scores_line_data = create_recall_line_data(f2scores)
+# Create the data for the box plots and line plots. Lines are at the given
+# resolution if label rankings are available, otherwise at the thresholds that
+# were evaluated.
+@st.cache_data
+def get_plot_data(resolution: float = None) -> dict:
+    if resolution is None:
+        thresholds = results["thresholds"]
+        metric_matrices = results
+        decimals = 2
+    else:
+        thresholds = np.arange(0, 1 + resolution / 2, resolution)
+        metric_matrices = rankings_to_metric_matrices(rankings, thresholds)
+        decimals = 3
+
+    if resolution is None or resolution == BOXPLOT_RESOLUTION:
+        box_thresholds = thresholds
+        box_matrices = metric_matrices
+    else:
+        box_thresholds = np.arange(0, 1 + BOXPLOT_RESOLUTION / 2, BOXPLOT_RESOLUTION)
+        box_matrices = rankings_to_metric_matrices(rankings, box_thresholds)
+
+    plot_data = {
+        "precision_boxplot_data": create_boxplot_data(
+            box_matrices["precision"], box_thresholds
+        ),
+        "recall_boxplot_data": create_boxplot_data(
+            box_matrices["recall"], box_thresholds
+        ),
+        "precision_line_data": create_line_data(
+            metric_matrices["precision"], thresholds, decimals
+        ),
+        "recall_line_data": create_line_data(
+            metric_matrices["recall"], thresholds, decimals
+        ),
+        "f2scores_line_data": create_line_data(
+            metric_matrices["f2"], thresholds, decimals
+        ),
+    }
+    if "average_precision" in metric_matrices:
+        plot_data["mean_average_precision"] = round(
+            float(np.nanmean(metric_matrices["average_precision"])), 2
+        )
+    return plot_data
+
+
+# Box plot data at a single threshold off the box plot grid
+@st.cache_data
+def get_selected_boxplot_data(threshold: float) -> dict:
+    metric_matrices = rankings_to_metric_matrices(rankings, np.array([threshold]))
+    return {
+        "precision_boxplot_data": create_boxplot_data(
+            metric_matrices["precision"], [threshold], 3
+        ),
+        "recall_boxplot_data": create_boxplot_data(
+            metric_matrices["recall"], [threshold], 3
+        ),
+    }
+
+
+def boxplot_figure(boxplot_data: dict, selected_threshold: float, metric: str):
+    """
+    Box plot of a metric per threshold, highlighting the selected threshold
+
+    Args:
+        boxplot_data (dict): rounded threshold to values
+        selected_threshold (float): the threshold selected on the slider
+        metric (str): name of the metric, e.g. "Precision"
+
+    Returns:
+        go.Figure: the box plot
+    """
+    fig = go.Figure()
+    for threshold, values in sorted(boxplot_data.items()):
+        # Compare rounded keys, not floats
+        selected = round(threshold, 3) == round(selected_threshold, 3)
+        fig.add_trace(
+            go.Box(
+                y=values,
+                name=f"Threshold: {threshold}",
+                marker=dict(
+                    color="#00cc96" if selected else "#19d3f3",
+                    opacity=1 if selected else 0.5,
+                ),
+            )
+        )
+    # Update layout to add titles and make it clearer, and hide the legend
+    fig.update_layout(
+        title=f"Threshold vs. {metric} Score",
+        yaxis_title=f"{metric} Score",
+        showlegend=False,
+    )
+    return fig
 
 
 # Streamlit app
 def main():
     st.title("Precision and Recall Calculator")
 
+    # Finer thresholds can be computed from the label rankings without querying again
+    if rankings is not None:
+        resolution = st.select_slider(
+            "Select Threshold resolution",
+            options=[0.1, 0.05, 0.02, 0.01, 0.005, 0.001],
+            value=0.1,
+        )
+    else:
+        resolution = None
+    plot_data = get_plot_data(resolution)
+    precision_boxplot_data = plot_data["precision_boxplot_data"]
+    recall_boxplot_data = plot_data["recall_boxplot_data"]
+    precision_line_data = plot_data["precision_line_data"]
+    recall_line_data = plot_data["recall_line_data"]
+    f2scores_line_data = plot_data["f2scores_line_data"]
+
     # Streamlit slider for selecting threshold
     selected_threshold = st.slider(
-        "Select Threshold", min_value=0.0, max_value=1.0, step=0.1
+        "Select Threshold",
+        min_value=0.0,
+        max_value=1.0,
+        step=resolution if resolution else 0.1,
     )
 
     # Get the precision, recall, and f2 scores as lists
-    thresholds = list(precision_line_data.keys())
+    line_thresholds = list(precision_line_data.keys())
     precision_scores = list(precision_line_data.values())
     recall_scores = list(recall_line_data.values())
     f2scores = list(f2scores_line_data.values())
 
-    # Index the score lists for the selected threshold
-    selected_index = thresholds.index(selected_threshold)
+    # Index the score lists for the threshold closest to the slider value
+    selected_index = int(
+        np.argmin(np.abs(np.array(line_thresholds) - selected_threshold))
+    )
+    selected_threshold = line_thresholds[selected_index]
     selected_precision = precision_scores[selected_index]
     selected_recall = recall_scores[selected_index]
     selected_f2 = f2scores[selected_index]
@@ -103,17 +211,24 @@ def main():
     with col3:
         st.metric("F2 score", selected_f2)
 
+    if "mean_average_precision" in plot_data:
+        st.metric("Mean average precision", plot_data["mean_average_precision"])
+
     # Plot
     fig = go.Figure()
 
     # Add line plot traces for thresholds vs. scores
     fig.add_trace(
-        go.Scatter(x=thresholds, y=precision_scores, mode="lines", name="Precision")
+        go.Scatter(
+            x=line_thresholds, y=precision_scores, mode="lines", name="Precision"
+        )
+    )
+    fig.add_trace(
+        go.Scatter(x=line_thresholds, y=recall_scores, mode="lines", name="Recall")
     )
     fig.add_trace(
-        go.Scatter(x=thresholds, y=recall_scores, mode="lines", name="Recall")
+        go.Scatter(x=line_thresholds, y=f2scores, mode="lines", name="F2 score")
     )
-    fig.add_trace(go.Scatter(x=thresholds, y=f2scores, mode="lines", name="F2 score"))
 
     # Add a point to highlight the selected threshold and precision score
     fig.add_trace(
@@ -161,74 +276,22 @@ def main():
     # Show the plot
     st.plotly_chart(fig)
 
-    # Box plot
-    fig2 = go.Figure()
-
-    # Add box plot for precision scores
-    for item in precision_boxplot_data.items():
-        if item[0] == selected_threshold:
-            fig2.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#00cc96", opacity=1),
-                )
-            )
-        else:
-            fig2.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#19d3f3", opacity=0.5),
-                )
-            )
-    # Update layout to add titles and make it clearer
-    fig2.update_layout(
-        title="Threshold vs. Precision Score",
-        # xaxis_title="Threshold",
-        yaxis_title="Precision Score",
+    # Box plots on the coarse grid, plus the selected threshold if it is off it
+    precision_boxplot_data = dict(precision_boxplot_data)
+    recall_boxplot_data = dict(recall_boxplot_data)
+    on_grid = any(
+        round(threshold, 3) == round(selected_threshold, 3)
+        for threshold in precision_boxplot_data
     )
+    if rankings is not None and not on_grid:
+        selected_data = get_selected_boxplot_data(float(selected_threshold))
+        precision_boxplot_data.update(selected_data["precision_boxplot_data"])
+        recall_boxplot_data.update(selected_data["recall_boxplot_data"])
 
-    # Hide the legend
-    fig2.update_layout(showlegend=False)
-
-    # Show the plot
-    st.plotly_chart(fig2)
-
-    # Box plot
-    fig3 = go.Figure()
-
-    # Add box plot for recall scores
-    for item in recall_boxplot_data.items():
-        if item[0] == selected_threshold:
-            fig3.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#00cc96", opacity=1),
-                )
-            )
-        else:
-            fig3.add_trace(
-                go.Box(
-                    y=item[1],
-                    name=f"Threshold: {item[0]}",
-                    marker=dict(color="#19d3f3", opacity=0.5),
-                )
-            )
-
-    # Update layout to add titles and make it clearer
-    fig3.update_layout(
-        title="Threshold vs. Recall Score",
-        # xaxis_title="Threshold",
-        yaxis_title="Recall Score",
+    st.plotly_chart(
+        boxplot_figure(precision_boxplot_data, selected_threshold, "Precision")
     )
-
-    # Hide the legend
-    fig3.update_layout(showlegend=False)
-
-    # Show the plot
-    st.plotly_chart(fig3)
+    st.plotly_chart(boxplot_figure(recall_boxplot_data, selected_threshold, "Recall"))
 
 
 if __name__ == "__main__":
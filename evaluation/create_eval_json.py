@@ -1,8 +1,26 @@
-from src.utils.utils import load_qdrant_client
+from src.utils.utils import load_async_qdrant_client, load_qdrant_client
+from src.collection_utils.local_search import LocalSearchClient
 from src.utils.utils import load_model
-from src.collection_utils.evaluate_collection import process_labels
+from src.collection_utils.evaluate_collection import (
+    EVALUATION_THRESHOLDS,
+    process_label_rankings,
+    process_labels,
+    process_labels_async,
+    process_labels_bitset,
+)
+from src.collection_utils.evaluation_results import (
+    merge_checkpoints,
+    metric_values_to_matrix,
+    remaining_labels,
+    save_evaluation_results,
+    save_label_rankings,
+    shard_checkpoint_path,
+)
+from src.collection_utils.retrieval_curves import rankings_to_metric_matrices
 
 from dotenv import load_dotenv
+import asyncio
+import numpy as np
 import os
 import pickle
 import argparse
@@ -18,14 +36,46 @@ HF_MODEL_NAME = os.getenv("HF_MODEL_NAME")
 PUBLISHING_PROJECT_ID = os.getenv("PUBLISHING_PROJECT_ID")
 EVALUATION_TABLE = os.getenv("EVALUATION_TABLE")
 EVALUATION_TABLE = f"`{EVALUATION_TABLE}`"
+# Search collections exported with export_collection in process, if set
+LOCAL_COLLECTIONS_PATH = os.getenv("LOCAL_COLLECTIONS_PATH")
+EVALUATION_RESULTS_DIR = "data/evaluation_results"
+EVALUATION_RANKINGS_DIR = "data/evaluation_results/rankings"
+EVALUATION_CHECKPOINT_DIR = "data/evaluation_checkpoints"
 
 
-def main(save_outputs: bool = False):
+def main(
+    save_outputs: bool = False,
+    max_concurrency: int = 0,
+    request_timeout: float = 60.0,
+    from_rankings: bool = False,
+    metrics_backend: str = "sets",
+    checkpoint: bool = False,
+    resume: bool = False,
+    shard_index: int = 0,
+    num_shards: int = 1,
+):
     """
-    Main function to get data for analysis and save the outputs as pickle files
+    Main function to get data for analysis and save the outputs as label x threshold arrays
+
+    Args:
+        save_outputs (bool): Whether to save the outputs.
+        max_concurrency (int): Number of concurrent searches. 0 runs sequentially.
+        request_timeout (float): Seconds to wait for each search when running concurrently.
+        from_rankings (bool): Run one search per label and compute every threshold
+            from its ranking. The rankings are saved so the dashboard can plot
+            curves at any resolution.
+        metrics_backend (str): "sets" scores each label and threshold with Python
+            sets, "bitset" scores each batch of labels with packed bitsets.
+        checkpoint (bool): Append each batch of results to a checkpoint file.
+        resume (bool): Skip labels already in the checkpoint file.
+        shard_index (int): Which shard of the labels this process evaluates.
+        num_shards (int): Number of shards the labels are split into. With more than
+            one shard, results are only checkpointed and merged afterwards by
+            evaluation/merge_checkpoints.py.
 
     Requirements:
-        Pickle files for unique labels and regex_ids. A Qdrant client and an encoder model.
+        Pickle files for unique labels and regex_ids. A Qdrant client, or a
+        local copy of the collection in LOCAL_COLLECTIONS_PATH, and an encoder model.
     """
     if not os.path.exists("data/unique_labels.pkl") or not os.path.exists(
         "data/regex_ids.pkl"
@@ -44,87 +94,208 @@ def main(save_outputs: bool = False):
     with open("data/unique_labels.pkl", "rb") as f:
         unique_labels = pickle.load(f)
 
-    # Load Qdrant client and encoder model
+    # Select this process's shard of the labels
+    shard_labels = unique_labels[shard_index::num_shards]
+
+    # Checkpoint to an append-only file, always when sharding
+    checkpoint_path = None
+    if checkpoint or resume or num_shards > 1:
+        if from_rankings:
+            if num_shards > 1:
+                raise ValueError("Sharding is not supported with --from_rankings")
+            print("Checkpointing is not supported with --from_rankings, ignoring")
+        else:
+            checkpoint_path = shard_checkpoint_path(
+                EVALUATION_CHECKPOINT_DIR, shard_index, num_shards
+            )
+
+    labels_to_process = shard_labels
+    if checkpoint_path and resume:
+        labels_to_process = remaining_labels(
+            shard_labels, checkpoint_path, EVALUATION_THRESHOLDS
+        )
+        print(
+            f"Resuming: {len(shard_labels) - len(labels_to_process)} labels already completed, {len(labels_to_process)} remaining"
+        )
+    elif checkpoint_path and os.path.exists(checkpoint_path):
+        print(f"Starting a new checkpoint, removing {checkpoint_path}")
+        os.remove(checkpoint_path)
+
+    # The local search runs in process, so concurrent searches wouldn't overlap
+    if LOCAL_COLLECTIONS_PATH and max_concurrency > 0:
+        print("Searching local collections sequentially, ignoring --max_concurrency")
+        max_concurrency = 0
+
+    # Load Qdrant client, or search a local copy of the collection, and encoder model
     try:
-        qdrant = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
+        if LOCAL_COLLECTIONS_PATH:
+            qdrant = LocalSearchClient(LOCAL_COLLECTIONS_PATH)
+        elif max_concurrency > 0 and not from_rankings and metrics_backend == "sets":
+            qdrant = load_async_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
+        else:
+            qdrant = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
         model = load_model(HF_MODEL_NAME)
     except Exception as e:
         print(f"Error: {e}")
 
     # Process labels
-    precision_values, recall_values, f2_scores = process_labels(
-        unique_labels=unique_labels,
-        regex_ids=regex_ids,
-        model=model,
-        client=qdrant,
-        collection_name=COLLECTION_NAME,
-    )
+    if from_rankings:
+        # One search per label, evaluated at every threshold from the ranking
+        rankings = process_label_rankings(
+            unique_labels=labels_to_process,
+            regex_ids=regex_ids,
+            model=model,
+            client=qdrant,
+            collection_name=COLLECTION_NAME,
+        )
+        metric_matrices = rankings_to_metric_matrices(rankings, EVALUATION_THRESHOLDS)
+        average_precision = metric_matrices.pop("average_precision")
+        print(f"Mean average precision: {np.nanmean(average_precision):.3f}")
+    elif metrics_backend == "bitset":
+        precision_matrix, recall_matrix, f2_matrix = process_labels_bitset(
+            unique_labels=labels_to_process,
+            regex_ids=regex_ids,
+            model=model,
+            client=qdrant,
+            collection_name=COLLECTION_NAME,
+            checkpoint_path=checkpoint_path,
+        )
+        metric_matrices = {
+            "precision": precision_matrix,
+            "recall": recall_matrix,
+            "f2": f2_matrix,
+        }
+    else:
+        if max_concurrency > 0:
+            print(f"Processing labels with {max_concurrency} concurrent searches ...")
+            precision_values, recall_values, f2_scores = asyncio.run(
+                process_labels_async(
+                    unique_labels=labels_to_process,
+                    regex_ids=regex_ids,
+                    model=model,
+                    client=qdrant,
+                    collection_name=COLLECTION_NAME,
+                    max_concurrency=max_concurrency,
+                    request_timeout=request_timeout,
+                    checkpoint_path=checkpoint_path,
+                )
+            )
+        else:
+            precision_values, recall_values, f2_scores = process_labels(
+                unique_labels=labels_to_process,
+                regex_ids=regex_ids,
+                model=model,
+                client=qdrant,
+                collection_name=COLLECTION_NAME,
+                checkpoint_path=checkpoint_path,
+            )
 
-    # # Loop over unique labels and similarity thresholds and return vals
-    # precision_values = []
-    # recall_values = []
-    # f2_scores = []
-    # batch_size = 100
-    # num_batches = len(unique_labels) // batch_size + 1
-
-    # for batch_idx in range(num_batches):
-    #     start_idx = batch_idx * batch_size
-    #     end_idx = min((batch_idx + 1) * batch_size, len(unique_labels))
-    #     batch_labels = unique_labels[start_idx:end_idx]
-
-    #     for unique_label in batch_labels:
-    #         label_precision = {}
-    #         label_recall = {}
-    #         label_f2_scores = {}
-
-    #         for threshold in np.arange(0, 1.1, 0.1):
-    #             try:
-    #                 precision, recall, f2_score = calculate_metrics(
-    #                     unique_label=unique_label,
-    #                     regex_ids=regex_ids,
-    #                     model=model,
-    #                     client=qdrant,
-    #                     similarity_threshold=threshold,
-    #                     collection_name=COLLECTION_NAME,
-    #                 )
-    #                 label_precision[threshold] = precision
-    #                 label_recall[threshold] = recall
-    #                 label_f2_scores[threshold] = f2_score
-    #             except Exception as e:
-    #                 print(
-    #                     f"Error processing {unique_label} at threshold {threshold}: {e}"
-    #                 )
-
-    #         precision_values.append({unique_label: label_precision})
-    #         recall_values.append({unique_label: label_recall})
-    #         f2_scores.append({unique_label: label_f2_scores})
-    #     print(f"Metrics calculated for labels index {start_idx} to {end_idx}")
-
-    # Print first 10 values
-    print(precision_values[:10])
-    print(recall_values[:10])
-    print(f2_scores[:10])
-
-    # pickle precision and recall values if argument is True
-    if save_outputs:
-        with open("data/precision_values.pkl", "wb") as f:
-            pickle.dump(precision_values, f)
+        # Print first 10 values
+        print(precision_values[:10])
+        print(recall_values[:10])
+        print(f2_scores[:10])
 
-        print("Precision values saved")
+        _, precision_matrix = metric_values_to_matrix(
+            precision_values, EVALUATION_THRESHOLDS
+        )
+        _, recall_matrix = metric_values_to_matrix(recall_values, EVALUATION_THRESHOLDS)
+        _, f2_matrix = metric_values_to_matrix(f2_scores, EVALUATION_THRESHOLDS)
+        metric_matrices = {
+            "precision": precision_matrix,
+            "recall": recall_matrix,
+            "f2": f2_matrix,
+        }
 
-        with open("data/recall_values.pkl", "wb") as f:
-            pickle.dump(recall_values, f)
+    # With checkpointing, results for the whole shard (including any resumed
+    # labels) are read back from the checkpoint file
+    labels = labels_to_process
+    if checkpoint_path:
+        labels = shard_labels
+        metric_matrices = merge_checkpoints(
+            [checkpoint_path], shard_labels, EVALUATION_THRESHOLDS
+        )
 
-        print("Recall values saved")
+    if num_shards > 1:
+        print(
+            f"Shard {shard_index} of {num_shards} checkpointed to {checkpoint_path}. Run evaluation/merge_checkpoints.py --num_shards {num_shards} once all shards have finished."
+        )
+        return
 
-        with open("data/f2_scores.pkl", "wb") as f:
-            pickle.dump(f2_scores, f)
+    # Save precision, recall and f2 as label x threshold arrays if argument is True
+    if save_outputs:
+        save_evaluation_results(
+            EVALUATION_RESULTS_DIR,
+            labels=labels,
+            thresholds=EVALUATION_THRESHOLDS,
+            metric_matrices=metric_matrices,
+        )
+        print(f"Precision, recall and F2 scores saved to {EVALUATION_RESULTS_DIR}")
 
-        print("F2 scores saved")
+        if from_rankings:
+            save_label_rankings(EVALUATION_RANKINGS_DIR, labels, rankings)
+            print(f"Label rankings saved to {EVALUATION_RANKINGS_DIR}")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--save_outputs", type=bool, default=False)
+    parser.add_argument(
+        "--max_concurrency",
+        type=int,
+        default=0,
+        help="Number of concurrent Qdrant searches. 0 runs sequentially. Defaults to 0.",
+    )
+    parser.add_argument(
+        "--request_timeout",
+        type=float,
+        default=60.0,
+        help="Seconds to wait for each search when running concurrently. Defaults to 60.",
+    )
+    parser.add_argument(
+        "--from_rankings",
+        action="store_true",
+        default=False,
+        help="Run one search per label and compute all thresholds from its ranking.",
+    )
+    parser.add_argument(
+        "--metrics_backend",
+        choices=["sets", "bitset"],
+        default="sets",
+        help="Score labels with Python sets, or in batches with packed bitsets.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        default=False,
+        help="Append each batch of results to a checkpoint file.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        default=False,
+        help="Resume from the checkpoint file, skipping completed labels.",
+    )
+    parser.add_argument(
+        "--shard_index",
+        type=int,
+        default=0,
+        help="Which shard of the labels to evaluate. Defaults to 0.",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="Number of shards to split the labels into. Defaults to 1.",
+    )
     args = parser.parse_args()
-    main(save_outputs=args.save_outputs)
+    main(
+        save_outputs=args.save_outputs,
+        max_concurrency=args.max_concurrency,
+        request_timeout=args.request_timeout,
+        from_rankings=args.from_rankings,
+        metrics_backend=args.metrics_backend,
+        checkpoint=args.checkpoint,
+        resume=args.resume,
+        shard_index=args.shard_index,
+        num_shards=args.num_shards,
+    )
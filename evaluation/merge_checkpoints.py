@@ -0,0 +1,70 @@
+from src.collection_utils.evaluate_collection import EVALUATION_THRESHOLDS
+from src.collection_utils.evaluation_results import (
+    merge_checkpoints,
+    save_evaluation_results,
+    shard_checkpoint_path,
+)
+
+import argparse
+import os
+import pickle
+
+EVALUATION_RESULTS_DIR = "data/evaluation_results"
+EVALUATION_CHECKPOINT_DIR = "data/evaluation_checkpoints"
+
+
+def main(checkpoint_dir: str = EVALUATION_CHECKPOINT_DIR, num_shards: int = 1):
+    """
+    Merge the checkpoint files written by create_eval_json.py, e.g. by label
+    shards run in separate processes, and save them as label x threshold arrays
+
+    Args:
+        checkpoint_dir (str): Directory containing the checkpoint files.
+        num_shards (int): Number of shards the run was split into. Only that
+            run's shard_<i>_of_<num_shards>.jsonl files are merged.
+
+    Requirements:
+        The unique labels pickle file and a checkpoint file for every shard.
+    """
+    with open("data/unique_labels.pkl", "rb") as f:
+        unique_labels = pickle.load(f)
+
+    checkpoint_paths = [
+        shard_checkpoint_path(checkpoint_dir, shard_index, num_shards)
+        for shard_index in range(num_shards)
+    ]
+    missing = [path for path in checkpoint_paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(
+            f"Missing checkpoint files for {len(missing)} of {num_shards} shards: {missing}"
+        )
+    print(f"Merging {len(checkpoint_paths)} checkpoint files ...")
+
+    metric_matrices = merge_checkpoints(
+        checkpoint_paths, unique_labels, EVALUATION_THRESHOLDS
+    )
+    save_evaluation_results(
+        EVALUATION_RESULTS_DIR,
+        labels=unique_labels,
+        thresholds=EVALUATION_THRESHOLDS,
+        metric_matrices=metric_matrices,
+    )
+    print(f"Precision, recall and F2 scores saved to {EVALUATION_RESULTS_DIR}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--checkpoint_dir",
+        type=str,
+        default=EVALUATION_CHECKPOINT_DIR,
+        help="Directory containing the checkpoint files.",
+    )
+    parser.add_argument(
+        "--num_shards",
+        type=int,
+        default=1,
+        help="Number of shards the run was split into. Defaults to 1.",
+    )
+    args = parser.parse_args()
+    main(checkpoint_dir=args.checkpoint_dir, num_shards=args.num_shards)
@@ -1,9 +1,8 @@
 from src.collection_utils.evaluate_collection import (
     get_data_for_evaluation,
     get_unique_labels,
-    get_all_regex_counts,
-    get_all_regex_ids,
 )
+from src.collection_utils.ground_truth import build_ground_truth_index
 import os
 from dotenv import load_dotenv
 import pickle
@@ -36,9 +35,8 @@ def main(save_outputs: bool = False):
     # Get unique labels
     unique_labels = get_unique_labels(data)
 
-    # Get the regex counts and ids
-    regex_counts = get_all_regex_counts(data)
-    regex_ids = get_all_regex_ids(data)
+    # Get the regex ids and counts in a single pass over the data
+    regex_ids, regex_counts = build_ground_truth_index(data, unique_labels)
 
     if save_outputs:
         # Save regex_counts as a pickle file
@@ -5,6 +5,7 @@ from src.collection_utils.evaluate_collection import (
     get_data_for_evaluation,
     assess_scroll_retrieval,
 )
+from src.collection_utils.local_search import LocalSearchClient
 from src.utils.utils import load_qdrant_client, load_config
 from dotenv import load_dotenv
 
@@ -18,6 +19,8 @@ QDRANT_HOST = os.getenv("QDRANT_HOST")
 QDRANT_PORT = os.getenv("QDRANT_PORT")
 EVAL_COLLECTION_NAME = os.getenv("COLLECTION_NAME")
 HF_MODEL_NAME = os.getenv("HF_MODEL_NAME")
+# Search collections exported with export_collection in process, if set
+LOCAL_COLLECTIONS_PATH = os.getenv("LOCAL_COLLECTIONS_PATH")
 
 config = load_config(".config/config.json")
 similarity_threshold = float(config.get("similarity_threshold_1"))
@@ -25,8 +28,11 @@ print(f"Similarity threshold: {similarity_threshold}")
 
 
 def main():
-    # Initialize a Qdrant client
-    client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
+    # Initialize a Qdrant client, or search a local copy of the collection
+    if LOCAL_COLLECTIONS_PATH:
+        client = LocalSearchClient(LOCAL_COLLECTIONS_PATH)
+    else:
+        client = load_qdrant_client(QDRANT_HOST, port=QDRANT_PORT)
 
     # Read in the data for evaluation
     data = get_data_for_evaluation(
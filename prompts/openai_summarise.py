@@ -29,3 +29,15 @@ identify common themes and issues. Your summary should be concise and highlight
 by users. This summary will be used to inform the development and improvement of government digital services, ensuring
 they meet the needs of the public efficiently and effectively.
 """
+
+clustered_user_prompt = """
+Here are the feedback records you should summarise. Near-identical records have been grouped, and each record below
+is one example of its group, prefixed with the number of records in the group, e.g. "[12 records]". Use these numbers,
+not the number of examples, when counting the records that pertain to a theme:
+{}
+
+Remember you are a publishing, content and digital services expert who is tasked with summarising the feedback to
+identify common themes and issues. Your summary should be concise and highlight the main themes and concerns raised
+by users. This summary will be used to inform the development and improvement of government digital services, ensuring
+they meet the needs of the public efficiently and effectively.
+"""
@@ -0,0 +1,258 @@
+import datetime
+from collections import defaultdict
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import FieldCondition, Filter, MatchValue
+
+from src.collection_utils.query_collection import (
+    DUPLICATE_TEXT_FIELD,
+    TEXT_FIELD,
+    count_results,
+    payload_selector,
+)
+
+# Records are only merged with records that match on every filter field, so
+# filter searches return the same representatives as before deduplication.
+# created is a date, so duplicates are only merged within a day, and date
+# range filters keep or drop whole clusters.
+DEDUP_GROUP_FIELDS = [
+    "created",
+    "url",
+    "primary_department",
+    "document_type",
+    "spam_classification",
+    "urgency",
+]
+
+# Companion collection holding the duplicates removed from a collection
+DUPLICATES_SUFFIX = "_duplicates"
+
+
+def duplicates_collection_name(collection_name: str) -> str:
+    """Name of the collection holding the duplicates of collection_name"""
+    return f"{collection_name}{DUPLICATES_SUFFIX}"
+
+
+def simhash_signatures(
+    embeddings: np.ndarray, n_bits: int = 128, seed: int = 0
+) -> np.ndarray:
+    """
+    SimHash signatures: the sign of each embedding against random hyperplanes.
+    Embeddings at a small angle share most bits.
+
+    Args:
+        embeddings (np.ndarray): (n, size) embeddings
+        n_bits (int): number of hyperplanes
+        seed (int): random seed for the hyperplanes
+
+    Returns:
+        np.ndarray: (n, n_bits) boolean signatures
+    """
+    rng = np.random.default_rng(seed)
+    planes = rng.normal(size=(embeddings.shape[1], n_bits)).astype(np.float32)
+    return embeddings @ planes > 0
+
+
+def _find(parents: list, idx: int) -> int:
+    """Root of idx in a union-find forest, halving the path as it goes"""
+    while parents[idx] != idx:
+        parents[idx] = parents[parents[idx]]
+        idx = parents[idx]
+    return idx
+
+
+def cluster_near_duplicates(
+    embeddings: np.ndarray,
+    threshold: float = 0.97,
+    n_bits: int = 128,
+    n_bands: int = 8,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Cluster embeddings whose cosine similarity is at least threshold, using
+    SimHash LSH: signatures are split into bands, and only embeddings sharing
+    a band are compared. Within a band bucket, each embedding is compared to
+    the bucket's cluster leaders, so buckets of many identical texts stay cheap.
+
+    Args:
+        embeddings (np.ndarray): (n, size) embeddings
+        threshold (float): cosine similarity to merge at
+        n_bits (int): SimHash signature bits
+        n_bands (int): bands the signature is split into. More bands find
+            more pairs at the cost of more comparisons.
+        seed (int): random seed for the hyperplanes
+
+    Returns:
+        np.ndarray: cluster label per embedding, the index of its root
+    """
+    n_records = len(embeddings)
+    if n_records == 0:
+        return np.zeros(0, dtype=np.int64)
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = embeddings / np.where(norms == 0, 1, norms)
+
+    signatures = simhash_signatures(unit, n_bits=n_bits, seed=seed)
+    parents = list(range(n_records))
+    for band in np.array_split(np.arange(n_bits), n_bands):
+        buckets = defaultdict(list)
+        for idx, key in enumerate(np.packbits(signatures[:, band], axis=1)):
+            buckets[key.tobytes()].append(idx)
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            leaders = [members[0]]
+            for idx in members[1:]:
+                similarities = unit[leaders] @ unit[idx]
+                best = int(np.argmax(similarities))
+                if similarities[best] >= threshold:
+                    root, other = _find(parents, leaders[best]), _find(parents, idx)
+                    if root != other:
+                        parents[other] = root
+                else:
+                    leaders.append(idx)
+
+    return np.array([_find(parents, idx) for idx in range(n_records)])
+
+
+def deduplicate_records(
+    documents: list[dict],
+    id_key: str = "feedback_record_id",
+    embedding_key: str = "embeddings",
+    group_fields: list[str] = DEDUP_GROUP_FIELDS,
+    threshold: float = 0.97,
+    **lsh_kwargs,
+):
+    """
+    Collapse near-duplicate records within each group of equal filter fields
+    into one representative, the most recent record of the cluster. The
+    representative gains "duplicate_count", the size of its cluster including
+    itself, "duplicate_ids", the ids of the other members, and
+    "duplicate_feedback", the members' feedback worded differently from its
+    own, so keyword searches also match on the members' wording. Members gain
+    "duplicate_of", the id of their representative.
+
+    Args:
+        documents (list[dict]): records from query_all_feedback
+        id_key (str): name of the key containing the unique feedback id
+        embedding_key (str): name of the key containing embeddings
+        group_fields (list[str]): fields records must share to be merged
+        threshold (float): cosine similarity to merge at
+        **lsh_kwargs: n_bits, n_bands and seed for cluster_near_duplicates
+
+    Returns:
+        tuple[list[dict], list[dict]]: representatives, including records
+            without duplicates, and the duplicate members
+    """
+    groups = defaultdict(list)
+    for idx, record in enumerate(documents):
+        groups[tuple(record.get(field) for field in group_fields)].append(idx)
+
+    representatives = []
+    members = []
+    for indices in groups.values():
+        labels = cluster_near_duplicates(
+            np.array([documents[idx][embedding_key] for idx in indices]),
+            threshold=threshold,
+            **lsh_kwargs,
+        )
+        clusters = defaultdict(list)
+        for idx, label in zip(indices, labels):
+            clusters[label].append(documents[idx])
+        for cluster in clusters.values():
+            cluster = sorted(
+                cluster, key=lambda record: str(record.get("created")), reverse=True
+            )
+            representative = dict(cluster[0])
+            representative["duplicate_count"] = len(cluster)
+            representative["duplicate_ids"] = [
+                int(record[id_key]) for record in cluster[1:]
+            ]
+            if len(cluster) > 1:
+                texts = dict.fromkeys(
+                    record.get(TEXT_FIELD)
+                    for record in cluster[1:]
+                    if record.get(TEXT_FIELD)
+                )
+                texts.pop(representative.get(TEXT_FIELD), None)
+                representative[DUPLICATE_TEXT_FIELD] = "\n".join(texts)
+            representatives.append(representative)
+            members.extend(
+                {**record, "duplicate_of": int(representative[id_key])}
+                for record in cluster[1:]
+            )
+
+    print(
+        f"Deduplicated {len(documents)} records into {len(representatives)} representatives"
+    )
+    return representatives, members
+
+
+def get_duplicate_members(
+    client: QdrantClient,
+    collection_name: str,
+    point_id: int,
+    payload_fields: list[str] = None,
+    limit: int = 10000,
+) -> list:
+    """
+    Get the duplicates collapsed into a representative point
+
+    Args:
+        client (QdrantClient): Qdrant client
+        collection_name (str): name of the deduplicated collection
+        point_id (int): id of the representative point
+        payload_fields (list[str], optional): payload fields to return.
+            Defaults to None, the full payload.
+        limit (int): most members to return
+
+    Returns:
+        list[Record]: the duplicate points
+    """
+    records, _ = client.scroll(
+        collection_name=duplicates_collection_name(collection_name),
+        scroll_filter=Filter(
+            must=[FieldCondition(key="duplicate_of", match=MatchValue(value=point_id))]
+        ),
+        with_payload=payload_selector(payload_fields),
+        with_vectors=False,
+        limit=limit,
+    )
+    return records
+
+
+def count_records(
+    client: QdrantClient,
+    collection_name: str,
+    filter_dict: dict,
+    start_date: datetime.date = None,
+    end_date: datetime.date = None,
+    keywords: list[str] = None,
+) -> int:
+    """
+    Count the feedback records matching a filter with the count API. In a
+    deduplicated collection the matching duplicates are counted too. They
+    share their representative's filter fields, so a filter matches both or
+    neither, while keywords are matched against each duplicate's own feedback.
+
+    Args:
+        client (QdrantClient): Qdrant client
+        collection_name (str): name of the collection
+        filter_dict (dict): the keys and values to filter on
+        start_date (datetime.date, optional): the earliest created date
+        end_date (datetime.date, optional): the latest created date
+        keywords (list[str], optional): keyword alternatives the feedback must match
+
+    Returns:
+        int: the number of matching records
+    """
+    n_records = count_results(
+        client, collection_name, filter_dict, start_date, end_date, keywords
+    )
+    duplicates_name = duplicates_collection_name(collection_name)
+    if client.collection_exists(duplicates_name):
+        n_records += count_results(
+            client, duplicates_name, filter_dict, start_date, end_date, keywords
+        )
+    return n_records
@@ -1,16 +1,31 @@
-from collections import defaultdict
+import asyncio
+import math
 import regex as re
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 import numpy as np
 
+from src.collection_utils.evaluation_results import (
+    append_checkpoint,
+    metric_values_to_matrix,
+)
+from src.collection_utils.ground_truth import build_ground_truth_index
 from src.collection_utils.query_collection import (
     filter_search,
     get_semantically_similar_results,
+    get_semantically_similar_results_async,
+)
+from src.collection_utils.retrieval_curves import build_label_ranking
+from src.collection_utils.retrieval_metrics import (
+    build_id_positions,
+    calculate_metric_matrices,
+    ids_to_bitsets,
 )
 from src.sql_queries import query_evaluation_data
 from src.utils.bigquery import query_bigquery
 from src.utils.utils import load_model
-from time import sleep
+
+# Similarity thresholds evaluated for every label
+EVALUATION_THRESHOLDS = np.arange(0, 1.1, 0.1)
 
 
 def calculate_precision(retrieved_records: list, relevant_records: list) -> float:
@@ -155,7 +170,8 @@ def get_regex_comparison(label: str, all_labels: str) -> int:
 
 def get_all_regex_counts(data: list[dict]) -> dict:
     """
-    Get the regex counts for all labels.
+    Get the regex counts for all labels. Labels are matched literally and
+    case-insensitively, using the single pass ground truth index.
 
     Args:
         data (list[dict]): The list of id, labels, and urgency.
@@ -163,13 +179,9 @@ def get_all_regex_counts(data: list[dict]) -> dict:
     Returns:
         list[dict]: The list of regex counts.
     """
-    all_labels = get_all_labels(data)  # Get single string of all labels
     unique_labels = get_unique_labels(data)  # Get list of unique labels
-    regex_counts = {}  # Initialise dict to store label and regex counts
-    for unique_label in unique_labels:  # Loop through unique labels
-        count = get_regex_comparison(unique_label, all_labels)  # Get regex count
-        regex_counts[unique_label] = count  # Store in dict
-    return regex_counts  # Return dict
+    _, regex_counts = build_ground_truth_index(data, unique_labels)
+    return regex_counts
 
 
 def get_regex_ids(label: str, data: list[dict]) -> list[str]:
@@ -192,7 +204,8 @@ def get_regex_ids(label: str, data: list[dict]) -> list[str]:
 
 def get_all_regex_ids(data: list[dict]) -> dict:
     """
-    Get the regex IDs for all labels.
+    Get the regex IDs for all labels. Labels are matched literally and
+    case-insensitively, using the single pass ground truth index.
 
     Args:
         data (list[dict]): The list of id, labels, and urgency.
@@ -201,11 +214,8 @@ def get_all_regex_ids(data: list[dict]) -> dict:
         list[dict]: The list of regex IDs.
     """
     unique_labels = get_unique_labels(data)  # Get list of unique labels
-    regex_ids = {}  # Initialise dict to store label and regex IDs
-    for unique_label in unique_labels:  # Loop through unique labels
-        ids = get_regex_ids(unique_label, data)  # Get regex IDs
-        regex_ids[unique_label] = ids  # Store in dict
-    return regex_ids  # Return dict
+    regex_ids, _ = build_ground_truth_index(data, unique_labels)
+    return regex_ids
 
 
 def assess_retrieval_accuracy(
@@ -255,6 +265,7 @@ def assess_retrieval_accuracy(
                 collection_name=collection_name,
                 query_embedding=query_embedding,
                 score_threshold=score_threshold,
+                payload_fields=[],
             )
         except Exception as e:
             print(f"get_semantically_similar_results error: {e}")
@@ -337,157 +348,82 @@ def assess_scroll_retrieval(
         return result_ids
 
 
-def calculate_mean_values(data_list: list[dict]) -> dict:
+def calculate_mean_values(matrix: np.ndarray) -> np.ndarray:
     """
-    Calculate the mean values for each word/threshold stored in a dictionary
+    Calculate the mean value for each threshold across all labels, ignoring
+    missing (NaN) values
 
     Args:
-        data_list (list): list of dictionaries
+        matrix (np.ndarray): label x threshold matrix of metric values
 
     Returns:
-        dict: Dictionary of mean values for each threshold"""
-    sums_counts = defaultdict(lambda: {"sum": 0, "count": 0})
-
-    for item in data_list:
-        for _, values in item.items():
-            for threshold, value in values.items():
-                sums_counts[threshold]["sum"] += value
-                sums_counts[threshold]["count"] += 1
-
-    mean_values = {
-        test: info["sum"] / info["count"] for test, info in sums_counts.items()
-    }
-    return mean_values
+        np.ndarray: Mean value for each threshold, NaN where no values exist"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    valid = ~np.isnan(matrix)
+    counts = valid.sum(axis=0)
+    sums = np.where(valid, matrix, 0.0).sum(axis=0)
+    return np.divide(sums, counts, out=np.full(sums.shape, np.nan), where=counts > 0)
 
 
-def get_threshold_values(data: list[dict], input_threshold: float = 0.0) -> list:
+def get_threshold_values(
+    matrix: np.ndarray, thresholds: np.ndarray, input_threshold: float = 0.0
+) -> np.ndarray:
     """
-    Get values for a given threshold from a list of dictionaries
+    Get the values for a given threshold across all labels
 
     Args:
-        data (list): list of dictionaries
+        matrix (np.ndarray): label x threshold matrix of metric values
+        thresholds (np.ndarray): the thresholds, one per column
         input_threshold (float): the threshold to search for (default 0)
 
     Returns:
-        list: list of values for the given threshold"""
-    threshold_list = []
-    for item in data:
-        for threshold, value in item.items():
-            if threshold == input_threshold:
-                threshold_list.append(value)
-    return threshold_list
+        np.ndarray: values for the given threshold, with missing values dropped"""
+    column = np.flatnonzero(np.isclose(thresholds, input_threshold))
+    if len(column) == 0:
+        return np.array([])
+    values = np.asarray(matrix[:, column[0]], dtype=np.float64)
+    return values[~np.isnan(values)]
 
 
-def create_precision_boxplot_data(precision_values: list[dict]) -> dict:
+def create_boxplot_data(
+    matrix: np.ndarray, thresholds: np.ndarray, decimals: int = 2
+) -> dict:
     """
-    Create data for precision boxplot
+    Create data for a metric boxplot
 
     Args:
-        precision_values (list): list of precision values
+        matrix (np.ndarray): label x threshold matrix of metric values
+        thresholds (np.ndarray): the thresholds, one per column
+        decimals (int): decimal places to round thresholds to (default 2)
 
     Returns:
-        dict: Dictionary of precision values"""
-    # Drop the label from the dict
-    precision_values = [list(item.values())[0] for item in precision_values]
-
-    # Initialise empty dic
-    precision_plotting_values = {}
-
-    # Loop over threshold values and store the precision values in dict
-    for i in np.arange(0, 1.1, 0.1):
-        threshold_list = get_threshold_values(
-            precision_values,
-            input_threshold=i,
-        )
-        precision_plotting_values[i] = threshold_list
-
-    # Round the keys to 2 decimal places
-    rounded_precision_values = {
-        round(key, 2): value for key, value in precision_plotting_values.items()
+        dict: Dictionary of rounded threshold to values"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    valid = ~np.isnan(matrix)
+    return {
+        round(float(threshold), decimals): matrix[valid[:, idx], idx]
+        for idx, threshold in enumerate(thresholds)
     }
-    return rounded_precision_values
 
 
-def create_recall_boxplot_data(recall_values: list[dict]) -> dict:
+def create_line_data(
+    matrix: np.ndarray, thresholds: np.ndarray, decimals: int = 2
+) -> dict:
     """
-    Create data for recall boxplot
+    Create data for a metric line plot
 
     Args:
-        recall_values (list): list of recall values
+        matrix (np.ndarray): label x threshold matrix of metric values
+        thresholds (np.ndarray): the thresholds, one per column
+        decimals (int): decimal places to round thresholds to (default 2)
 
     Returns:
-        dict: Dictionary of recall values"""
-    # Drop the label from the dict
-    recall_values = [list(item.values())[0] for item in recall_values]
-
-    # Initialise empty dict
-    recall_plotting_values = {}
-
-    # Loop over threshold values and store the recall values in dict
-    for i in np.arange(0, 1.1, 0.1):
-        threshold_list = get_threshold_values(
-            recall_values,
-            input_threshold=i,
-        )
-        recall_plotting_values[i] = threshold_list
-
-    # Round the keys to 2 decimal places
-    rounded_precision_values = {
-        round(key, 2): value for key, value in recall_plotting_values.items()
+        dict: Dictionary of rounded threshold to mean value (rounded to 2 decimal places)"""
+    mean_values = np.round(calculate_mean_values(matrix), 2)
+    return {
+        round(float(threshold), decimals): float(value)
+        for threshold, value in zip(thresholds, mean_values)
     }
-    return rounded_precision_values
-
-
-def create_precision_line_data(precision_values: list[dict]) -> dict:
-    """
-    Create data for precision line plot
-
-    Args:
-        precision_values (list): list of precision values
-
-    Returns:
-        dict: Dictionary of precision values"""
-    # Calculate mean values for each threshold
-    mean_precision_values = calculate_mean_values(precision_values)
-    # Round the keys and values to 2 decimal places
-    mean_precision_values = {
-        round(k, 2): round(v, 2) for k, v in mean_precision_values.items()
-    }
-    return mean_precision_values
-
-
-def create_recall_line_data(recall_values: list[dict]) -> dict:
-    """
-    Create data for recall line plot
-
-    Args:
-        recall_values (list): list of recall values
-
-    Returns:
-        dict: Dictionary of recall values"""
-    # Calculate mean values for each threshold
-    mean_recall_values = calculate_mean_values(recall_values)
-    # Round the keys and values to 2 decimal places
-    mean_recall_values = {
-        round(k, 2): round(v, 2) for k, v in mean_recall_values.items()
-    }
-    return mean_recall_values
-
-
-def create_f2_line_data(f2_values: list[dict]) -> dict:
-    """
-    Create data for F2 line plot
-
-    Args:
-        f2_values (list): list of F2 values
-
-    Returns:
-        dict: Dictionary of F2 values"""
-    # Calculate mean values for each threshold
-    mean_f2_values = calculate_mean_values(f2_values)
-    # Round the keys and values to 2 decimal places
-    mean_f2_values = {round(k, 2): round(v, 2) for k, v in mean_f2_values.items()}
-    return mean_f2_values
 
 
 def calculate_metrics(
@@ -527,6 +463,7 @@ def calculate_metrics(
             collection_name,
             query_embedding,
             similarity_threshold,
+            payload_fields=[],
         )
 
     except Exception as e:
@@ -543,12 +480,14 @@ def calculate_metrics(
     return precision, recall, f2_score
 
 
-def process_labels(unique_labels, regex_ids, model, client, collection_name):
+def process_labels(
+    unique_labels, regex_ids, model, client, collection_name, checkpoint_path=None
+):
     precision_values = []
     recall_values = []
     f2_scores = []
     batch_size = 100
-    num_batches = len(unique_labels) // batch_size + 1
+    num_batches = math.ceil(len(unique_labels) / batch_size)
 
     for batch_idx in range(num_batches):
         start_idx = batch_idx * batch_size
@@ -560,7 +499,7 @@ def process_labels(unique_labels, regex_ids, model, client, collection_name):
             label_recall = {}
             label_f2_scores = {}
 
-            for threshold in np.arange(0, 1.1, 0.1):
+            for threshold in EVALUATION_THRESHOLDS:
                 try:
                     precision, recall, f2_score = calculate_metrics(
                         unique_label=unique_label,
@@ -577,53 +516,391 @@ def process_labels(unique_labels, regex_ids, model, client, collection_name):
                     print(
                         f"Error processing {unique_label} at threshold {threshold}: {e}"
                     )
-                    sleep(0.01)  # Sleep for 10ms to avoid rate limiting
 
             precision_values.append({unique_label: label_precision})
             recall_values.append({unique_label: label_recall})
             f2_scores.append({unique_label: label_f2_scores})
         print(f"Metrics calculated for labels: {start_idx} to {end_idx}")
 
+        # Append the batch to the checkpoint so a crash doesn't lose it
+        if checkpoint_path:
+            metric_matrices = {
+                metric: metric_values_to_matrix(
+                    values[start_idx:end_idx], EVALUATION_THRESHOLDS
+                )[1]
+                for metric, values in [
+                    ("precision", precision_values),
+                    ("recall", recall_values),
+                    ("f2", f2_scores),
+                ]
+            }
+            append_checkpoint(
+                checkpoint_path, batch_labels, EVALUATION_THRESHOLDS, metric_matrices
+            )
+
     return precision_values, recall_values, f2_scores
 
 
-# def process_single_label(unique_label, regex_ids, model, client, collection_name):
-#     label_precision = {}
-#     label_recall = {}
-#     label_f2_scores = {}
-
-#     for threshold in np.arange(0, 1.1, 0.1):
-#         try:
-#             precision, recall, f2_score = calculate_metrics(
-#                 unique_label=unique_label,
-#                 regex_ids=regex_ids,
-#                 model=model,
-#                 client=client,
-#                 similarity_threshold=threshold,
-#                 collection_name=collection_name,
-#             )
-#             label_precision[threshold] = precision
-#             label_recall[threshold] = recall
-#             label_f2_scores[threshold] = f2_score
-#         except Exception as e:
-#             print(f"Error processing {unique_label} at threshold {threshold}: {e}")
-
-#     return {
-#         "precision": {unique_label: label_precision},
-#         "recall": {unique_label: label_recall},
-#         "f2_scores": {unique_label: label_f2_scores},
-#     }
-
-
-# async def process_labels(unique_labels, regex_ids, model, client, collection_name):
-#     tasks = [
-#         process_single_label(label, regex_ids, model, client, collection_name)
-#         for label in unique_labels
-#     ]
-#     results = await asyncio.gather(*tasks)
-
-#     precision_values = [result["precision"] for result in results]
-#     recall_values = [result["recall"] for result in results]
-#     f2_scores = [result["f2_scores"] for result in results]
-
-#     return precision_values, recall_values, f2_scores
+def process_label_rankings(
+    unique_labels: list[str],
+    regex_ids: dict,
+    model: object,
+    client: QdrantClient,
+    collection_name: str,
+    score_threshold: float = float(EVALUATION_THRESHOLDS[0]),
+    batch_size: int = 100,
+) -> list:
+    """
+    Retrieve one scored ranking per label, down to the lowest threshold of
+    interest. Precision, recall and F2 at any threshold can then be computed
+    from the ranking with rankings_to_metric_matrices, instead of querying
+    Qdrant once per threshold.
+
+    Args:
+        unique_labels (list[str]): The labels to evaluate
+        regex_ids (dict): The dictionary of regex IDs
+        model (Any): The model object
+        client (QdrantClient): The client object
+        collection_name (str): The name of the collection
+        score_threshold (float): The lowest similarity threshold to rank down to.
+            Defaults to the lowest of EVALUATION_THRESHOLDS.
+        batch_size (int): Number of labels between progress reports. Defaults to 100.
+
+    Returns:
+        list: (scores, relevant, n_relevant) per label, or None where the search failed
+    """
+    rankings = []
+    for label_idx, unique_label in enumerate(unique_labels):
+        try:
+            relevant_records = regex_ids[unique_label]
+            query_embedding = model.encode(unique_label)
+            results = get_semantically_similar_results(
+                client,
+                collection_name,
+                query_embedding,
+                score_threshold,
+                payload_fields=[],
+            )
+            rankings.append(build_label_ranking(results, relevant_records))
+        except Exception as e:
+            print(f"Error ranking {unique_label}: {e}")
+            rankings.append(None)
+
+        if (label_idx + 1) % batch_size == 0 or label_idx + 1 == len(unique_labels):
+            print(
+                f"Rankings retrieved for {label_idx + 1} of {len(unique_labels)} labels"
+            )
+
+    return rankings
+
+
+def process_labels_bitset(
+    unique_labels: list[str],
+    regex_ids: dict,
+    model: object,
+    client: QdrantClient,
+    collection_name: str,
+    batch_size: int = 100,
+    checkpoint_path: str = None,
+) -> tuple:
+    """
+    Version of process_labels that maps feedback IDs to dense positions once
+    and scores each batch of labels as a single bitset operation, instead of
+    building Python sets for every label and threshold. Runs the same searches
+    as process_labels and returns the same values, as label x threshold matrices.
+
+    Args:
+        unique_labels (list[str]): The labels to evaluate
+        regex_ids (dict): The dictionary of regex IDs
+        model (Any): The model object
+        client (QdrantClient): The client object
+        collection_name (str): The name of the collection
+        batch_size (int): Number of labels scored together. Defaults to 100.
+        checkpoint_path (str, optional): Append each batch's results to this file.
+
+    Returns:
+        np.ndarray: (n_labels, n_thresholds) precision, NaN where the search failed
+        np.ndarray: (n_labels, n_thresholds) recall, NaN where the search failed
+        np.ndarray: (n_labels, n_thresholds) F2 score, NaN where the search failed
+    """
+    thresholds = EVALUATION_THRESHOLDS
+    id_positions = build_id_positions(regex_ids.values())
+    shape = (len(unique_labels), len(thresholds))
+    precision_matrix = np.full(shape, np.nan)
+    recall_matrix = np.full(shape, np.nan)
+    f2_matrix = np.full(shape, np.nan)
+
+    for start_idx in range(0, len(unique_labels), batch_size):
+        end_idx = min(start_idx + batch_size, len(unique_labels))
+        batch_labels = unique_labels[start_idx:end_idx]
+
+        retrieved_ids = []
+        retrieved_counts = np.full((len(batch_labels), len(thresholds)), np.nan)
+        relevant_ids = []
+        for label_idx, unique_label in enumerate(batch_labels):
+            label_retrieved_ids = [[] for _ in thresholds]
+            try:
+                relevant_ids.append(regex_ids[unique_label])
+                query_embedding = model.encode(unique_label)
+            except Exception as e:
+                print(f"Error processing {unique_label}: {e}")
+                relevant_ids.append([])
+                retrieved_ids.append(label_retrieved_ids)
+                continue
+
+            for threshold_idx, threshold in enumerate(thresholds):
+                try:
+                    results = get_semantically_similar_results(
+                        client,
+                        collection_name,
+                        query_embedding,
+                        threshold,
+                        payload_fields=[],
+                    )
+                except Exception as e:
+                    print(
+                        f"get_semantically_similar_results error for {unique_label}: {e}"
+                    )
+                    continue
+                label_retrieved_ids[threshold_idx] = [
+                    str(result.id) for result in results
+                ]
+                retrieved_counts[label_idx, threshold_idx] = len(results)
+            retrieved_ids.append(label_retrieved_ids)
+
+        # Score the whole batch at once
+        retrieved_bitsets = ids_to_bitsets(
+            [ids for label_ids in retrieved_ids for ids in label_ids], id_positions
+        ).reshape(len(batch_labels), len(thresholds), -1)
+        relevant_bitsets = ids_to_bitsets(relevant_ids, id_positions)
+        relevant_counts = [len(ids) for ids in relevant_ids]
+
+        precision, recall, f2_score = calculate_metric_matrices(
+            retrieved_bitsets, retrieved_counts, relevant_bitsets, relevant_counts
+        )
+        precision_matrix[start_idx:end_idx] = precision
+        recall_matrix[start_idx:end_idx] = recall
+        f2_matrix[start_idx:end_idx] = f2_score
+        print(f"Metrics calculated for labels: {start_idx} to {end_idx}")
+
+        # Append the batch to the checkpoint so a crash doesn't lose it
+        if checkpoint_path:
+            append_checkpoint(
+                checkpoint_path,
+                batch_labels,
+                thresholds,
+                {"precision": precision, "recall": recall, "f2": f2_score},
+            )
+
+    return precision_matrix, recall_matrix, f2_matrix
+
+
+async def calculate_metrics_async(
+    unique_label: str,
+    query_embedding,
+    regex_ids: dict,
+    client: AsyncQdrantClient,
+    similarity_threshold: float,
+    collection_name: str,
+    request_timeout: float,
+):
+    """
+    Calculate precision, recall and f2 score for a given label using the async client.
+    Mirrors calculate_metrics, but takes a precomputed query embedding so each label
+    is only encoded once across all thresholds.
+
+    Args:
+        unique_label (str): The unique label
+        query_embedding (list): The embedded label
+        regex_ids (dict): The dictionary of regex IDs
+        client (AsyncQdrantClient): The async client object
+        similarity_threshold (float): The similarity threshold
+        collection_name (str): The name of the collection
+        request_timeout (float): Seconds to wait for the search before giving up
+
+    Returns:
+        float: Precision
+        float: Recall
+        float: F2 score
+    """
+    # Get the count of records from the regex counts
+    relevant_records = regex_ids[unique_label]
+
+    # Retrieve the top K results for the label
+    try:
+        results = await asyncio.wait_for(
+            get_semantically_similar_results_async(
+                client,
+                collection_name,
+                query_embedding,
+                similarity_threshold,
+                payload_fields=[],
+            ),
+            timeout=request_timeout,
+        )
+    except asyncio.TimeoutError:
+        print(
+            f"get_semantically_similar_results error for {unique_label}: timed out after {request_timeout}s"
+        )
+        return None, None, None
+    except Exception as e:
+        print(f"get_semantically_similar_results error for {unique_label}: {e}")
+        return None, None, None
+
+    result_ids = [str(result.id) for result in results]
+
+    # Calculate precision and recall
+    precision = calculate_precision(result_ids, relevant_records)
+    recall = calculate_recall(result_ids, relevant_records)
+    f2_score = calculate_f2_score(precision, recall)
+
+    return precision, recall, f2_score
+
+
+async def process_labels_async(
+    unique_labels: list[str],
+    regex_ids: dict,
+    model: object,
+    client: AsyncQdrantClient,
+    collection_name: str,
+    max_concurrency: int = 10,
+    request_timeout: float = 60.0,
+    batch_size: int = 100,
+    checkpoint_path: str = None,
+):
+    """
+    Concurrent version of process_labels. A fixed pool of workers pulls
+    (label, threshold) searches from a bounded queue, so at most max_concurrency
+    requests are in flight and labels are only encoded as workers free up.
+    The outputs are identical to process_labels, in the same order.
+
+    Args:
+        unique_labels (list[str]): The labels to evaluate
+        regex_ids (dict): The dictionary of regex IDs
+        model (Any): The model object
+        client (AsyncQdrantClient): The async client object
+        collection_name (str): The name of the collection
+        max_concurrency (int): Maximum number of searches in flight. Defaults to 10.
+        request_timeout (float): Seconds to wait for each search. Defaults to 60.
+        batch_size (int): Number of completed labels between progress reports
+            and checkpoint writes. Defaults to 100.
+        checkpoint_path (str, optional): Append each batch of completed labels
+            to this file.
+
+    Returns:
+        list[dict]: Precision values per label and threshold
+        list[dict]: Recall values per label and threshold
+        list[dict]: F2 scores per label and threshold
+    """
+    thresholds = EVALUATION_THRESHOLDS
+    # Marks thresholds that errored, these are left out as in process_labels
+    missing = object()
+    label_metrics = [[missing] * len(thresholds) for _ in unique_labels]
+    remaining = [len(thresholds)] * len(unique_labels)
+    completed_labels = 0
+
+    # Bounded queue provides backpressure: the producer waits while workers are busy
+    queue = asyncio.Queue(maxsize=max_concurrency * 2)
+
+    pending_checkpoint = []
+
+    def write_checkpoint():
+        metric_matrices = {
+            metric: np.full((len(pending_checkpoint), len(thresholds)), np.nan)
+            for metric in ["precision", "recall", "f2"]
+        }
+        for row, label_idx in enumerate(pending_checkpoint):
+            for threshold_idx, threshold_metrics in enumerate(label_metrics[label_idx]):
+                if threshold_metrics is missing:
+                    continue
+                for metric, value in zip(metric_matrices, threshold_metrics):
+                    if value is not None:
+                        metric_matrices[metric][row, threshold_idx] = value
+        append_checkpoint(
+            checkpoint_path,
+            [unique_labels[label_idx] for label_idx in pending_checkpoint],
+            thresholds,
+            metric_matrices,
+        )
+        pending_checkpoint.clear()
+
+    def mark_done(label_idx: int, n_thresholds: int = 1):
+        nonlocal completed_labels
+        remaining[label_idx] -= n_thresholds
+        if remaining[label_idx] == 0:
+            completed_labels += 1
+            all_completed = completed_labels == len(unique_labels)
+            if checkpoint_path:
+                pending_checkpoint.append(label_idx)
+                if len(pending_checkpoint) >= batch_size or all_completed:
+                    write_checkpoint()
+            if completed_labels % batch_size == 0 or all_completed:
+                print(
+                    f"Metrics calculated for {completed_labels} of {len(unique_labels)} labels"
+                )
+
+    async def produce():
+        for label_idx, unique_label in enumerate(unique_labels):
+            # Encode off the event loop so in-flight searches keep being handled
+            try:
+                query_embedding = await asyncio.to_thread(model.encode, unique_label)
+            except Exception as e:
+                for threshold in thresholds:
+                    print(
+                        f"Error processing {unique_label} at threshold {threshold}: {e}"
+                    )
+                mark_done(label_idx, len(thresholds))
+                continue
+
+            for threshold_idx in range(len(thresholds)):
+                await queue.put((label_idx, threshold_idx, query_embedding))
+
+        # One stop signal per worker
+        for _ in range(max_concurrency):
+            await queue.put(None)
+
+    async def work():
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            label_idx, threshold_idx, query_embedding = item
+            unique_label = unique_labels[label_idx]
+            threshold = thresholds[threshold_idx]
+            try:
+                label_metrics[label_idx][threshold_idx] = await calculate_metrics_async(
+                    unique_label=unique_label,
+                    query_embedding=query_embedding,
+                    regex_ids=regex_ids,
+                    client=client,
+                    similarity_threshold=threshold,
+                    collection_name=collection_name,
+                    request_timeout=request_timeout,
+                )
+            except Exception as e:
+                print(f"Error processing {unique_label} at threshold {threshold}: {e}")
+            mark_done(label_idx)
+
+    await asyncio.gather(produce(), *[work() for _ in range(max_concurrency)])
+
+    # Assemble in label and threshold order, matching process_labels
+    precision_values = []
+    recall_values = []
+    f2_scores = []
+    for unique_label, metrics in zip(unique_labels, label_metrics):
+        label_precision = {}
+        label_recall = {}
+        label_f2_scores = {}
+        for threshold, threshold_metrics in zip(thresholds, metrics):
+            if threshold_metrics is missing:
+                continue
+            precision, recall, f2_score = threshold_metrics
+            label_precision[threshold] = precision
+            label_recall[threshold] = recall
+            label_f2_scores[threshold] = f2_score
+
+        precision_values.append({unique_label: label_precision})
+        recall_values.append({unique_label: label_recall})
+        f2_scores.append({unique_label: label_f2_scores})
+
+    return precision_values, recall_values, f2_scores
@@ -0,0 +1,399 @@
+import json
+import os
+
+import numpy as np
+
+METRICS = ["precision", "recall", "f2"]
+
+
+def metric_values_to_matrix(
+    metric_values: list[dict], thresholds: np.ndarray
+) -> tuple[list[str], np.ndarray]:
+    """
+    Convert metric values in the process_labels format, a list of
+    {label: {threshold: value}}, into a dense label x threshold matrix.
+    Thresholds are matched to columns after rounding, rather than by float
+    equality, and missing or failed values are stored as NaN.
+
+    Args:
+        metric_values (list[dict]): list of {label: {threshold: value}}
+        thresholds (np.ndarray): the thresholds evaluated, one per column
+
+    Returns:
+        list[str]: The labels, one per row
+        np.ndarray: Matrix of shape (n_labels, n_thresholds)
+    """
+    columns = {
+        round(float(threshold), 6): idx for idx, threshold in enumerate(thresholds)
+    }
+    labels = []
+    matrix = np.full((len(metric_values), len(thresholds)), np.nan)
+
+    for row, item in enumerate(metric_values):
+        for label, values in item.items():
+            labels.append(label)
+            for threshold, value in values.items():
+                if value is not None:
+                    matrix[row, columns[round(float(threshold), 6)]] = value
+
+    return labels, matrix
+
+
+def save_evaluation_results(
+    results_dir: str,
+    labels: list[str],
+    thresholds: np.ndarray,
+    metric_matrices: dict,
+):
+    """
+    Save evaluation results as one .npy file per metric, with a shared label
+    index and threshold array, so they can be memory-mapped when loaded.
+
+    Args:
+        results_dir (str): directory to write the results to
+        labels (list[str]): the labels, one per matrix row
+        thresholds (np.ndarray): the thresholds, one per matrix column
+        metric_matrices (dict): metric name to matrix of shape (n_labels, n_thresholds)
+    """
+    os.makedirs(results_dir, exist_ok=True)
+
+    with open(os.path.join(results_dir, "labels.json"), "w") as f:
+        json.dump(list(labels), f)
+
+    np.save(os.path.join(results_dir, "thresholds.npy"), np.asarray(thresholds))
+
+    for metric, matrix in metric_matrices.items():
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if matrix.shape != (len(labels), len(thresholds)):
+            raise ValueError(
+                f"{metric} matrix has shape {matrix.shape}, expected {(len(labels), len(thresholds))}"
+            )
+        np.save(os.path.join(results_dir, f"{metric}.npy"), matrix)
+
+
+def evaluation_results_exist(results_dir: str, metrics: list[str] = METRICS) -> bool:
+    """
+    Check whether a complete set of evaluation results has been saved
+
+    Args:
+        results_dir (str): directory the results were written to
+        metrics (list[str]): metrics expected. Defaults to METRICS.
+
+    Returns:
+        bool: True if the label index, thresholds and all metrics exist
+    """
+    required_files = ["labels.json", "thresholds.npy"] + [
+        f"{metric}.npy" for metric in metrics
+    ]
+    return os.path.isdir(results_dir) and all(
+        os.path.exists(os.path.join(results_dir, file)) for file in required_files
+    )
+
+
+def load_evaluation_results(
+    results_dir: str, metrics: list[str] = METRICS, mmap_mode: str = "r"
+) -> dict:
+    """
+    Load evaluation results saved by save_evaluation_results. Metric matrices
+    are memory-mapped by default, so only the parts read are loaded.
+
+    Args:
+        results_dir (str): directory the results were written to
+        metrics (list[str]): metrics to load. Defaults to METRICS.
+        mmap_mode (str): passed to np.load. Defaults to "r".
+
+    Returns:
+        dict: "labels", "thresholds" and one matrix per metric
+    """
+    with open(os.path.join(results_dir, "labels.json"), "r") as f:
+        labels = json.load(f)
+
+    results = {
+        "labels": labels,
+        "thresholds": np.load(os.path.join(results_dir, "thresholds.npy")),
+    }
+    for metric in metrics:
+        results[metric] = np.load(
+            os.path.join(results_dir, f"{metric}.npy"), mmap_mode=mmap_mode
+        )
+    return results
+
+
+def save_label_rankings(rankings_dir: str, labels: list[str], rankings: list):
+    """
+    Save one scored ranking per label as flat arrays with offsets, so curves
+    can be recomputed at any threshold resolution without querying Qdrant.
+
+    Args:
+        rankings_dir (str): directory to write the rankings to
+        labels (list[str]): the labels, one per ranking
+        rankings (list): (scores, relevant, n_relevant) per label, or None where
+            the search for that label failed
+    """
+    os.makedirs(rankings_dir, exist_ok=True)
+
+    with open(os.path.join(rankings_dir, "labels.json"), "w") as f:
+        json.dump(list(labels), f)
+
+    lengths = [len(ranking[0]) if ranking is not None else 0 for ranking in rankings]
+    offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+    scores = [ranking[0] for ranking in rankings if ranking is not None]
+    relevant = [ranking[1] for ranking in rankings if ranking is not None]
+    # -1 marks labels whose search failed
+    n_relevant = [ranking[2] if ranking is not None else -1 for ranking in rankings]
+
+    np.save(os.path.join(rankings_dir, "offsets.npy"), offsets)
+    np.save(
+        os.path.join(rankings_dir, "scores.npy"),
+        np.concatenate(scores).astype(np.float32) if scores else np.array([]),
+    )
+    np.save(
+        os.path.join(rankings_dir, "relevant.npy"),
+        np.concatenate(relevant).astype(bool) if relevant else np.array([], bool),
+    )
+    np.save(
+        os.path.join(rankings_dir, "n_relevant.npy"), np.array(n_relevant, np.int64)
+    )
+
+
+def label_rankings_exist(rankings_dir: str) -> bool:
+    """
+    Check whether label rankings have been saved
+
+    Args:
+        rankings_dir (str): directory the rankings were written to
+
+    Returns:
+        bool: True if all ranking files exist
+    """
+    required_files = [
+        "labels.json",
+        "offsets.npy",
+        "scores.npy",
+        "relevant.npy",
+        "n_relevant.npy",
+    ]
+    return os.path.isdir(rankings_dir) and all(
+        os.path.exists(os.path.join(rankings_dir, file)) for file in required_files
+    )
+
+
+def load_label_rankings(rankings_dir: str, mmap_mode: str = "r") -> tuple:
+    """
+    Load label rankings saved by save_label_rankings
+
+    Args:
+        rankings_dir (str): directory the rankings were written to
+        mmap_mode (str): passed to np.load. Defaults to "r".
+
+    Returns:
+        list[str]: The labels
+        list: (scores, relevant, n_relevant) per label, or None where the
+            search for that label failed
+    """
+    with open(os.path.join(rankings_dir, "labels.json"), "r") as f:
+        labels = json.load(f)
+
+    offsets = np.load(os.path.join(rankings_dir, "offsets.npy"))
+    scores = np.load(os.path.join(rankings_dir, "scores.npy"), mmap_mode=mmap_mode)
+    relevant = np.load(os.path.join(rankings_dir, "relevant.npy"), mmap_mode=mmap_mode)
+    n_relevant = np.load(os.path.join(rankings_dir, "n_relevant.npy"))
+
+    rankings = []
+    for idx in range(len(labels)):
+        if n_relevant[idx] < 0:
+            rankings.append(None)
+            continue
+        start, end = offsets[idx], offsets[idx + 1]
+        rankings.append((scores[start:end], relevant[start:end], int(n_relevant[idx])))
+    return labels, rankings
+
+
+def append_checkpoint(
+    checkpoint_path: str,
+    labels: list[str],
+    thresholds: np.ndarray,
+    metric_matrices: dict,
+):
+    """
+    Append the results for a batch of labels to an append-only JSON lines
+    checkpoint, one line per label, and flush them to disk. Labels with a
+    missing value, where a search failed or timed out, are marked "failed"
+    so a resumed run retries them.
+
+    Args:
+        checkpoint_path (str): the checkpoint file to append to
+        labels (list[str]): the labels in the batch, one per matrix row
+        thresholds (np.ndarray): the thresholds, one per matrix column
+        metric_matrices (dict): metric name to matrix of shape (n_labels, n_thresholds)
+    """
+    checkpoint_dir = os.path.dirname(checkpoint_path)
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    # Terminate a partly written line left by a killed run before appending
+    if os.path.exists(checkpoint_path) and os.path.getsize(checkpoint_path):
+        with open(checkpoint_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                with open(checkpoint_path, "a") as f_append:
+                    f_append.write("\n")
+
+    thresholds = [round(float(threshold), 6) for threshold in thresholds]
+    with open(checkpoint_path, "a") as f:
+        for row, label in enumerate(labels):
+            line = {"label": label, "thresholds": thresholds}
+            for metric, matrix in metric_matrices.items():
+                line[metric] = [
+                    None if np.isnan(value) else float(value) for value in matrix[row]
+                ]
+            line["failed"] = any(
+                value is None for metric in metric_matrices for value in line[metric]
+            )
+            f.write(json.dumps(line) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def shard_checkpoint_path(
+    checkpoint_dir: str, shard_index: int, num_shards: int
+) -> str:
+    """Checkpoint file of one shard of a run split into num_shards shards"""
+    return os.path.join(checkpoint_dir, f"shard_{shard_index}_of_{num_shards}.jsonl")
+
+
+def load_checkpoints(
+    checkpoint_paths: list[str],
+    thresholds: np.ndarray = None,
+    include_failed: bool = True,
+) -> dict:
+    """
+    Load the label results from one or more checkpoint files. A partly written
+    final line, from a run that was killed mid-write, is skipped. Where a label
+    appears more than once the last result wins.
+
+    Args:
+        checkpoint_paths (list[str]): checkpoint files to read
+        thresholds (np.ndarray, optional): the thresholds of the current run.
+            If given, every result must have been written with the same grid.
+        include_failed (bool): Whether to return labels whose last result is
+            marked failed. Defaults to True.
+
+    Returns:
+        dict: label to its checkpoint line
+
+    Raises:
+        ValueError: if a result was written with a different threshold grid
+    """
+    expected = (
+        None
+        if thresholds is None
+        else [round(float(threshold), 6) for threshold in thresholds]
+    )
+    completed = {}
+    for checkpoint_path in checkpoint_paths:
+        if not os.path.exists(checkpoint_path):
+            continue
+        with open(checkpoint_path, "r") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"Skipping incomplete line in {checkpoint_path}")
+                    continue
+                if expected is not None and result["thresholds"] != expected:
+                    raise ValueError(
+                        f"{checkpoint_path} was written with thresholds {result['thresholds']}, "
+                        f"but this run uses {expected}. Start a new checkpoint, "
+                        "without resuming, or evaluate with the original thresholds."
+                    )
+                completed[result["label"]] = result
+    if not include_failed:
+        completed = {
+            label: result
+            for label, result in completed.items()
+            if not result.get("failed")
+        }
+    return completed
+
+
+def remaining_labels(
+    labels: list[str], checkpoint_path: str, thresholds: np.ndarray
+) -> list[str]:
+    """
+    The labels without a result in a checkpoint, or whose last result failed,
+    for resuming a run
+
+    Args:
+        labels (list[str]): the labels to evaluate
+        checkpoint_path (str): the checkpoint file of the run
+        thresholds (np.ndarray): the thresholds of the current run
+
+    Returns:
+        list[str]: the labels still to evaluate, in their original order
+
+    Raises:
+        ValueError: if the checkpoint was written with a different threshold grid
+    """
+    completed = load_checkpoints([checkpoint_path], thresholds, include_failed=False)
+    return [label for label in labels if label not in completed]
+
+
+def merge_checkpoints(
+    checkpoint_paths: list[str],
+    labels: list[str],
+    thresholds: np.ndarray,
+    metrics: list[str] = METRICS,
+) -> dict:
+    """
+    Merge checkpoint files, e.g. from label shards run in separate processes,
+    into label x threshold matrices in the given label order. Labels without a
+    result are left as NaN. Each label must only appear in one file.
+
+    Args:
+        checkpoint_paths (list[str]): checkpoint files to merge
+        labels (list[str]): the labels, in the row order wanted
+        thresholds (np.ndarray): the thresholds, in the column order wanted
+        metrics (list[str]): metrics to merge. Defaults to METRICS.
+
+    Returns:
+        dict: metric name to matrix of shape (n_labels, n_thresholds)
+
+    Raises:
+        ValueError: if a checkpoint was written with a different threshold
+            grid, or a label appears in more than one checkpoint
+    """
+    completed = {}
+    for checkpoint_path in checkpoint_paths:
+        results = load_checkpoints([checkpoint_path], thresholds)
+        overlap = completed.keys() & results.keys()
+        if overlap:
+            raise ValueError(
+                f"{len(overlap)} labels in {checkpoint_path} are also in another "
+                f"checkpoint, e.g. {sorted(overlap)[0]!r}. Merge checkpoints from "
+                "one sharded run only."
+            )
+        completed.update(results)
+    columns = {
+        round(float(threshold), 6): idx for idx, threshold in enumerate(thresholds)
+    }
+    matrices = {
+        metric: np.full((len(labels), len(thresholds)), np.nan) for metric in metrics
+    }
+
+    n_missing = 0
+    for row, label in enumerate(labels):
+        if label not in completed:
+            n_missing += 1
+            continue
+        result = completed[label]
+        for threshold, *values in zip(
+            result["thresholds"], *[result[metric] for metric in metrics]
+        ):
+            for metric, value in zip(metrics, values):
+                if value is not None:
+                    matrices[metric][row, columns[threshold]] = value
+
+    if n_missing:
+        print(f"{n_missing} of {len(labels)} labels have no checkpointed results")
+    return matrices
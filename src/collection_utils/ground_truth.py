@@ -0,0 +1,164 @@
+from collections import Counter, deque
+
+
+def normalise_label(label: str) -> str:
+    """
+    Normalise a label for matching: drop square brackets, strip whitespace
+    and lowercase, so matching is case-insensitive as in get_regex_ids.
+
+    Args:
+        label (str): The label to normalise.
+
+    Returns:
+        str: The normalised label.
+    """
+    return label.replace("[", "").replace("]", "").strip().lower()
+
+
+def split_record_labels(labels: str) -> list[str]:
+    """
+    Split a record's comma separated labels string into normalised labels.
+
+    Args:
+        labels (str): Labels joined with ", " as returned by query_evaluation_data.
+
+    Returns:
+        list[str]: The normalised labels of the record.
+    """
+    return [normalise_label(label) for label in labels.split(",")]
+
+
+def build_label_automaton(labels: list[str]) -> tuple[list, list, list]:
+    """
+    Build an Aho-Corasick automaton over the given labels, so that all of them
+    can be found in a piece of text in a single scan.
+
+    Args:
+        labels (list[str]): Normalised, non-empty labels to search for.
+
+    Returns:
+        list[dict]: Goto transitions for each state.
+        list[int]: Failure link for each state.
+        list[list[int]]: Indexes of the labels that end at each state.
+    """
+    goto = [{}]
+    fail = [0]
+    output = [[]]
+
+    # Build the trie of labels
+    for label_idx, label in enumerate(labels):
+        state = 0
+        for char in label:
+            if char not in goto[state]:
+                goto.append({})
+                fail.append(0)
+                output.append([])
+                goto[state][char] = len(goto) - 1
+            state = goto[state][char]
+        output[state].append(label_idx)
+
+    # Add failure links breadth first, merging the outputs of suffix states
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for char, next_state in goto[state].items():
+            queue.append(next_state)
+            fallback = fail[state]
+            while fallback and char not in goto[fallback]:
+                fallback = fail[fallback]
+            fail[next_state] = goto[fallback].get(char, 0)
+            output[next_state] = output[next_state] + output[fail[next_state]]
+
+    return goto, fail, output
+
+
+def find_label_matches(text: str, automaton: tuple[list, list, list]) -> list:
+    """
+    Scan text once with the automaton and return every label occurrence.
+
+    Args:
+        text (str): The normalised text to scan.
+        automaton (tuple): The automaton returned by build_label_automaton.
+
+    Returns:
+        list[tuple[int, int]]: (label index, end position) for each occurrence,
+            in order of end position.
+    """
+    goto, fail, output = automaton
+    matches = []
+    state = 0
+    for position, char in enumerate(text):
+        while state and char not in goto[state]:
+            state = fail[state]
+        state = goto[state].get(char, 0)
+        for label_idx in output[state]:
+            matches.append((label_idx, position))
+    return matches
+
+
+def build_ground_truth_index(
+    data: list[dict], unique_labels: list[str]
+) -> tuple[dict, dict]:
+    """
+    Build the ground truth for evaluation in a single pass over the records.
+    A record is relevant to a label when the label appears, case-insensitively,
+    as a substring of any of the record's labels. Labels are matched literally
+    rather than as regular expressions.
+
+    Each distinct record label is scanned once with an Aho-Corasick automaton
+    of all unique labels, and the matches are reused for every record sharing
+    that label.
+
+    Args:
+        data (list[dict]): The list of id, labels, and urgency.
+        unique_labels (list[str]): The labels to build the ground truth for.
+
+    Returns:
+        dict: Label to list of matching record IDs, in record order.
+        dict: Label to {"label", "n_matches"}, the number of non-overlapping
+            occurrences of the label across all record labels.
+    """
+    # Tokenise each record's labels once, counting how often each one appears
+    record_tokens = [split_record_labels(record["labels"]) for record in data]
+    token_counts = Counter(token for tokens in record_tokens for token in tokens)
+
+    normalised_labels = [normalise_label(label) for label in unique_labels]
+    searchable = [idx for idx, label in enumerate(normalised_labels) if label]
+    automaton = build_label_automaton([normalised_labels[idx] for idx in searchable])
+
+    # Scan each distinct record label once
+    token_matches = {}
+    label_counts = [0] * len(unique_labels)
+    for token, token_count in token_counts.items():
+        matched = set()
+        last_end = {}
+        for match_idx, end in find_label_matches(token, automaton):
+            label_idx = searchable[match_idx]
+            matched.add(label_idx)
+            # Count non-overlapping occurrences, as re.findall would
+            start = end - len(normalised_labels[label_idx]) + 1
+            if start > last_end.get(label_idx, -1):
+                last_end[label_idx] = end
+                label_counts[label_idx] += token_count
+        token_matches[token] = matched
+
+    # Empty labels match every record, as an empty pattern does with re.search
+    empty_labels = [idx for idx, label in enumerate(normalised_labels) if not label]
+
+    label_ids = [[] for _ in unique_labels]
+    for record, tokens in zip(data, record_tokens):
+        matched = set(empty_labels)
+        for token in tokens:
+            matched.update(token_matches[token])
+        for label_idx in matched:
+            label_ids[label_idx].append(record["id"])
+
+    for label_idx in empty_labels:
+        label_counts[label_idx] = len(data)
+
+    ground_truth_ids = {label: ids for label, ids in zip(unique_labels, label_ids)}
+    ground_truth_counts = {
+        label: {"label": label, "n_matches": count}
+        for label, count in zip(unique_labels, label_counts)
+    }
+    return ground_truth_ids, ground_truth_counts
@@ -0,0 +1,395 @@
+import json
+import os
+
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Record, ScoredPoint
+
+# Files of a local collection, in a directory named after the collection
+EMBEDDINGS_FILE = "embeddings.npy"
+IDS_FILE = "ids.npy"
+PAYLOAD_FILE = "payload.json"
+META_FILE = "meta.json"
+
+# Matches the limit the Qdrant searches use, i.e. every result
+SEARCH_LIMIT = 10000000
+
+
+class PayloadColumn:
+    """
+    One payload field of a local collection, stored as a column. Values are
+    factorised into integer codes so filters are boolean masks built with
+    np.isin. List values, such as labels, are flattened, with the row of each
+    element, so a point matches if any of its elements does.
+    """
+
+    def __init__(self, values: list, missing: list = ()):
+        self.values = np.empty(len(values), dtype=object)
+        self.values[:] = values
+        self.present = np.ones(len(values), dtype=bool)
+        self.present[list(missing)] = False
+
+        categories = {}
+        rows = []
+        codes = []
+        for row, value in enumerate(values):
+            elements = value if isinstance(value, list) else [value]
+            for element in elements:
+                if isinstance(element, (dict, list)):
+                    continue
+                rows.append(row)
+                codes.append(categories.setdefault(element, len(categories)))
+        self.categories = categories
+        self.rows = np.array(rows, dtype=np.int64)
+        self.codes = np.array(codes, dtype=np.int64)
+
+    def mask(self, match_values: list) -> np.ndarray:
+        """
+        Rows with a value, or list element, in match_values, as MatchAny
+
+        Args:
+            match_values (list): values to match
+
+        Returns:
+            np.ndarray: boolean mask over the rows
+        """
+        wanted = [
+            self.categories[value]
+            for value in match_values
+            if value is not None and value in self.categories
+        ]
+        mask = np.zeros(len(self.values), dtype=bool)
+        mask[self.rows[np.isin(self.codes, wanted)]] = True
+        return mask & self.present
+
+
+class LocalCollection:
+    """
+    Exact, in-process search over a collection saved with
+    save_local_collection. The embeddings are memory-mapped, so only the
+    pages a search touches are read, and payloads are held as columns.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, META_FILE), "r") as f:
+            self.meta = json.load(f)
+        self.embeddings = np.load(os.path.join(path, EMBEDDINGS_FILE), mmap_mode="r")
+        self.ids = np.load(os.path.join(path, IDS_FILE))
+        with open(os.path.join(path, PAYLOAD_FILE), "r") as f:
+            payload = json.load(f)
+        self.columns = {
+            field: PayloadColumn(values, payload["missing"].get(field, []))
+            for field, values in payload["columns"].items()
+        }
+
+    def __len__(self):
+        return len(self.ids)
+
+    def filter_mask(self, filter_dict: dict = {}) -> np.ndarray:
+        """
+        Rows matching every non-empty filter, as the Qdrant filter built from
+        filter_dict. A field the collection doesn't have matches nothing.
+
+        Args:
+            filter_dict (dict): The keys and values to filter on.
+
+        Returns:
+            np.ndarray: boolean mask over the rows
+        """
+        mask = np.ones(len(self), dtype=bool)
+        for filter_key, filter_values in filter_dict.items():
+            if not filter_values:
+                continue
+            if filter_key not in self.columns:
+                return np.zeros(len(self), dtype=bool)
+            mask &= self.columns[filter_key].mask(filter_values)
+        return mask
+
+    def score(self, query_embedding, rows: np.ndarray = None) -> np.ndarray:
+        """
+        Score the query against every row, or the given rows, with the
+        collection's distance
+
+        Args:
+            query_embedding (list): The query vector.
+            rows (np.ndarray, optional): Row indices to score. Defaults to None, all rows.
+
+        Returns:
+            np.ndarray: float32 scores
+        """
+        query = np.asarray(query_embedding, dtype=np.float32)
+        if self.meta["distance"] == "Cosine":
+            # Stored embeddings are normalised when saved
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+        embeddings = self.embeddings if rows is None else self.embeddings[rows]
+        return embeddings @ query
+
+    def search(
+        self,
+        query_embedding,
+        score_threshold: float = None,
+        filter_dict: dict = {},
+        limit: int = SEARCH_LIMIT,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top k search
+
+        Args:
+            query_embedding (list): The query vector.
+            score_threshold (float, optional): The minimum score to return. Defaults to None.
+            filter_dict (dict, optional): The keys and values to filter on. Defaults to {}.
+            limit (int, optional): The most results to return. Defaults to all.
+
+        Returns:
+            np.ndarray: row indices, best first
+            np.ndarray: their scores
+        """
+        mask = self.filter_mask(filter_dict)
+        if mask.all():
+            rows = np.arange(len(self))
+            scores = self.score(query_embedding)
+        else:
+            rows = np.flatnonzero(mask)
+            scores = self.score(query_embedding, rows)
+        if score_threshold is not None:
+            above = scores >= score_threshold
+            rows, scores = rows[above], scores[above]
+        # Partition out the top k before sorting them, rather than sorting all
+        if limit < len(scores):
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return rows[order], scores[order]
+
+    def payloads(self, rows: np.ndarray, payload_fields: list[str] = None) -> list:
+        """
+        Build the payloads of rows from the columns
+
+        Args:
+            rows (np.ndarray): row indices
+            payload_fields (list[str], optional): The payload fields to return. An empty
+                list returns no payload. Defaults to None, the full payload.
+
+        Returns:
+            list: a payload dict per row, or None per row for no payload
+        """
+        if payload_fields is not None and not payload_fields:
+            return [None] * len(rows)
+        fields = self.columns if payload_fields is None else payload_fields
+        columns = [
+            (field, self.columns[field]) for field in fields if field in self.columns
+        ]
+        return [
+            {
+                field: column.values[row]
+                for field, column in columns
+                if column.present[row]
+            }
+            for row in rows
+        ]
+
+
+class LocalSearchClient:
+    """
+    Directory of local collections, loaded on first use, that can be passed
+    as the client of get_semantically_similar_results and filter_search in
+    place of a QdrantClient
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.collections = {}
+
+    def get_collection(self, collection_name: str) -> LocalCollection:
+        if collection_name not in self.collections:
+            collection_path = os.path.join(self.path, collection_name)
+            if not os.path.exists(os.path.join(collection_path, META_FILE)):
+                raise ValueError(f"No local collection at {collection_path}")
+            self.collections[collection_name] = LocalCollection(collection_path)
+        return self.collections[collection_name]
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return os.path.exists(os.path.join(self.path, collection_name, META_FILE))
+
+
+def get_semantically_similar_results(
+    client: LocalSearchClient,
+    collection_name: str,
+    query_embedding,
+    score_threshold: float,
+    filter_dict={},
+    payload_fields: list[str] = None,
+):
+    """Retrieve top k results from a local collection
+
+    Args:
+        client (LocalSearchClient): The local search client.
+        collection_name (str): The name of the collection.
+        query_embedding (list): The query vector.
+        score_threshold (float): The minimum score to return.
+        filter_dict (dict, optional): The keys and values to filter on. Defaults to {}.
+        payload_fields (list[str], optional): The payload fields to return. An empty
+            list returns no payload. Defaults to None, the full payload.
+
+    Returns:
+        list[ScoredPoint]: the results of the search, best first
+    """
+    collection = client.get_collection(collection_name)
+    rows, scores = collection.search(query_embedding, score_threshold, filter_dict)
+    payloads = collection.payloads(rows, payload_fields)
+    return [
+        ScoredPoint(
+            id=int(collection.ids[row]), version=0, score=float(score), payload=payload
+        )
+        for row, score, payload in zip(rows, scores, payloads)
+    ]
+
+
+def filter_search(
+    client: LocalSearchClient,
+    collection_name: str,
+    filter_dict: dict,
+    payload_fields: list[str] = None,
+):
+    """Query a local collection using filter alone
+
+    Args:
+        client (LocalSearchClient): The local search client.
+        collection_name (str): The name of the collection.
+        filter_dict (dict): The keys and values to filter on. Defaults to {}.
+        payload_fields (list[str], optional): The payload fields to return. An empty
+            list returns no payload. Defaults to None, the full payload.
+
+    Returns:
+        tuple[list[Record], None]: the results of the search, in id order as a
+            scroll returns them, and no next page offset
+    """
+    if len(filter_dict) > 0:
+        collection = client.get_collection(collection_name)
+        rows = np.flatnonzero(collection.filter_mask(filter_dict))
+        rows = rows[np.argsort(collection.ids[rows], kind="stable")]
+        payloads = collection.payloads(rows, payload_fields)
+        return [
+            Record(id=int(collection.ids[row]), payload=payload)
+            for row, payload in zip(rows, payloads)
+        ], None
+    else:
+        print("No filters present, provide filters to search")
+
+
+def save_local_collection(
+    path: str,
+    ids: list[int],
+    embeddings: np.ndarray,
+    payloads: list[dict],
+    distance: str = "Dot",
+):
+    """
+    Save points as a local collection: a float32 embedding matrix, ids, and
+    one column per payload field
+
+    Args:
+        path (str): directory to save the collection to
+        ids (list[int]): point ids
+        embeddings (np.ndarray): (n, size) embeddings
+        payloads (list[dict]): point payloads
+        distance (str): "Dot" or "Cosine", as the Qdrant collection.
+            Defaults to "Dot".
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if distance == "Cosine":
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings = embeddings / np.where(norms == 0, 1, norms)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, EMBEDDINGS_FILE), embeddings)
+    np.save(os.path.join(path, IDS_FILE), np.asarray(ids, dtype=np.int64))
+    _save_payloads(path, payloads)
+    _save_meta(path, len(ids), embeddings.shape[1], distance)
+
+
+def export_collection(
+    client: QdrantClient,
+    collection_name: str,
+    path: str,
+    batch_size: int = 1000,
+):
+    """
+    Copy a Qdrant collection to a local collection, writing the embeddings
+    straight into the memory-mapped matrix a batch at a time
+
+    Args:
+        client (QdrantClient): The Qdrant client.
+        collection_name (str): The name of the collection.
+        path (str): directory to save the local collection to
+        batch_size (int): points per scroll. Defaults to 1000.
+    """
+    vectors_config = client.get_collection(collection_name).config.params.vectors
+    distance = vectors_config.distance.value
+    n_points = client.count(collection_name=collection_name, exact=True).count
+
+    os.makedirs(path, exist_ok=True)
+    embeddings = np.lib.format.open_memmap(
+        os.path.join(path, EMBEDDINGS_FILE),
+        mode="w+",
+        dtype=np.float32,
+        shape=(n_points, vectors_config.size),
+    )
+    ids = []
+    payloads = []
+    offset = None
+    while len(ids) < n_points:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        records = records[: n_points - len(ids)]
+        batch = np.asarray([record.vector for record in records], dtype=np.float32)
+        if distance == "Cosine" and len(batch):
+            norms = np.linalg.norm(batch, axis=1, keepdims=True)
+            batch = batch / np.where(norms == 0, 1, norms)
+        embeddings[len(ids) : len(ids) + len(records)] = batch
+        ids.extend(record.id for record in records)
+        payloads.extend(record.payload or {} for record in records)
+        if offset is None:
+            break
+    embeddings.flush()
+    del embeddings
+
+    if len(ids) < n_points:
+        raise ValueError(
+            f"Expected {n_points} points in {collection_name}, scrolled {len(ids)}"
+        )
+    np.save(os.path.join(path, IDS_FILE), np.asarray(ids, dtype=np.int64))
+    _save_payloads(path, payloads)
+    _save_meta(path, n_points, vectors_config.size, distance)
+    print(f"Exported {n_points} points from {collection_name} to {path}")
+
+
+def _save_payloads(path: str, payloads: list[dict]):
+    """Write payloads as columns, recording the rows missing each field"""
+    fields = list(dict.fromkeys(field for payload in payloads for field in payload))
+    columns = {field: [] for field in fields}
+    missing = {field: [] for field in fields}
+    for row, payload in enumerate(payloads):
+        for field in fields:
+            if field in payload:
+                columns[field].append(payload[field])
+            else:
+                columns[field].append(None)
+                missing[field].append(row)
+    with open(os.path.join(path, PAYLOAD_FILE), "w") as f:
+        json.dump(
+            {
+                "columns": columns,
+                "missing": {field: rows for field, rows in missing.items() if rows},
+            },
+            f,
+        )
+
+
+def _save_meta(path: str, n_points: int, size: int, distance: str):
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({"n_points": n_points, "size": size, "distance": distance}, f)
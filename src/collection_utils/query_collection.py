@@ -1,6 +1,39 @@
-from qdrant_client import QdrantClient
+import datetime
 
-from qdrant_client.http.models import FieldCondition, Filter, MatchAny
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+from qdrant_client.http.models import (
+    DatetimeRange,
+    Direction,
+    FieldCondition,
+    Filter,
+    MatchAny,
+    MatchText,
+    OrderBy,
+)
+
+from src.collection_utils import local_search
+
+# Payload fields searched by keyword searches, with full-text indexes: the
+# feedback, and the feedback of the duplicates a deduplicated point stands for
+TEXT_FIELD = "feedback"
+DUPLICATE_TEXT_FIELD = "duplicate_feedback"
+
+
+def payload_selector(payload_fields: list[str] = None):
+    """Build the with_payload argument for a search
+
+    Args:
+        payload_fields (list[str], optional): The payload fields to return. An empty
+            list returns no payload. Defaults to None, the full payload.
+
+    Returns:
+        bool | list[str]: True for the full payload, False for none, or the fields
+    """
+    if payload_fields is None:
+        return True
+    return list(payload_fields) if payload_fields else False
 
 
 def get_semantically_similar_results(
@@ -9,19 +42,33 @@ def get_semantically_similar_results(
     query_embedding,
     score_threshold: float,
     filter_dict={},
+    payload_fields: list[str] = None,
 ):
     """Retrieve top k results from collection
 
     Args:
-        client (QdrantClient): The  Qdrant client.
+        client (QdrantClient): The  Qdrant client, or a LocalSearchClient to
+            search a local collection exactly, in process.
         collection_name (str): The name of the collection.
         query_embedding (list): The query vector.
         score_threshold (float): The minimum score to return.
         filter_dict (dict, optional): The keys and values to filter on. Defaults to {}.
+        payload_fields (list[str], optional): The payload fields to return. An empty
+            list returns no payload. Defaults to None, the full payload.
 
     Returns:
         list: the results of the search
     """
+    if isinstance(client, local_search.LocalSearchClient):
+        return local_search.get_semantically_similar_results(
+            client,
+            collection_name,
+            query_embedding,
+            score_threshold,
+            filter_dict=filter_dict,
+            payload_fields=payload_fields,
+        )
+
     filter = Filter(
         must=[
             FieldCondition(key=filter_key, match=MatchAny(any=filter_values))
@@ -38,6 +85,8 @@ def get_semantically_similar_results(
             score_threshold=score_threshold,
             limit=10000000,
             timeout=10000,
+            with_payload=payload_selector(payload_fields),
+            with_vectors=False,
         )
     else:
         search_result = client.search(
@@ -46,22 +95,81 @@ def get_semantically_similar_results(
             score_threshold=score_threshold,
             limit=10000000,
             timeout=10000,
+            with_payload=payload_selector(payload_fields),
+            with_vectors=False,
         )
 
     return search_result
 
 
-def filter_search(client: QdrantClient, collection_name: str, filter_dict: dict):
+async def get_semantically_similar_results_async(
+    client: AsyncQdrantClient,
+    collection_name: str,
+    query_embedding,
+    score_threshold: float,
+    filter_dict={},
+    payload_fields: list[str] = None,
+):
+    """Retrieve top k results from collection using the async client
+
+    Args:
+        client (AsyncQdrantClient): The async Qdrant client.
+        collection_name (str): The name of the collection.
+        query_embedding (list): The query vector.
+        score_threshold (float): The minimum score to return.
+        filter_dict (dict, optional): The keys and values to filter on. Defaults to {}.
+        payload_fields (list[str], optional): The payload fields to return. An empty
+            list returns no payload. Defaults to None, the full payload.
+
+    Returns:
+        list: the results of the search
+    """
+    filter = Filter(
+        must=[
+            FieldCondition(key=filter_key, match=MatchAny(any=filter_values))
+            for filter_key, filter_values in filter_dict.items()
+            if filter_values
+        ]
+    )
+
+    search_result = await client.search(
+        collection_name=collection_name,
+        query_vector=query_embedding,
+        query_filter=filter if len(filter_dict) > 0 else None,
+        score_threshold=score_threshold,
+        limit=10000000,
+        timeout=10000,
+        with_payload=payload_selector(payload_fields),
+        with_vectors=False,
+    )
+
+    return search_result
+
+
+def filter_search(
+    client: QdrantClient,
+    collection_name: str,
+    filter_dict: dict,
+    payload_fields: list[str] = None,
+):
     """Query collection using filter alone
 
     Args:
-        client (QdrantClient): The  Qdrant client.
+        client (QdrantClient): The  Qdrant client, or a LocalSearchClient to
+            filter a local collection in process.
         collection_name (str): The name of the collection.
         filter_dict (dict): The keys and values to filter on. Defaults to {}.
+        payload_fields (list[str], optional): The payload fields to return. An empty
+            list returns no payload. Defaults to None, the full payload.
 
     Returns:
         list: the results of the search
     """
+    if isinstance(client, local_search.LocalSearchClient):
+        return local_search.filter_search(
+            client, collection_name, filter_dict, payload_fields=payload_fields
+        )
+
     filter = Filter(
         must=[
             FieldCondition(key=filter_key, match=MatchAny(any=filter_values))
@@ -74,7 +182,276 @@ def filter_search(client: QdrantClient, collection_name: str, filter_dict: dict)
             collection_name=collection_name,
             scroll_filter=filter,
             limit=10000000,
+            with_payload=payload_selector(payload_fields),
+            with_vectors=False,
         )
         return search_result
     else:
         print("No filters present, provide filters to search")
+
+
+def parse_keywords(search_terms: str) -> list[str]:
+    """Split a keyword search into alternatives on commas, e.g.
+    "sa100, self assessment" into ["sa100", "self assessment"]
+
+    Args:
+        search_terms (str): The search input.
+
+    Returns:
+        list[str]: the non-empty alternatives, lower case
+    """
+    return [
+        keyword.strip().lower()
+        for keyword in search_terms.split(",")
+        if keyword.strip()
+    ]
+
+
+def build_filter(
+    filter_dict: dict,
+    start_date: datetime.date = None,
+    end_date: datetime.date = None,
+    keywords: list[str] = None,
+) -> Filter:
+    """Build a Qdrant filter from the filter dictionary and an optional range
+    of created dates, so dates are filtered server side
+
+    Args:
+        filter_dict (dict): The keys and values to filter on.
+        start_date (datetime.date, optional): The earliest created date. Defaults to None.
+        end_date (datetime.date, optional): The latest created date. Defaults to None.
+        keywords (list[str], optional): Feedback, or the feedback of a
+            deduplicated point's duplicates, must contain every word of at
+            least one of these, using the full-text indexes. Defaults to None,
+            no text filter.
+
+    Returns:
+        Filter: the filter
+    """
+    conditions = [
+        FieldCondition(key=filter_key, match=MatchAny(any=filter_values))
+        for filter_key, filter_values in filter_dict.items()
+        if filter_values
+    ]
+    if start_date is not None or end_date is not None:
+        conditions.append(
+            FieldCondition(
+                key="created",
+                range=DatetimeRange(
+                    gte=start_date.isoformat() if start_date else None,
+                    lte=end_date.isoformat() if end_date else None,
+                ),
+            )
+        )
+    if keywords:
+        conditions.append(
+            Filter(
+                should=[
+                    FieldCondition(key=field, match=MatchText(text=keyword))
+                    for keyword in keywords
+                    for field in [TEXT_FIELD, DUPLICATE_TEXT_FIELD]
+                ]
+            )
+        )
+    return Filter(must=conditions)
+
+
+def count_results(
+    client: QdrantClient,
+    collection_name: str,
+    filter_dict: dict,
+    start_date: datetime.date = None,
+    end_date: datetime.date = None,
+    keywords: list[str] = None,
+) -> int:
+    """Count the points matching a filter with the count API, without
+    returning them
+
+    Args:
+        client (QdrantClient): The  Qdrant client.
+        collection_name (str): The name of the collection.
+        filter_dict (dict): The keys and values to filter on.
+        start_date (datetime.date, optional): The earliest created date. Defaults to None.
+        end_date (datetime.date, optional): The latest created date. Defaults to None.
+        keywords (list[str], optional): Keyword alternatives the feedback must
+            match. Defaults to None.
+
+    Returns:
+        int: the number of matching points
+    """
+    return client.count(
+        collection_name=collection_name,
+        count_filter=build_filter(filter_dict, start_date, end_date, keywords),
+        exact=True,
+    ).count
+
+
+def count_similar_results(
+    client: QdrantClient,
+    collection_name: str,
+    filter_dict: dict,
+    query_embedding,
+    score_threshold: float,
+    start_date: datetime.date = None,
+    end_date: datetime.date = None,
+    keywords: list[str] = None,
+    limit: int = 10000,
+) -> tuple[int, int]:
+    """Count the points above a similarity threshold. The count API can't
+    apply a score threshold, so this runs the search, returning only each
+    point's duplicate_count, up to a limit.
+
+    Args:
+        client (QdrantClient): The  Qdrant client.
+        collection_name (str): The name of the collection.
+        filter_dict (dict): The keys and values to filter on.
+        query_embedding (list): The query vector.
+        score_threshold (float): The minimum score to count.
+        start_date (datetime.date, optional): The earliest created date. Defaults to None.
+        end_date (datetime.date, optional): The latest created date. Defaults to None.
+        keywords (list[str], optional): Keyword alternatives the feedback must
+            match. Defaults to None.
+        limit (int, optional): The most points to count. Defaults to 10000.
+
+    Returns:
+        int: the number of matching points, at most limit
+        int: the number of feedback records they stand for, counting the
+            duplicate_count of points in a deduplicated collection
+    """
+    points = client.search(
+        collection_name=collection_name,
+        query_vector=query_embedding,
+        query_filter=build_filter(filter_dict, start_date, end_date, keywords),
+        score_threshold=score_threshold,
+        limit=limit,
+        with_payload=["duplicate_count"],
+        with_vectors=False,
+    )
+    n_records = sum(
+        (point.payload or {}).get("duplicate_count") or 1 for point in points
+    )
+    return len(points), n_records
+
+
+def search_results_page(
+    client: QdrantClient,
+    collection_name: str,
+    filter_dict: dict,
+    query_embedding=None,
+    score_threshold: float = None,
+    start_date: datetime.date = None,
+    end_date: datetime.date = None,
+    keywords: list[str] = None,
+    offset: int = 0,
+    limit: int = 100,
+    payload_fields: list[str] = None,
+    with_vectors: bool = False,
+) -> list[dict]:
+    """Fetch one page of ranked results from Qdrant, so only that page is
+    held in memory. Semantic searches are ranked by score; filter searches,
+    which have no score, by date, newest first, using the created index.
+    Qdrant can't combine ordering by a payload value with an offset, so filter
+    searches read offset + limit points and drop the first offset.
+
+    Args:
+        client (QdrantClient): The  Qdrant client.
+        collection_name (str): The name of the collection.
+        filter_dict (dict): The keys and values to filter on.
+        query_embedding (list, optional): The query vector. Defaults to None, a
+            filter search.
+        score_threshold (float, optional): The minimum score to return.
+        start_date (datetime.date, optional): The earliest created date. Defaults to None.
+        end_date (datetime.date, optional): The latest created date. Defaults to None.
+        keywords (list[str], optional): Keyword alternatives the feedback must
+            match, using the full-text index. Defaults to None.
+        offset (int, optional): The number of results before the page. Defaults to 0.
+        limit (int, optional): The page size. Defaults to 100.
+        payload_fields (list[str], optional): The payload fields to return.
+            Defaults to None, the full payload.
+        with_vectors (bool, optional): Whether to return the vectors too.
+            Defaults to False.
+
+    Returns:
+        list[dict]: "id", "score" and "payload" of each point, and "vector" if
+            requested, best first. Filter search results have a score of 1.
+    """
+    filter = build_filter(filter_dict, start_date, end_date, keywords)
+    if query_embedding is not None:
+        points = client.search(
+            collection_name=collection_name,
+            query_vector=query_embedding,
+            query_filter=filter,
+            score_threshold=score_threshold,
+            offset=offset,
+            limit=limit,
+            with_payload=payload_selector(payload_fields),
+            with_vectors=with_vectors,
+        )
+    else:
+        points, _ = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=filter,
+            order_by=OrderBy(key="created", direction=Direction.DESC),
+            limit=offset + limit,
+            with_payload=payload_selector(payload_fields),
+            with_vectors=with_vectors,
+        )
+        points = points[offset:]
+
+    results = []
+    for point in points:
+        score = getattr(point, "score", None)
+        result = {
+            "id": point.id,
+            "score": 1.0 if score is None else float(score),
+            "payload": point.payload,
+        }
+        if with_vectors:
+            result["vector"] = point.vector
+        results.append(result)
+    return results
+
+
+def fetch_results_page(
+    client: QdrantClient,
+    collection_name: str,
+    ids: np.ndarray,
+    scores: np.ndarray,
+    payload_fields: list[str] = None,
+    with_vectors: bool = False,
+) -> list[dict]:
+    """Fetch the payloads for a page of ranked points
+
+    Args:
+        client (QdrantClient): The  Qdrant client.
+        collection_name (str): The name of the collection.
+        ids (np.ndarray): The point ids of the page, in order.
+        scores (np.ndarray): Their similarity scores.
+        payload_fields (list[str], optional): The payload fields to return.
+            Defaults to None, the full payload.
+        with_vectors (bool, optional): Whether to return the vectors too.
+            Defaults to False.
+
+    Returns:
+        list[dict]: "id", "score" and "payload" of each point, and "vector" if
+            requested, in the order of ids
+    """
+    if len(ids) == 0:
+        return []
+    records = client.retrieve(
+        collection_name=collection_name,
+        ids=[int(point_id) for point_id in ids],
+        with_payload=payload_selector(payload_fields),
+        with_vectors=with_vectors,
+    )
+    records = {record.id: record for record in records}
+    results = []
+    for point_id, score in zip(ids, scores):
+        record = records.get(int(point_id))
+        if record is None:
+            continue
+        result = {"id": int(point_id), "score": float(score), "payload": record.payload}
+        if with_vectors:
+            result["vector"] = record.vector
+        results.append(result)
+    return results
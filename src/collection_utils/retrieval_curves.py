@@ -0,0 +1,163 @@
+import numpy as np
+
+
+def build_label_ranking(results: list, relevant_records: list) -> tuple:
+    """
+    Turn the scored search results for one label into a ranking: scores in
+    descending order and whether each result is relevant.
+
+    Args:
+        results (list): scored points returned by get_semantically_similar_results
+        relevant_records (list): list of relevant record IDs
+
+    Returns:
+        np.ndarray: Scores, highest first
+        np.ndarray: Boolean relevance of each result
+        int: Number of relevant records
+    """
+    relevant_set = set(relevant_records)
+    scores = np.array([result.score for result in results], dtype=np.float64)
+    relevant = np.array(
+        [str(result.id) in relevant_set for result in results], dtype=bool
+    )
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], relevant[order], len(relevant_set)
+
+
+def _f2_scores(precision: np.ndarray, recall: np.ndarray) -> np.ndarray:
+    """Vectorised calculate_f2_score, 0 where precision and recall are both 0"""
+    denominator = 4 * precision + recall
+    return np.divide(
+        5 * (precision * recall),
+        denominator,
+        out=np.zeros_like(denominator),
+        where=denominator > 0,
+    )
+
+
+def _metrics_at_cutoffs(
+    true_positives: np.ndarray, n_retrieved: np.ndarray, n_relevant: int
+) -> tuple:
+    """Precision, recall and F2 given true positive and retrieved counts"""
+    true_positives = true_positives.astype(np.float64)
+    precision = np.divide(
+        true_positives,
+        n_retrieved,
+        out=np.zeros_like(true_positives),
+        where=n_retrieved > 0,
+    )
+    recall = true_positives / n_relevant if n_relevant else np.zeros_like(precision)
+    return precision, recall, _f2_scores(precision, recall)
+
+
+def compute_precision_recall_curve(
+    scores: np.ndarray, relevant: np.ndarray, n_relevant: int
+) -> dict:
+    """
+    Compute precision, recall and F2 at every distinct score cut-off of a
+    ranking, using cumulative sums, plus the average precision of the ranking.
+    Results tied on score are always retrieved together, as with a Qdrant
+    score_threshold.
+
+    Args:
+        scores (np.ndarray): Scores, highest first
+        relevant (np.ndarray): Boolean relevance of each result
+        n_relevant (int): Number of relevant records
+
+    Returns:
+        dict: "thresholds" (the distinct scores, highest first), and
+            "precision", "recall", "f2" at each threshold, plus "average_precision"
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    cumulative_tp = np.cumsum(relevant)
+
+    # Last position of each run of tied scores
+    cutoffs = np.flatnonzero(np.diff(scores, append=-np.inf) != 0)
+
+    precision, recall, f2 = _metrics_at_cutoffs(
+        cumulative_tp[cutoffs], cutoffs + 1, n_relevant
+    )
+
+    # Mean of precision@k over the positions of relevant results
+    precision_at_k = cumulative_tp / np.arange(1, len(scores) + 1)
+    average_precision = (
+        float(precision_at_k[relevant].sum() / n_relevant) if n_relevant else 0.0
+    )
+
+    return {
+        "thresholds": scores[cutoffs],
+        "precision": precision,
+        "recall": recall,
+        "f2": f2,
+        "average_precision": average_precision,
+    }
+
+
+def curve_metrics_at_thresholds(
+    scores: np.ndarray,
+    relevant: np.ndarray,
+    n_relevant: int,
+    thresholds: np.ndarray,
+) -> tuple:
+    """
+    Precision, recall and F2 at arbitrary similarity thresholds, from a single
+    ranking. A result is retrieved at a threshold when its score is at least
+    the threshold. Thresholds below the score_threshold the ranking was
+    searched with are not meaningful.
+
+    Args:
+        scores (np.ndarray): Scores, highest first
+        relevant (np.ndarray): Boolean relevance of each result
+        n_relevant (int): Number of relevant records
+        thresholds (np.ndarray): Similarity thresholds to evaluate
+
+    Returns:
+        np.ndarray: Precision at each threshold
+        np.ndarray: Recall at each threshold
+        np.ndarray: F2 score at each threshold
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    # Number of results with score >= threshold (scores are descending)
+    n_retrieved = np.searchsorted(-scores, -thresholds, side="right")
+    cumulative_tp = np.concatenate([[0], np.cumsum(relevant)])
+
+    return _metrics_at_cutoffs(cumulative_tp[n_retrieved], n_retrieved, n_relevant)
+
+
+def rankings_to_metric_matrices(rankings: list, thresholds: np.ndarray) -> dict:
+    """
+    Evaluate a set of label rankings at the given thresholds
+
+    Args:
+        rankings (list): (scores, relevant, n_relevant) per label, or None where
+            the search for that label failed
+        thresholds (np.ndarray): Similarity thresholds to evaluate
+
+    Returns:
+        dict: "precision", "recall" and "f2" label x threshold matrices (NaN for
+            failed labels), and "average_precision" per label
+    """
+    matrices = {
+        metric: np.full((len(rankings), len(thresholds)), np.nan)
+        for metric in ["precision", "recall", "f2"]
+    }
+    average_precision = np.full(len(rankings), np.nan)
+
+    for row, ranking in enumerate(rankings):
+        if ranking is None:
+            continue
+        scores, relevant, n_relevant = ranking
+        precision, recall, f2 = curve_metrics_at_thresholds(
+            scores, relevant, n_relevant, thresholds
+        )
+        matrices["precision"][row] = precision
+        matrices["recall"][row] = recall
+        matrices["f2"][row] = f2
+        average_precision[row] = compute_precision_recall_curve(
+            scores, relevant, n_relevant
+        )["average_precision"]
+
+    matrices["average_precision"] = average_precision
+    return matrices
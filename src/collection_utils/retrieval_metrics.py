@@ -0,0 +1,131 @@
+import numpy as np
+
+# Number of set bits in every possible byte, for popcounts over packed bitsets
+POPCOUNT_TABLE = np.array([bin(byte).count("1") for byte in range(256)], np.uint8)
+
+
+def build_id_positions(id_lists) -> dict:
+    """
+    Map every feedback ID to a dense integer position, once, so sets of IDs
+    can be represented as bitsets
+
+    Args:
+        id_lists (Iterable[list[str]]): lists of feedback IDs, e.g. regex_ids.values()
+
+    Returns:
+        dict: feedback ID to position
+    """
+    id_positions = {}
+    for ids in id_lists:
+        for record_id in ids:
+            if record_id not in id_positions:
+                id_positions[record_id] = len(id_positions)
+    return id_positions
+
+
+def ids_to_bitsets(id_lists: list, id_positions: dict) -> np.ndarray:
+    """
+    Convert lists of feedback IDs into packed bitsets, one row per list. IDs
+    without a position are ignored.
+
+    Args:
+        id_lists (list[list[str]]): lists of feedback IDs
+        id_positions (dict): feedback ID to position, from build_id_positions
+
+    Returns:
+        np.ndarray: uint8 array of shape (len(id_lists), ceil(len(id_positions) / 8))
+    """
+    rows = []
+    positions = []
+    for row, ids in enumerate(id_lists):
+        row_positions = [
+            id_positions[record_id] for record_id in ids if record_id in id_positions
+        ]
+        rows.extend([row] * len(row_positions))
+        positions.extend(row_positions)
+
+    # Set bits straight into the packed array, most significant bit first as
+    # np.packbits does, without an unpacked boolean matrix 8 times the size
+    bitsets = np.zeros((len(id_lists), (len(id_positions) + 7) // 8), dtype=np.uint8)
+    rows = np.asarray(rows, dtype=np.int64)
+    positions = np.asarray(positions, dtype=np.int64)
+    np.bitwise_or.at(
+        bitsets,
+        (rows, positions >> 3),
+        (0x80 >> (positions & 7)).astype(np.uint8),
+    )
+    return bitsets
+
+
+def popcount(bitsets: np.ndarray) -> np.ndarray:
+    """
+    Count the set bits in packed bitsets along the last axis
+
+    Args:
+        bitsets (np.ndarray): packed uint8 bitsets
+
+    Returns:
+        np.ndarray: number of set bits, with the last axis removed
+    """
+    return POPCOUNT_TABLE[bitsets].sum(axis=-1, dtype=np.int64)
+
+
+def calculate_metric_matrices(
+    retrieved_bitsets: np.ndarray,
+    retrieved_counts: np.ndarray,
+    relevant_bitsets: np.ndarray,
+    relevant_counts: np.ndarray,
+) -> tuple:
+    """
+    Calculate precision, recall and F2 for every label and threshold at once,
+    with true positives counted by AND-ing and popcounting packed bitsets.
+    Matches calculate_precision, calculate_recall and calculate_f2_score.
+
+    Args:
+        retrieved_bitsets (np.ndarray): (n_labels, n_thresholds, n_bytes) retrieved IDs
+        retrieved_counts (np.ndarray): (n_labels, n_thresholds) number of IDs
+            retrieved, including any without a position. NaN where the search failed.
+        relevant_bitsets (np.ndarray): (n_labels, n_bytes) relevant IDs
+        relevant_counts (np.ndarray): (n_labels,) number of relevant IDs
+
+    Returns:
+        np.ndarray: (n_labels, n_thresholds) precision
+        np.ndarray: (n_labels, n_thresholds) recall
+        np.ndarray: (n_labels, n_thresholds) F2 score
+    """
+    true_positives = popcount(
+        retrieved_bitsets & relevant_bitsets[:, np.newaxis, :]
+    ).astype(np.float64)
+    retrieved_counts = np.asarray(retrieved_counts, dtype=np.float64)
+    relevant_counts = np.broadcast_to(
+        np.asarray(relevant_counts, dtype=np.float64)[:, np.newaxis],
+        true_positives.shape,
+    )
+
+    precision = np.divide(
+        true_positives,
+        retrieved_counts,
+        out=np.zeros_like(true_positives),
+        where=retrieved_counts > 0,
+    )
+    recall = np.divide(
+        true_positives,
+        relevant_counts,
+        out=np.zeros_like(true_positives),
+        where=relevant_counts > 0,
+    )
+    denominator = 4 * precision + recall
+    f2 = np.divide(
+        5 * (precision * recall),
+        denominator,
+        out=np.zeros_like(denominator),
+        where=denominator > 0,
+    )
+
+    # Failed searches stay missing
+    failed = np.isnan(retrieved_counts)
+    precision[failed] = np.nan
+    recall[failed] = np.nan
+    f2[failed] = np.nan
+
+    return precision, recall, f2
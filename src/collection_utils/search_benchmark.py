@@ -0,0 +1,473 @@
+import ast
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import regex as re
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct, SearchParams, VectorParams
+
+from src.collection_utils.local_search import LocalSearchClient
+from src.collection_utils.query_collection import (
+    build_filter,
+    count_results,
+    filter_search,
+    get_semantically_similar_results,
+    parse_keywords,
+    search_results_page,
+)
+
+# Log messages written by app/main.py when a search is run
+SEMANTIC_SEARCH_LOG = re.compile(
+    r"running (?P<search_mode>semantic|keyword|hybrid) search for '(?P<search_terms>.*)' with filters (?P<filters>\{.*\})\.\.\.$"
+)
+FILTER_SEARCH_LOG = re.compile(
+    r"running filter search with filters (?P<filters>\{.*\})\.\.\.$"
+)
+
+# Used for synthetic workloads when no filter options are available
+DEFAULT_FILTER_VALUES = {
+    "url": [f"/benchmark-page-{idx}" for idx in range(50)],
+    "urgency": [-1, 0, 1, 2, 3],
+    "primary_department": [f"Department {idx}" for idx in range(20)],
+    "document_type": ["guide", "answer", "form", "news_story", "detailed_guide"],
+    "spam_classification": ["spam", "not spam", ""],
+}
+
+DEFAULT_SEARCH_TERMS = [
+    "passport renewal",
+    "cannot log in",
+    "tax refund",
+    "driving licence",
+    "universal credit payment",
+    "page not loading",
+    "visa application",
+    "benefits",
+    "council tax",
+    "broken link",
+]
+
+
+def parse_query_log(lines) -> list[dict]:
+    """
+    Parse the searches run in the app from its log lines
+
+    Args:
+        lines (Iterable[str]): lines of an app log file
+
+    Returns:
+        list[dict]: queries with "search_type" ("semantic", "keyword",
+            "hybrid" or "filter"), "search_terms" and "filter_dict", in log order
+    """
+    workload = []
+    for line in lines:
+        line = line.rstrip("\n")
+        match = SEMANTIC_SEARCH_LOG.search(line)
+        if match:
+            search_type = match.group("search_mode")
+        else:
+            match = FILTER_SEARCH_LOG.search(line)
+            search_type = "filter"
+        if not match:
+            continue
+        try:
+            filter_dict = ast.literal_eval(match.group("filters"))
+        except (ValueError, SyntaxError):
+            print(f"Skipping log line with unparseable filters: {line}")
+            continue
+        workload.append(
+            {
+                "search_type": search_type,
+                "search_terms": match.groupdict().get("search_terms") or "",
+                "filter_dict": filter_dict,
+            }
+        )
+    return workload
+
+
+def generate_synthetic_workload(
+    n_queries: int,
+    filter_values: dict = DEFAULT_FILTER_VALUES,
+    search_terms: list[str] = DEFAULT_SEARCH_TERMS,
+    filter_search_share: float = 0.2,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Generate a workload shaped like the app's searches, with a random subset
+    of the filters set on each query
+
+    Args:
+        n_queries (int): number of queries
+        filter_values (dict): filter key to the values it can take
+        search_terms (list[str]): search terms to sample from
+        filter_search_share (float): share of queries run as filter searches
+        seed (int): random seed
+
+    Returns:
+        list[dict]: queries in the parse_query_log format
+    """
+    rng = np.random.default_rng(seed)
+    workload = []
+    for _ in range(n_queries):
+        filter_dict = {key: [] for key in filter_values}
+        filter_dict["spam_classification"] = ["not spam"]
+        for key in ["url", "urgency", "primary_department", "document_type"]:
+            if key in filter_values and rng.random() < 0.3:
+                n_values = int(rng.integers(1, 4))
+                values = rng.choice(filter_values[key], size=n_values)
+                filter_dict[key] = sorted({value.item() for value in values})
+
+        if rng.random() < filter_search_share:
+            # Filter searches need a url or department, as in the app
+            if not filter_dict.get("url") and not filter_dict.get("primary_department"):
+                filter_dict["url"] = [rng.choice(filter_values["url"]).item()]
+            workload.append(
+                {
+                    "search_type": "filter",
+                    "search_terms": "",
+                    "filter_dict": filter_dict,
+                }
+            )
+        else:
+            workload.append(
+                {
+                    "search_type": "semantic",
+                    "search_terms": rng.choice(search_terms).item(),
+                    "filter_dict": filter_dict,
+                }
+            )
+    return workload
+
+
+def hash_query_embedding(text: str, size: int = 768) -> list[float]:
+    """
+    Deterministic unit-length query vector for a piece of text, for running
+    benchmarks without loading an encoder model
+
+    Args:
+        text (str): the search terms
+        size (int): vector size. Defaults to 768.
+
+    Returns:
+        list[float]: the query vector
+    """
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).normal(size=size)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def filter_combination(query: dict) -> str:
+    """
+    Name the combination of filters set on a query, e.g. "semantic: url+urgency"
+
+    Args:
+        query (dict): a query in the parse_query_log format
+
+    Returns:
+        str: the search type and the filter keys with values
+    """
+    keys = sorted(
+        key
+        for key, values in query["filter_dict"].items()
+        if values and key != "spam_classification"
+    )
+    return f"{query['search_type']}: {'+'.join(keys) if keys else 'no filters'}"
+
+
+def create_benchmark_collection(
+    client: QdrantClient,
+    collection_name: str,
+    n_points: int,
+    filter_values: dict = DEFAULT_FILTER_VALUES,
+    size: int = 768,
+    seed: int = 0,
+    batch_size: int = 1000,
+):
+    """
+    Create a collection of random points with payloads drawn from the filter
+    values, for benchmarking against a local Qdrant
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        n_points (int): number of points
+        filter_values (dict): filter key to the values it can take
+        size (int): vector size. Defaults to 768.
+        seed (int): random seed
+        batch_size (int): points upserted per request
+    """
+    rng = np.random.default_rng(seed)
+    client.recreate_collection(
+        collection_name=collection_name,
+        vectors_config=VectorParams(size=size, distance=Distance.COSINE),
+    )
+    for start in range(0, n_points, batch_size):
+        n_batch = min(batch_size, n_points - start)
+        vectors = rng.normal(size=(n_batch, size)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        points = [
+            PointStruct(
+                id=start + idx,
+                vector=vector.tolist(),
+                payload={
+                    key: rng.choice(values).item()
+                    for key, values in filter_values.items()
+                },
+            )
+            for idx, vector in enumerate(vectors)
+        ]
+        client.upsert(collection_name=collection_name, points=points, wait=True)
+    print(f"Benchmark collection {collection_name} created with {n_points} points")
+
+
+def run_query(
+    client: QdrantClient,
+    collection_name: str,
+    query: dict,
+    query_embedding: list,
+    score_threshold: float,
+) -> dict:
+    """
+    Run one query as the app would, timing it. Keyword and hybrid searches
+    are counted with the count API and their first page fetched, pre-filtered
+    on the search terms' keywords and without a score threshold.
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        query (dict): a query in the parse_query_log format
+        query_embedding (list): the query vector, unused for filter and
+            keyword searches
+        score_threshold (float): the minimum score for semantic searches
+
+    Returns:
+        dict: "combination", "latency" in seconds, "n_results" and "error"
+    """
+    start = time.perf_counter()
+    error = None
+    n_results = 0
+    try:
+        if query["search_type"] == "semantic":
+            results = get_semantically_similar_results(
+                client=client,
+                collection_name=collection_name,
+                query_embedding=query_embedding,
+                score_threshold=score_threshold,
+                filter_dict=query["filter_dict"],
+            )
+            n_results = len(results)
+        elif query["search_type"] in ("keyword", "hybrid"):
+            keywords = parse_keywords(query["search_terms"])
+            n_results = count_results(
+                client, collection_name, query["filter_dict"], keywords=keywords
+            )
+            search_results_page(
+                client,
+                collection_name,
+                query["filter_dict"],
+                query_embedding=(
+                    query_embedding if query["search_type"] == "hybrid" else None
+                ),
+                keywords=keywords,
+            )
+        else:
+            results, _ = filter_search(
+                client=client,
+                collection_name=collection_name,
+                filter_dict=query["filter_dict"],
+            )
+            n_results = len(results)
+    except Exception as e:
+        error = str(e)
+    return {
+        "combination": filter_combination(query),
+        "latency": time.perf_counter() - start,
+        "n_results": n_results,
+        "error": error,
+    }
+
+
+def run_workload(
+    client: QdrantClient,
+    collection_name: str,
+    workload: list[dict],
+    query_embeddings: list,
+    score_threshold: float = 0.5,
+    concurrency: int = 1,
+) -> tuple[list[dict], float]:
+    """
+    Replay a workload with a number of queries in flight at once
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        workload (list[dict]): queries in the parse_query_log format
+        query_embeddings (list): one query vector per query
+        score_threshold (float): the minimum score for semantic searches
+        concurrency (int): number of queries run at once. Defaults to 1.
+
+    Returns:
+        list[dict]: the run_query result for each query, in workload order
+        float: wall clock time of the run in seconds
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(
+            executor.map(
+                lambda args: run_query(
+                    client, collection_name, args[0], args[1], score_threshold
+                ),
+                zip(workload, query_embeddings),
+            )
+        )
+    return results, time.perf_counter() - start
+
+
+def summarise_results(results: list[dict], wall_time: float) -> list[dict]:
+    """
+    Summarise latency, throughput and result sizes per filter combination,
+    and over all queries
+
+    Args:
+        results (list[dict]): run_query results
+        wall_time (float): wall clock time of the run in seconds
+
+    Returns:
+        list[dict]: one summary per combination, then "all", with latencies in ms
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault(result["combination"], []).append(result)
+    groups = dict(sorted(groups.items()))
+    groups["all"] = results
+
+    summaries = []
+    for combination, group in groups.items():
+        succeeded = [result for result in group if result["error"] is None]
+        latencies = np.array([result["latency"] for result in succeeded]) * 1000
+        n_results = np.array([result["n_results"] for result in succeeded])
+        summary = {
+            "combination": combination,
+            "queries": len(group),
+            "errors": len(group) - len(succeeded),
+            # Share of the run's throughput made up of this combination
+            "throughput_qps": len(succeeded) / wall_time if wall_time else 0.0,
+        }
+        if len(succeeded):
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            summary.update(
+                {
+                    "p50_ms": p50,
+                    "p95_ms": p95,
+                    "p99_ms": p99,
+                    "mean_results": n_results.mean(),
+                    "max_results": int(n_results.max()),
+                }
+            )
+        summaries.append(summary)
+    return summaries
+
+
+def measure_recall(
+    client: QdrantClient,
+    local_client: LocalSearchClient,
+    collection_name: str,
+    workload: list[dict],
+    query_embeddings: list,
+    k: int = 10,
+    hnsw_ef: int = None,
+) -> list[dict]:
+    """
+    Measure the recall at k of Qdrant's HNSW search against an exact search of
+    the same collection exported with export_collection. Filter searches in
+    the workload are skipped.
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        local_client (LocalSearchClient): client of the exported collection
+        collection_name (str): name of the collection
+        workload (list[dict]): queries in the parse_query_log format
+        query_embeddings (list): one query vector per query
+        k (int): number of results compared. Defaults to 10.
+        hnsw_ef (int, optional): size of the HNSW search beam. Defaults to
+            None, the collection's setting.
+
+    Returns:
+        list[dict]: "combination", "recall", and "hnsw_latency" and
+            "exact_latency" in seconds, per semantic query
+    """
+    collection = local_client.get_collection(collection_name)
+    results = []
+    for query, query_embedding in zip(workload, query_embeddings):
+        if query["search_type"] != "semantic":
+            continue
+        start = time.perf_counter()
+        points = client.search(
+            collection_name=collection_name,
+            query_vector=query_embedding,
+            query_filter=build_filter(query["filter_dict"]),
+            search_params=SearchParams(hnsw_ef=hnsw_ef) if hnsw_ef else None,
+            limit=k,
+            with_payload=False,
+            with_vectors=False,
+        )
+        hnsw_latency = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rows, _ = collection.search(
+            query_embedding, filter_dict=query["filter_dict"], limit=k
+        )
+        exact_latency = time.perf_counter() - start
+
+        exact_ids = set(collection.ids[rows].tolist())
+        found = len(exact_ids & {point.id for point in points})
+        results.append(
+            {
+                "combination": filter_combination(query),
+                "recall": found / len(exact_ids) if exact_ids else 1.0,
+                "hnsw_latency": hnsw_latency,
+                "exact_latency": exact_latency,
+            }
+        )
+    return results
+
+
+def summarise_recall(results: list[dict]) -> list[dict]:
+    """
+    Summarise recall and latency per filter combination, and over all queries
+
+    Args:
+        results (list[dict]): measure_recall results
+
+    Returns:
+        list[dict]: one summary per combination, then "all", with latencies in ms
+    """
+    groups = {}
+    for result in results:
+        groups.setdefault(result["combination"], []).append(result)
+    groups = dict(sorted(groups.items()))
+    groups["all"] = results
+
+    summaries = []
+    for combination, group in groups.items():
+        if not group:
+            continue
+        recalls = np.array([result["recall"] for result in group])
+        summaries.append(
+            {
+                "combination": combination,
+                "queries": len(group),
+                "mean_recall": recalls.mean(),
+                "min_recall": recalls.min(),
+                "hnsw_p50_ms": np.percentile(
+                    [result["hnsw_latency"] for result in group], 50
+                )
+                * 1000,
+                "exact_p50_ms": np.percentile(
+                    [result["exact_latency"] for result in group], 50
+                )
+                * 1000,
+            }
+        )
+    return summaries
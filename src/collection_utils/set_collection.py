@@ -1,7 +1,41 @@
 from datetime import datetime
 
 from qdrant_client import QdrantClient
-from qdrant_client.http.models import Distance, PointStruct, VectorParams
+from qdrant_client.http.models import (
+    Distance,
+    PayloadSchemaType,
+    PointStruct,
+    TextIndexParams,
+    TextIndexType,
+    TokenizerType,
+    VectorParams,
+)
+
+# Payload indexes for the fields the app filters, counts and orders on
+PAYLOAD_INDEXES = {
+    "created": PayloadSchemaType.DATETIME,
+    "url": PayloadSchemaType.KEYWORD,
+    "primary_department": PayloadSchemaType.KEYWORD,
+    "document_type": PayloadSchemaType.KEYWORD,
+    "spam_classification": PayloadSchemaType.KEYWORD,
+    "urgency": PayloadSchemaType.INTEGER,
+    # Full-text indexes for keyword searches. duplicate_feedback is only set
+    # on deduplicated collections.
+    "feedback": TextIndexParams(
+        type=TextIndexType.TEXT,
+        tokenizer=TokenizerType.WORD,
+        min_token_len=2,
+        max_token_len=30,
+        lowercase=True,
+    ),
+    "duplicate_feedback": TextIndexParams(
+        type=TextIndexType.TEXT,
+        tokenizer=TokenizerType.WORD,
+        min_token_len=2,
+        max_token_len=30,
+        lowercase=True,
+    ),
+}
 
 
 def create_vectors_from_data(documents: list[dict], id_key: str, embedding_key: str):
@@ -59,6 +93,30 @@ def create_collection(
     print(f"Collection {collection_name} created")
 
 
+def create_payload_indexes(
+    client: QdrantClient, collection_name: str, payload_indexes: dict = PAYLOAD_INDEXES
+):
+    """Create payload indexes, so filters, counts and date ranges on these fields
+    don't need to read every payload
+
+    Args:
+        client (QdrantClient): the Qdrant client
+        collection_name (str): name of the collection
+        payload_indexes (dict, optional): field name to schema type. Defaults to PAYLOAD_INDEXES.
+    """
+    for field_name, field_schema in payload_indexes.items():
+        try:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True,
+            )
+            print(f"Payload index created on {field_name} in {collection_name}")
+        except Exception as e:
+            print(f"Error creating payload index on {field_name}: {e}")
+
+
 def upsert_to_collection_from_vectors(
     client: QdrantClient, collection_name: str, data: list[PointStruct]
 ):
@@ -0,0 +1,431 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+from qdrant_client import QdrantClient
+
+# Fields the theme index is built for, and how each record is grouped on them
+THEME_GROUPS = ["url_prefix", "primary_department"]
+
+STOPWORDS = set(
+    """
+    a about after again all also am an and any are as at be because been before
+    being but by can cannot could did do does doing dont for from get got had has
+    have having how i if im in into is it its just me more my no not now of on
+    once only or other our out over page please so some still such than that the
+    their them then there these they this to too up us very was we were what when
+    where which while who why will with would you your
+    """.split()
+)
+
+
+def url_prefix(url: str, depth: int = 1) -> str:
+    """
+    The first depth path segments of a url, e.g. "/browse" for "/browse/tax/vat"
+    at depth 1
+
+    Args:
+        url (str): page path
+        depth (int): number of path segments to keep
+
+    Returns:
+        str: the prefix, or "/" for the home page or a missing url
+    """
+    segments = [segment for segment in str(url or "").split("/") if segment]
+    return "/" + "/".join(segments[:depth])
+
+
+def minibatch_kmeans(
+    vectors: np.ndarray,
+    n_clusters: int,
+    batch_size: int = 1024,
+    n_iter: int = 100,
+    seed: int = 0,
+    weights: np.ndarray = None,
+):
+    """
+    Mini-batch k-means (Sculley, 2010) with greedy k-means++ initialisation
+    on a sample. Each iteration moves centroids towards a random batch, with a
+    per-centroid learning rate of 1 / (weight assigned so far).
+
+    Args:
+        vectors (np.ndarray): (n, size) vectors to cluster
+        n_clusters (int): number of clusters
+        batch_size (int): vectors per iteration
+        n_iter (int): number of iterations
+        seed (int): random seed
+        weights (np.ndarray, optional): weight of each vector, e.g. the records
+            a deduplicated point stands for. Defaults to None, equal weights.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: (n_clusters, size) centroids and the
+            cluster of each vector
+    """
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n_vectors = len(vectors)
+    n_clusters = min(n_clusters, n_vectors)
+    weights = (
+        np.ones(n_vectors) if weights is None else np.asarray(weights, dtype=np.float64)
+    )
+
+    # Greedy k-means++ on a sample: candidates for each new centroid are drawn
+    # in proportion to their weighted squared distance from the nearest
+    # centroid so far, and the one that most reduces the total is kept
+    sample_indices = rng.choice(
+        n_vectors, min(n_vectors, 20 * n_clusters), replace=False
+    )
+    sample = vectors[sample_indices]
+    sample_weights = weights[sample_indices]
+    n_trials = 2 + int(math.log(n_clusters + 1))
+    centroids = [sample[rng.integers(len(sample))]]
+    distances = ((sample - centroids[0]) ** 2).sum(axis=1)
+    for _ in range(1, n_clusters):
+        total = (sample_weights * distances).sum()
+        if total > 0:
+            candidates = rng.choice(
+                len(sample), size=n_trials, p=sample_weights * distances / total
+            )
+        else:
+            candidates = rng.integers(len(sample), size=1)
+        candidate_distances = np.minimum(
+            distances,
+            ((sample[None, :, :] - sample[candidates][:, None, :]) ** 2).sum(axis=2),
+        )
+        best = int(np.argmin((sample_weights * candidate_distances).sum(axis=1)))
+        centroids.append(sample[candidates[best]])
+        distances = candidate_distances[best]
+    centroids = np.array(centroids, dtype=np.float32)
+
+    counts = np.zeros(n_clusters)
+    for _ in range(n_iter if n_vectors > batch_size else max(10, n_iter // 10)):
+        batch_indices = rng.choice(n_vectors, min(batch_size, n_vectors), replace=False)
+        batch = vectors[batch_indices]
+        batch_weights = weights[batch_indices]
+        labels = assign_clusters(batch, centroids)
+        for cluster in np.unique(labels):
+            in_cluster = labels == cluster
+            member_weights = batch_weights[in_cluster]
+            counts[cluster] += member_weights.sum()
+            rate = member_weights.sum() / counts[cluster]
+            weighted_mean = np.average(
+                batch[in_cluster], axis=0, weights=member_weights
+            )
+            centroids[cluster] += rate * (weighted_mean - centroids[cluster])
+
+    return centroids, assign_clusters(vectors, centroids)
+
+
+def assign_clusters(
+    vectors: np.ndarray, centroids: np.ndarray, chunk_size: int = 8192
+) -> np.ndarray:
+    """
+    Nearest centroid of each vector, by Euclidean distance, in chunks
+
+    Args:
+        vectors (np.ndarray): (n, size) vectors
+        centroids (np.ndarray): (k, size) centroids
+        chunk_size (int): vectors compared at a time
+
+    Returns:
+        np.ndarray: cluster of each vector
+    """
+    centroid_norms = (centroids**2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = vectors[start : start + chunk_size]
+        # |v - c|^2 without the |v|^2 term, which doesn't change the argmin
+        labels[start : start + chunk_size] = np.argmin(
+            centroid_norms - 2 * chunk @ centroids.T, axis=1
+        )
+    return labels
+
+
+def choose_n_clusters(n_records: int, max_clusters: int = 20) -> int:
+    """Number of themes for a group: about sqrt(n / 2), at most max_clusters"""
+    return max(1, min(max_clusters, round(math.sqrt(n_records / 2))))
+
+
+def tokenise(text: str) -> list[str]:
+    """Lower-case words of three or more letters, without stopwords"""
+    return [
+        word
+        for word in re.findall(r"[a-z][a-z']{2,}", str(text).lower())
+        if word not in STOPWORDS
+    ]
+
+
+def cluster_keywords(
+    texts_by_cluster: list[list[str]],
+    n_keywords: int = 5,
+    weights_by_cluster: list[list[float]] = None,
+) -> list:
+    """
+    Keywords of each cluster by class-based TF-IDF: words frequent in the
+    cluster but found in few of the other clusters
+
+    Args:
+        texts_by_cluster (list[list[str]]): feedback texts of each cluster
+        n_keywords (int): keywords per cluster
+        weights_by_cluster (list[list[float]], optional): times each text is
+            counted. Defaults to None, once each.
+
+    Returns:
+        list[list[str]]: keywords of each cluster
+    """
+    if weights_by_cluster is None:
+        weights_by_cluster = [[1] * len(texts) for texts in texts_by_cluster]
+    term_counts = []
+    for texts, weights in zip(texts_by_cluster, weights_by_cluster):
+        counts = Counter()
+        for text, weight in zip(texts, weights):
+            for word in tokenise(text):
+                counts[word] += weight
+        term_counts.append(counts)
+    document_frequency = Counter(word for counts in term_counts for word in counts)
+    n_clusters = len(texts_by_cluster)
+    keywords = []
+    for counts in term_counts:
+        total = sum(counts.values()) or 1
+        scores = {
+            word: count / total * math.log(1 + n_clusters / document_frequency[word])
+            for word, count in counts.items()
+        }
+        keywords.append(
+            sorted(scores, key=lambda word: (-scores[word], word))[:n_keywords]
+        )
+    return keywords
+
+
+def build_group_themes(
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    feedback: list[str],
+    max_clusters: int = 20,
+    n_representatives: int = 5,
+    seed: int = 0,
+    weights: np.ndarray = None,
+) -> list[dict]:
+    """
+    Cluster one group of records, e.g. all feedback on a url prefix, into themes
+
+    Args:
+        ids (np.ndarray): point ids of the records
+        vectors (np.ndarray): (n, size) vectors of the records
+        feedback (list[str]): feedback text of the records
+        max_clusters (int): most themes per group
+        n_representatives (int): record ids kept per theme, nearest the centroid first
+        seed (int): random seed
+        weights (np.ndarray, optional): records each point stands for, its
+            duplicate_count in a deduplicated collection. Defaults to None, one each.
+
+    Returns:
+        list[dict]: themes, largest first, with "size" (in records), "centroid",
+            "representative_ids" and "keywords"
+    """
+    weights = np.ones(len(ids)) if weights is None else np.asarray(weights)
+    centroids, labels = minibatch_kmeans(
+        vectors,
+        choose_n_clusters(int(weights.sum()), max_clusters),
+        seed=seed,
+        weights=weights,
+    )
+    clusters = [np.flatnonzero(labels == cluster) for cluster in range(len(centroids))]
+    keywords = cluster_keywords(
+        [[feedback[idx] for idx in members] for members in clusters],
+        weights_by_cluster=[weights[members].tolist() for members in clusters],
+    )
+    themes = []
+    for cluster, members in enumerate(clusters):
+        if len(members) == 0:
+            continue
+        distances = ((vectors[members] - centroids[cluster]) ** 2).sum(axis=1)
+        nearest = members[np.argsort(distances)[:n_representatives]]
+        themes.append(
+            {
+                "size": int(weights[members].sum()),
+                "centroid": centroids[cluster],
+                "representative_ids": [int(point_id) for point_id in ids[nearest]],
+                "keywords": keywords[cluster],
+            }
+        )
+    return sorted(themes, key=lambda theme: -theme["size"])
+
+
+def scroll_collection(
+    client: QdrantClient,
+    collection_name: str,
+    payload_fields: list[str],
+    batch_size: int = 1000,
+):
+    """
+    Read every point of a collection, with its vector and some payload
+    fields, plus duplicate_count, set on the points of a deduplicated collection
+
+    Args:
+        client (QdrantClient): Qdrant client
+        collection_name (str): name of the collection
+        payload_fields (list[str]): payload fields to read
+        batch_size (int): points per request
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, list[dict]]: ids, (n, size) float32
+            vectors and payloads
+    """
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection_name,
+            with_payload=list(payload_fields) + ["duplicate_count"],
+            with_vectors=True,
+            limit=batch_size,
+            offset=offset,
+        )
+        for record in records:
+            ids.append(record.id)
+            vectors.append(record.vector)
+            payloads.append(record.payload)
+        print(f"Read {len(ids)} points from {collection_name}")
+        if offset is None:
+            break
+    return np.array(ids, dtype=np.int64), np.array(vectors, dtype=np.float32), payloads
+
+
+def build_theme_index(
+    ids: np.ndarray,
+    vectors: np.ndarray,
+    payloads: list[dict],
+    url_depth: int = 1,
+    min_group_size: int = 20,
+    max_clusters: int = 20,
+    seed: int = 0,
+) -> dict:
+    """
+    Cluster records into themes per url prefix and per primary department.
+    Points of a deduplicated collection are weighted by their duplicate_count,
+    so group and theme sizes count records.
+
+    Args:
+        ids (np.ndarray): point ids
+        vectors (np.ndarray): (n, size) vectors
+        payloads (list[dict]): payloads with "url", "primary_department" and
+            "feedback", and "duplicate_count" if deduplicated
+        url_depth (int): path segments in a url prefix
+        min_group_size (int): smallest group to find themes for
+        max_clusters (int): most themes per group
+        seed (int): random seed
+
+    Returns:
+        dict: "url_depth", and for each of THEME_GROUPS, group value to its themes
+    """
+    groups = {name: defaultdict(list) for name in THEME_GROUPS}
+    for idx, payload in enumerate(payloads):
+        groups["url_prefix"][url_prefix(payload.get("url"), url_depth)].append(idx)
+        groups["primary_department"][payload.get("primary_department") or ""].append(
+            idx
+        )
+
+    weights = np.array(
+        [payload.get("duplicate_count") or 1 for payload in payloads], dtype=np.float64
+    )
+    index = {"url_depth": url_depth}
+    for name, group_indices in groups.items():
+        index[name] = {}
+        for value, indices in group_indices.items():
+            indices = np.array(indices)
+            if weights[indices].sum() < min_group_size:
+                continue
+            index[name][value] = build_group_themes(
+                ids[indices],
+                vectors[indices],
+                [payloads[idx].get("feedback") or "" for idx in indices],
+                max_clusters=max_clusters,
+                seed=seed,
+                weights=weights[indices],
+            )
+        print(f"Built themes for {len(index[name])} groups by {name}")
+    return index
+
+
+def save_theme_index(index: dict, path: str):
+    """
+    Save a theme index as JSON, with the centroids in a .npy file alongside
+    it, e.g. data/theme_index.json and data/theme_index_centroids.npy
+
+    Args:
+        index (dict): index from build_theme_index
+        path (str): JSON file to write
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    centroids = []
+    serialisable = {"url_depth": index["url_depth"]}
+    for name in THEME_GROUPS:
+        serialisable[name] = {}
+        for value, themes in index[name].items():
+            serialisable[name][value] = []
+            for theme in themes:
+                serialisable[name][value].append(
+                    {
+                        "size": theme["size"],
+                        "centroid_index": len(centroids),
+                        "representative_ids": theme["representative_ids"],
+                        "keywords": theme["keywords"],
+                    }
+                )
+                centroids.append(theme["centroid"])
+    with open(path, "w") as file:
+        json.dump(serialisable, file)
+    np.save(_centroids_path(path), np.array(centroids, dtype=np.float32))
+    print(f"Theme index saved to {path} with {len(centroids)} themes")
+
+
+def load_theme_index(path: str) -> dict:
+    """
+    Load a theme index saved by save_theme_index
+
+    Args:
+        path (str): JSON file of the index
+
+    Returns:
+        dict: the index, with each theme's "centroid"
+    """
+    with open(path, "r") as file:
+        index = json.load(file)
+    centroids = np.load(_centroids_path(path))
+    for name in THEME_GROUPS:
+        for themes in index[name].values():
+            for theme in themes:
+                theme["centroid"] = centroids[theme.pop("centroid_index")]
+    return index
+
+
+def _centroids_path(path: str) -> str:
+    return f"{os.path.splitext(path)[0]}_centroids.npy"
+
+
+def get_themes(index: dict, urls: list[str] = (), departments: list[str] = ()) -> dict:
+    """
+    Look up the precomputed themes for the urls and departments being browsed
+
+    Args:
+        index (dict): index from load_theme_index
+        urls (list[str]): page paths; their url prefixes are looked up
+        departments (list[str]): primary departments
+
+    Returns:
+        dict: group label, e.g. "/browse" or "HM Revenue & Customs", to its themes
+    """
+    themes = {}
+    for url in urls:
+        prefix = url_prefix(url, index["url_depth"])
+        if prefix in index["url_prefix"]:
+            themes[prefix] = index["url_prefix"][prefix]
+    for department in departments:
+        if department in index["primary_department"]:
+            themes[department] = index["primary_department"][department]
+    return themes
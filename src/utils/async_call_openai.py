@@ -1,16 +1,27 @@
 import asyncio
+import hashlib
+import json
+import random
+import time
 
-from openai import AsyncOpenAI
+import openai
 
+from src.utils.clients import get_async_openai_client
+from src.utils.label_store import LabelStore, label_key
 
-async def create_openai_labelled_data(
-    labelled_examples: str,
-    new_example: str,
-    open_api_key: str,
-) -> dict:
-    client = AsyncOpenAI(api_key=open_api_key)
+LABELLING_MODEL = "gpt-3.5-turbo-0125"
+LABELLING_MAX_TOKENS = 250
+
+# Defaults for the labelling engine, below the gpt-3.5-turbo tier 1 limits
+DEFAULT_CONCURRENCY = 16
+DEFAULT_REQUESTS_PER_MINUTE = 3000
+DEFAULT_TOKENS_PER_MINUTE = 150000
+DEFAULT_MAX_RETRIES = 6
+
+# Completion tokens allowed per record when several are labelled per request
+PACKED_MAX_TOKENS_PER_RECORD = 100
 
-    system_prompt = """
+LABELLING_SYSTEM_PROMPT = """
         You are an expert tasked with categorising user feedback for the UK government, submitted through the website www.gov.uk. Your input is a JSON containing two key pieces of information: a unique identifier (id) and the user feedback (feedback).
 
         Your objective is to analyze the feedback and assign an appropriate label or labels that accurately categorise the feedback. These labels should reflect the concrete issues encountered or digital services mentioned in the feedback rather than reflect the subjective opinions or emotions mentioned in the feedback.
@@ -38,6 +49,18 @@ async def create_openai_labelled_data(
         Remember, your analysis and categorisation play a vital role in improving government digital services and ensuring that they meet the needs of the public efficiently and effectively.
         """
 
+
+def build_labelling_messages(labelled_examples: str, new_example: str) -> list:
+    """
+    Build the chat messages asking OpenAI to label one feedback record
+
+    Args:
+        labelled_examples (str): JSON string of labelled example records
+        new_example (str): JSON string of the record to label
+
+    Returns:
+        list: system and user messages
+    """
     user_prompt = f"""
         Before you label the following record, let's reflect on the examples provided and apply similar reasoning to ensure consistency and accuracy in our categorisation. Consider the nature of the feedback, its relevance to government services, and the immediacy with which the issue it raises should be addressed.
 
@@ -53,54 +76,583 @@ async def create_openai_labelled_data(
 
         Your output should include only the keys "id", "labels", and "urgency", and their respective values. Reflect on the content of the feedback, its implications for government services, and the potential impact on users to make your assessment. Always return your analysis in valid JSON format.
     """
+    return [
+        {"role": "system", "content": LABELLING_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def build_packed_labelling_messages(labelled_examples: str, new_examples: str) -> list:
+    """
+    Build the chat messages asking OpenAI to label several feedback records
+    in one request
+
+    Args:
+        labelled_examples (str): JSON string of labelled example records
+        new_examples (str): JSON array of the records to label
+
+    Returns:
+        list: system and user messages
+    """
+    user_prompt = f"""
+        Before you label the following records, let's reflect on the examples provided and apply similar reasoning to ensure consistency and accuracy in our categorisation. Consider the nature of the feedback, its relevance to government services, and the immediacy with which the issue it raises should be addressed.
+
+        This thoughtful approach will guide you in determining the most appropriate labels and the urgency.
+
+        Here are the examples for reference:
+        {labelled_examples}
+
+        Based on these examples, let's proceed to categorise the new pieces of feedback. Label each record on its own merits, as if it were the only record. Remember, we are focusing on identifying the most fitting labels and assessing the urgency accurately, all while ensuring our output is in valid JSON format.
+
+        Here are the feedback records you need to label:
+        {new_examples}
+
+        Your output should be a JSON object with a single key "records", whose value is an array with one object per feedback record, in the same order. Each object should include only the keys "id", "labels", and "urgency", and their respective values, with the "id" copied exactly from the record. Reflect on the content of the feedback, its implications for government services, and the potential impact on users to make your assessment. Always return your analysis in valid JSON format.
+    """
+    return [
+        {"role": "system", "content": LABELLING_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+class TokenBucket:
+    """
+    Token bucket for a per-minute limit: holds up to limit_per_minute tokens
+    and refills continuously at that rate
+    """
+
+    def __init__(self, limit_per_minute: float):
+        self.capacity = float(limit_per_minute)
+        self.rate = self.capacity / 60
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        """
+        Wait until amount tokens are available, then take them. Amounts above
+        the capacity take the whole bucket.
+
+        Args:
+            amount (float): number of tokens to take
+        """
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+
+def estimate_tokens(messages: list, max_tokens: int) -> int:
+    """
+    Estimate the tokens a request counts against the tokens-per-minute limit,
+    as OpenAI does: the prompt at roughly four characters per token, plus the
+    completion's max_tokens
+
+    Args:
+        messages (list): chat messages
+        max_tokens (int): max_tokens of the request
+
+    Returns:
+        int: estimated tokens
+    """
+    characters = sum(len(message["content"]) for message in messages)
+    return characters // 4 + max_tokens
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether an OpenAI request should be retried: rate limits, server errors,
+    timeouts and dropped connections
+
+    Args:
+        error (Exception): the exception raised by the request
+
+    Returns:
+        bool: True if the request may succeed if retried
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def backoff_seconds(
+    attempt: int, error: Exception = None, base: float = 1, cap: float = 60
+) -> float:
+    """
+    Exponential backoff with full jitter, waiting at least as long as the
+    Retry-After header of a rate limit error asks
+
+    Args:
+        attempt (int): number of attempts made so far, starting at 1
+        error (Exception, optional): the exception raised by the last attempt
+        base (float): backoff of the first retry, in seconds
+        cap (float): longest backoff, in seconds
 
+    Returns:
+        float: seconds to wait
+    """
+    seconds = random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
     try:
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ]
-        completion = await client.chat.completions.create(
-            messages=messages,  # type: ignore
-            max_tokens=250,
-            temperature=0.75,
-            model="gpt-3.5-turbo-0125",
-            response_format={"type": "json_object"},
+        seconds = max(seconds, float(retry_after))
+    except (TypeError, ValueError):
+        pass
+    return seconds
+
+
+def iter_records(records_json: str) -> list:
+    """
+    Parse a JSON string of feedback records, as made by jsonify_data, into
+    one JSON string per record
+
+    Args:
+        records_json (str): JSON array of records, or a single record
+
+    Returns:
+        list[str]: each record as a JSON string
+    """
+    records = json.loads(records_json)
+    if isinstance(records, dict):
+        records = [records]
+    return [json.dumps(record, indent=4) for record in records]
+
+
+class RequestLimiter:
+    """
+    Concurrency limit, requests and tokens per minute limits and retries,
+    shared by all the requests of a labelling run
+    """
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+    ):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+
+    async def create_completion(self, client, messages: list, max_tokens: int):
+        """
+        Request a JSON chat completion within the limits, retrying rate limit
+        and server errors
+
+        Args:
+            client (AsyncOpenAI): OpenAI client
+            messages (list): chat messages
+            max_tokens (int): max_tokens of the request
+
+        Returns:
+            ChatCompletion: the completion
+
+        Raises:
+            Exception: the error of the last attempt, if every attempt failed
+        """
+        estimated_tokens = estimate_tokens(messages, max_tokens)
+        attempt = 0
+        while True:
+            attempt += 1
+            await self.request_bucket.acquire(1)
+            await self.token_bucket.acquire(estimated_tokens)
+            try:
+                async with self.semaphore:
+                    return await client.chat.completions.create(
+                        messages=messages,  # type: ignore
+                        max_tokens=max_tokens,
+                        temperature=0.75,
+                        model=LABELLING_MODEL,
+                        response_format={"type": "json_object"},
+                    )
+            except Exception as e:
+                if attempt > self.max_retries or not is_retryable(e):
+                    print(f"OpenAI request failed after {attempt} attempts: {e}")
+                    raise
+                await asyncio.sleep(backoff_seconds(attempt, e))
+
+
+def failed_response(error: str) -> dict:
+    """Response for a record that could not be labelled"""
+    return {
+        "open_labelled_records": None,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "error": error,
+    }
+
+
+async def label_record(
+    client, labelled_examples: str, new_example: str, limiter: RequestLimiter
+) -> dict:
+    """
+    Label one record
+
+    Args:
+        client (AsyncOpenAI): OpenAI client
+        labelled_examples (str): JSON string of labelled example records
+        new_example (str): JSON string of the record to label
+        limiter (RequestLimiter): limits and retries of the run
+
+    Returns:
+        dict: "open_labelled_records", "prompt_tokens" and "completion_tokens",
+            or "open_labelled_records" None and "error" if every attempt failed
+    """
+    messages = build_labelling_messages(labelled_examples, new_example)
+    try:
+        completion = await limiter.create_completion(
+            client, messages, LABELLING_MAX_TOKENS
         )
-        open_labelled_records = completion.choices[0].message.content
-        prompt_tokens = completion.usage.prompt_tokens
-        completion_tokens = completion.usage.completion_tokens
-        return {
-            "open_labelled_records": open_labelled_records,
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-        }  # type: ignore
     except Exception as e:
-        print(f"OpenAI request failed: {e}")
+        return failed_response(str(e))
+    return {
+        "open_labelled_records": completion.choices[0].message.content,
+        "prompt_tokens": completion.usage.prompt_tokens,
+        "completion_tokens": completion.usage.completion_tokens,
+    }
+
+
+def parse_packed_labels(content: str, ids: list) -> dict:
+    """
+    Pick out the labelled records of a packed response, keeping only the
+    requested IDs that have labels and an urgency
+
+    Args:
+        content (str): response content, a JSON object with a "records" array
+        ids (list[str]): IDs of the records in the request
+
+    Returns:
+        dict: ID to labelled record
+    """
+    try:
+        records = json.loads(content)["records"]
+    except (TypeError, ValueError, KeyError):
+        return {}
+    labelled = {}
+    for record in records if isinstance(records, list) else []:
+        if not isinstance(record, dict):
+            continue
+        record_id = str(record.get("id"))
+        if record_id in ids and "labels" in record and "urgency" in record:
+            labelled[record_id] = {
+                "id": record_id,
+                "labels": record["labels"],
+                "urgency": record["urgency"],
+            }
+    return labelled
 
 
-async def get_response(
-    i: str, labelled_examples: str, new_example: str, open_api_key: str
+async def label_pack(
+    client, labelled_examples: str, pack: list, limiter: RequestLimiter
 ) -> dict:
-    response = await create_openai_labelled_data(
-        labelled_examples=labelled_examples,
-        new_example=new_example,
-        open_api_key=open_api_key,
+    """
+    Label several records in one request. Token usage is split evenly over
+    the records that come back labelled.
+
+    Args:
+        client (AsyncOpenAI): OpenAI client
+        labelled_examples (str): JSON string of labelled example records
+        pack (list[dict]): records to label
+        limiter (RequestLimiter): limits and retries of the run
+
+    Returns:
+        dict: ID to response for each record labelled, or for every record
+            if the request failed. Records missing from the response are left out.
+    """
+    messages = build_packed_labelling_messages(
+        labelled_examples, json.dumps(pack, indent=4)
     )
-    return response
+    try:
+        completion = await limiter.create_completion(
+            client, messages, PACKED_MAX_TOKENS_PER_RECORD * len(pack)
+        )
+    except Exception as e:
+        return {str(record["id"]): failed_response(str(e)) for record in pack}
 
+    ids = [str(record["id"]) for record in pack]
+    labelled = parse_packed_labels(completion.choices[0].message.content, ids)
+    n_labelled = max(len(labelled), 1)
+    return {
+        record_id: {
+            "open_labelled_records": json.dumps(record),
+            "prompt_tokens": completion.usage.prompt_tokens / n_labelled,
+            "completion_tokens": completion.usage.completion_tokens / n_labelled,
+        }
+        for record_id, record in labelled.items()
+    }
 
-async def gather_responses(
-    labelled_subs_json: str, new_subs_json: str, open_api_key: str
+
+async def label_records_packed(
+    client,
+    labelled_examples: str,
+    new_examples: list,
+    limiter: RequestLimiter,
+    pack_size: int,
+    max_requeues: int = 2,
+    on_response=None,
 ) -> list:
-    responses = await asyncio.gather(
-        *[
-            get_response(
-                i,  # type: ignore
-                labelled_examples=labelled_subs_json,
-                new_example=i,
-                open_api_key=open_api_key,
-            )
-            for i in new_subs_json.split("},")  # type: ignore
+    """
+    Label records pack_size at a time, re-queueing records missing from a
+    response into later packs
+
+    Args:
+        client (AsyncOpenAI): OpenAI client
+        labelled_examples (str): JSON string of labelled example records
+        new_examples (list[str]): JSON string of each record to label
+        limiter (RequestLimiter): limits and retries of the run
+        pack_size (int): records per request
+        max_requeues (int): times a missing record is re-queued before it fails
+        on_response (callable, optional): called with the record ID and
+            response as each record is labelled
+
+    Returns:
+        list[dict]: a response per record, in the order of new_examples
+    """
+    records = [json.loads(new_example) for new_example in new_examples]
+    ids = [str(record["id"]) for record in records]
+    responses = {}
+    pending = records
+
+    async def label_and_report(pack):
+        pack_responses = await label_pack(client, labelled_examples, pack, limiter)
+        if on_response is not None:
+            for record_id, response in pack_responses.items():
+                on_response(record_id, response)
+        return pack_responses
+
+    for _ in range(max_requeues + 1):
+        packs = [
+            pending[start : start + pack_size]
+            for start in range(0, len(pending), pack_size)
         ]
+        for pack_responses in await asyncio.gather(
+            *[label_and_report(pack) for pack in packs]
+        ):
+            responses.update(pack_responses)
+        # Records that failed after retries aren't re-queued, only missing ones
+        pending = [record for record in pending if str(record["id"]) not in responses]
+        if not pending:
+            break
+        print(f"Re-queueing {len(pending)} records missing from packed responses")
+
+    return [
+        responses.get(record_id)
+        or failed_response("Record missing from packed responses")
+        for record_id in ids
+    ]
+
+
+async def label_uncached_records(
+    client,
+    labelled_examples: str,
+    new_examples: list,
+    limiter: RequestLimiter,
+    pack_size: int = 1,
+    on_response=None,
+) -> list:
+    """
+    Label records one or pack_size per request
+
+    Args:
+        client (AsyncOpenAI): OpenAI client
+        labelled_examples (str): JSON string of labelled example records
+        new_examples (list[str]): JSON string of each record to label
+        limiter (RequestLimiter): limits and retries of the run
+        pack_size (int): records labelled per request
+        on_response (callable, optional): called with the record ID and
+            response as each record is labelled
+
+    Returns:
+        list[dict]: a response per record, in the order of new_examples
+    """
+    if pack_size > 1:
+        return await label_records_packed(
+            client,
+            labelled_examples,
+            new_examples,
+            limiter,
+            pack_size,
+            on_response=on_response,
+        )
+
+    async def label_and_report(new_example):
+        response = await label_record(client, labelled_examples, new_example, limiter)
+        if on_response is not None:
+            on_response(str(json.loads(new_example)["id"]), response)
+        return response
+
+    return await asyncio.gather(
+        *[label_and_report(new_example) for new_example in new_examples]
+    )
+
+
+def labelling_prompt_version(labelled_examples: str) -> str:
+    """
+    Version of the labelling prompt, examples and model, so stored labels are
+    only reused for the same labelling setup
+
+    Args:
+        labelled_examples (str): JSON string of labelled example records
+
+    Returns:
+        str: short hash of the setup
+    """
+    content = f"{LABELLING_MODEL}\n{LABELLING_SYSTEM_PROMPT}\n{labelled_examples}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_labels(content: str):
+    """
+    Parse the labels and urgency out of a labelled record
+
+    Args:
+        content (str): JSON string of a labelled record
+
+    Returns:
+        dict: {"labels", "urgency"}, or None if either is missing
+    """
+    try:
+        record = json.loads(content)
+        return {"labels": record["labels"], "urgency": record["urgency"]}
+    except (TypeError, ValueError, KeyError):
+        return None
+
+
+async def label_records(
+    labelled_examples: str,
+    new_examples: list,
+    open_api_key: str,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    requests_per_minute: int = DEFAULT_REQUESTS_PER_MINUTE,
+    tokens_per_minute: int = DEFAULT_TOKENS_PER_MINUTE,
+    max_retries: int = DEFAULT_MAX_RETRIES,
+    pack_size: int = 1,
+    store: LabelStore = None,
+    prompt_version: str = None,
+    client=None,
+) -> list:
+    """
+    Label records with bounded concurrency, keeping under the requests and
+    tokens per minute limits of the OpenAI account. With a store, texts
+    already labelled under the same prompt version are served from it,
+    duplicate texts are labelled once, and labels are stored as they arrive,
+    so an interrupted run picks up where it stopped.
+
+    Args:
+        labelled_examples (str): JSON string of labelled example records
+        new_examples (list[str]): JSON string of each record to label
+        open_api_key (str): OpenAI API key
+        concurrency (int): most requests in flight at once
+        requests_per_minute (int): requests per minute limit
+        tokens_per_minute (int): tokens per minute limit
+        max_retries (int): retries per request after the first attempt
+        pack_size (int): records labelled per request. Above 1, the system
+            prompt and examples are sent once for several records.
+        store (LabelStore, optional): label cache
+        prompt_version (str, optional): version to store labels under.
+            Defaults to labelling_prompt_version of the examples.
+        client (AsyncOpenAI, optional): client to use. Defaults to the shared client.
+
+    Returns:
+        list[dict]: a response per record, in the order of new_examples.
+            Responses served from the store have "cached" True and no tokens.
+    """
+    if client is None:
+        # Retries are handled here, so the client shouldn't retry as well
+        client = get_async_openai_client(open_api_key).with_options(max_retries=0)
+    limiter = RequestLimiter(
+        concurrency, requests_per_minute, tokens_per_minute, max_retries
     )
+    if store is None:
+        return await label_uncached_records(
+            client, labelled_examples, new_examples, limiter, pack_size
+        )
+
+    if prompt_version is None:
+        prompt_version = labelling_prompt_version(labelled_examples)
+    records = [json.loads(new_example) for new_example in new_examples]
+    keys = [label_key(record["feedback"], prompt_version) for record in records]
+    labels = store.get_many(keys)
+
+    # Label the first record of each text not in the store
+    to_label = {}
+    for idx, key in enumerate(keys):
+        if key not in labels and key not in to_label:
+            to_label[key] = idx
+    key_by_id = {str(records[idx]["id"]): key for key, idx in to_label.items()}
+    print(
+        f"{len(records) - len(to_label)} of {len(records)} records served from the label store"
+    )
+
+    def store_response(record_id, response):
+        parsed = parse_labels(response["open_labelled_records"])
+        if parsed is not None:
+            store.put(
+                key_by_id[record_id],
+                prompt_version,
+                parsed["labels"],
+                parsed["urgency"],
+            )
+
+    new_responses = await label_uncached_records(
+        client,
+        labelled_examples,
+        [new_examples[idx] for idx in to_label.values()],
+        limiter,
+        pack_size,
+        on_response=store_response,
+    )
+    labelled_responses = dict(zip(to_label.keys(), new_responses))
+
+    responses = []
+    for idx, (record, key) in enumerate(zip(records, keys)):
+        if to_label.get(key) == idx:
+            # The record labelled by OpenAI for this text
+            responses.append(labelled_responses[key])
+            continue
+        parsed = labels.get(key) or parse_labels(
+            labelled_responses[key]["open_labelled_records"]
+        )
+        if parsed is None:
+            responses.append(labelled_responses[key])
+            continue
+        responses.append(
+            {
+                "open_labelled_records": json.dumps({"id": record["id"], **parsed}),
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "cached": True,
+            }
+        )
     return responses
+
+
+async def gather_responses(
+    labelled_subs_json: str, new_subs_json: str, open_api_key: str, **kwargs
+) -> list:
+    """
+    Label every record in new_subs_json using labelled_subs_json as examples
+
+    Args:
+        labelled_subs_json (str): JSON string of labelled example records
+        new_subs_json (str): JSON string of records to label, from jsonify_data
+        open_api_key (str): OpenAI API key
+        **kwargs: concurrency, rate limit, retry, pack_size and store settings
+            for label_records
+
+    Returns:
+        list[dict]: a response per record, in order
+    """
+    return await label_records(
+        labelled_subs_json, iter_records(new_subs_json), open_api_key, **kwargs
+    )
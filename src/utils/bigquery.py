@@ -1,6 +1,10 @@
+import json
+
 from google.cloud import bigquery
 from google.api_core.exceptions import NotFound
 
+from src.utils.clients import get_bigquery_client
+
 
 def query_bigquery(project_id: str, query: str, write_to_dict: bool = True):
     """Extracts feedback records from BigQuery
@@ -13,8 +17,8 @@ def query_bigquery(project_id: str, query: str, write_to_dict: bool = True):
     Returns:
         dict: Dictionary containing feedback records
     """
-    # Initialize a BigQuery client
-    client = bigquery.Client(project=project_id)
+    # Get the shared BigQuery client
+    client = get_bigquery_client(project_id)
 
     # Construct a reference to the dataset
     # dataset_ref = client.dataset(dataset_id)
@@ -37,45 +41,210 @@ def query_bigquery(project_id: str, query: str, write_to_dict: bool = True):
     return result
 
 
-def write_to_bigquery(
-    table_id: str,
-    responses: list[dict],
-    publishing_project_id: str,
-) -> None:
+def iter_bigquery_rows(project_id: str, query: str, page_size: int = 10000):
     """
-    Writes data to BigQuery
+    Stream the results of a query, a page at a time, so tables larger than
+    memory can be read, e.g. by reservoir_sample
+
+    Args:
+        project_id (str): BigQuery project ID
+        query (str): SQL query to get data from BigQuery
+        page_size (int): rows fetched per page
+
+    Yields:
+        dict: one row
     """
-    # Initialize a BigQuery client
-    client = bigquery.Client(project=publishing_project_id)
+    client = get_bigquery_client(project_id)
+    for row in client.query(query).result(page_size=page_size):
+        yield dict(row)
 
-    # Define schema for the table
-    schema = [
-        bigquery.SchemaField("id", "STRING"),
-        bigquery.SchemaField("labels", "STRING", mode="REPEATED"),
-        bigquery.SchemaField("urgency", "INTEGER"),
-    ]
 
-    # Create a list to hold the rows
-    rows = []
+# Schema of the OpenAI labelling results table
+LABELLED_SCHEMA = [
+    bigquery.SchemaField("id", "STRING"),
+    bigquery.SchemaField("labels", "STRING", mode="REPEATED"),
+    bigquery.SchemaField("urgency", "INTEGER"),
+]
+
+# Streaming inserts are limited to 10MB per request
+MAX_INSERT_BYTES = 9_000_000
+INSERT_BATCH_SIZE = 500
+# From this many rows a load job is used, which has no per-request limits
+LOAD_JOB_MIN_ROWS = 10000
+
 
-    # Convert each response dictionary to a BigQuery row
-    for response in responses:
-        row = {
-            "id": eval(response["open_labelled_records"])["id"],
-            "labels": eval(response["open_labelled_records"])["labels"],
-            "urgency": eval(response["open_labelled_records"])["urgency"],
+def parse_labelled_response(response: dict) -> dict:
+    """
+    Parse an OpenAI labelling response into a row of LABELLED_SCHEMA
+
+    Args:
+        response (dict): response from gather_responses
+
+    Returns:
+        dict: row with "id", "labels" and "urgency"
+
+    Raises:
+        ValueError: if the response has no valid labelled record
+    """
+    content = response.get("open_labelled_records") if response else None
+    if content is None:
+        raise ValueError((response or {}).get("error", "No labelled record"))
+    record = json.loads(content)
+    try:
+        labels = record["labels"]
+        return {
+            "id": str(record["id"]),
+            "labels": [labels] if isinstance(labels, str) else list(labels),
+            "urgency": int(record["urgency"])
+            if record["urgency"] is not None
+            else None,
         }
-        rows.append(row)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid labelled record {content!r}: {e!r}") from e
+
+
+def iter_insert_batches(
+    rows: list,
+    batch_size: int = INSERT_BATCH_SIZE,
+    max_bytes: int = MAX_INSERT_BYTES,
+):
+    """
+    Split rows into batches of at most batch_size rows and about max_bytes of JSON
+
+    Args:
+        rows (list[tuple[int, dict]]): index and row pairs
+        batch_size (int): most rows per batch
+        max_bytes (int): most JSON bytes per batch
 
-    # Write rows to BigQuery
+    Yields:
+        list[tuple[int, dict]]: a batch of index and row pairs
+    """
+    batch = []
+    batch_bytes = 0
+    for index, row in rows:
+        row_bytes = len(json.dumps(row).encode("utf-8"))
+        if batch and (len(batch) >= batch_size or batch_bytes + row_bytes > max_bytes):
+            yield batch
+            batch = []
+            batch_bytes = 0
+        batch.append((index, row))
+        batch_bytes += row_bytes
+    if batch:
+        yield batch
+
+
+def get_or_create_table(client: bigquery.Client, table_id: str, schema: list):
+    """Get a BigQuery table, creating it with the schema if it doesn't exist"""
     try:
-        table = client.get_table(table_id)
+        return client.get_table(table_id)
     except NotFound:
-        table = bigquery.Table(table_id, schema=schema)
-        table = client.create_table(table)
+        return client.create_table(bigquery.Table(table_id, schema=schema))
+
+
+def write_labels_to_bigquery(
+    table_id: str,
+    responses: list[dict],
+    project_id: str,
+    batch_size: int = INSERT_BATCH_SIZE,
+    load_job_min_rows: int = LOAD_JOB_MIN_ROWS,
+    client: bigquery.Client = None,
+) -> list[dict]:
+    """
+    Write OpenAI labelling responses to BigQuery, parsing each response once.
+    Fewer than load_job_min_rows rows are streamed in size-bounded batches;
+    more are written with a single load job.
+
+    Args:
+        table_id (str): table to write to, created if it doesn't exist
+        responses (list[dict]): responses from gather_responses
+        project_id (str): BigQuery project ID
+        batch_size (int): most rows per streaming insert
+        load_job_min_rows (int): rows from which a load job is used
+        client (bigquery.Client, optional): client to use. Defaults to the shared client.
+
+    Returns:
+        list[dict]: failures, each with the "index" of the response in
+            responses, the "response" and the "error", so they can be retried
+    """
+    if client is None:
+        client = get_bigquery_client(project_id)
+
+    failures = []
+    rows = []
+    for index, response in enumerate(responses):
+        try:
+            rows.append((index, parse_labelled_response(response)))
+        except ValueError as e:
+            failures.append({"index": index, "response": response, "error": str(e)})
+    if not rows:
+        return failures
+
+    table = get_or_create_table(client, table_id, LABELLED_SCHEMA)
+
+    def fail_all(batch, error):
+        failures.extend(
+            {"index": index, "response": responses[index], "error": str(error)}
+            for index, _ in batch
+        )
+
+    if len(rows) >= load_job_min_rows:
+        job_config = bigquery.LoadJobConfig(
+            schema=LABELLED_SCHEMA,
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
+        try:
+            client.load_table_from_json(
+                [row for _, row in rows], table, job_config=job_config
+            ).result()
+        except Exception as e:
+            fail_all(rows, e)
+    else:
+        for batch in iter_insert_batches(rows, batch_size=batch_size):
+            try:
+                errors = client.insert_rows_json(
+                    table,
+                    [row for _, row in batch],
+                    # Lets BigQuery drop duplicates if a batch is retried
+                    row_ids=[row["id"] for _, row in batch],
+                )
+            except Exception as e:
+                fail_all(batch, e)
+                continue
+            for error in errors:
+                index = batch[error["index"]][0]
+                failures.append(
+                    {
+                        "index": index,
+                        "response": responses[index],
+                        "error": str(error["errors"]),
+                    }
+                )
+
+    return sorted(failures, key=lambda failure: failure["index"])
 
-    errors = client.insert_rows(table, rows)
-    if errors == []:
+
+def write_to_bigquery(
+    table_id: str,
+    responses: list[dict],
+    publishing_project_id: str,
+) -> list[dict]:
+    """
+    Writes OpenAI labelling responses to BigQuery
+
+    Args:
+        table_id (str): table to write to, created if it doesn't exist
+        responses (list[dict]): responses from gather_responses
+        publishing_project_id (str): BigQuery project ID
+
+    Returns:
+        list[dict]: failed rows, from write_labels_to_bigquery
+    """
+    failures = write_labels_to_bigquery(table_id, responses, publishing_project_id)
+    if not failures:
         print(f"Data inserted into table {table_id}")
     else:
-        print(f"Errors occurred while inserting data into table {table_id}: {errors}")
+        print(
+            f"{len(failures)} of {len(responses)} rows could not be inserted into table {table_id}: {[failure['error'] for failure in failures[:10]]}"
+        )
+    return failures
@@ -1,6 +1,7 @@
-from openai import OpenAI
 import tiktoken
 
+from src.utils.clients import get_openai_client
+
 
 class Summariser:
     def __init__(
@@ -11,7 +12,7 @@ class Summariser:
         seed=None,
         model="gpt-3.5-turbo-0125",
     ):
-        self.client = OpenAI(api_key=open_api_key)
+        self.client = get_openai_client(open_api_key)
         self.temperature = temperature
         self.max_tokens = max_tokens
         self.seed = seed
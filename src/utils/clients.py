@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import weakref
+
+import httpx
+from google.cloud import bigquery
+from openai import AsyncOpenAI, OpenAI
+
+# Connection pool settings shared by the OpenAI clients
+HTTP_LIMITS = httpx.Limits(
+    max_connections=100, max_keepalive_connections=20, keepalive_expiry=60
+)
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+
+_lock = threading.Lock()
+_bigquery_clients = {}
+_openai_clients = {}
+# Async clients are bound to the event loop they were created in
+_async_openai_clients = weakref.WeakKeyDictionary()
+
+
+def get_bigquery_client(project_id: str) -> bigquery.Client:
+    """
+    Get the process-wide BigQuery client for a project, creating it on first use
+
+    Args:
+        project_id (str): BigQuery project ID
+
+    Returns:
+        bigquery.Client: the shared client
+    """
+    with _lock:
+        if project_id not in _bigquery_clients:
+            _bigquery_clients[project_id] = bigquery.Client(project=project_id)
+        return _bigquery_clients[project_id]
+
+
+def get_openai_client(api_key: str) -> OpenAI:
+    """
+    Get the process-wide OpenAI client for an API key, creating it on first
+    use with a keep-alive connection pool
+
+    Args:
+        api_key (str): OpenAI API key
+
+    Returns:
+        OpenAI: the shared client
+    """
+    with _lock:
+        if api_key not in _openai_clients:
+            _openai_clients[api_key] = OpenAI(
+                api_key=api_key,
+                http_client=httpx.Client(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+            )
+        return _openai_clients[api_key]
+
+
+def get_async_openai_client(api_key: str) -> AsyncOpenAI:
+    """
+    Get the AsyncOpenAI client for an API key and the running event loop,
+    creating it on first use with a keep-alive connection pool. Must be
+    called from a coroutine.
+
+    Args:
+        api_key (str): OpenAI API key
+
+    Returns:
+        AsyncOpenAI: the shared client for this event loop
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        loop_clients = _async_openai_clients.setdefault(loop, {})
+        if api_key not in loop_clients:
+            loop_clients[api_key] = AsyncOpenAI(
+                api_key=api_key,
+                http_client=httpx.AsyncClient(limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT),
+            )
+        return loop_clients[api_key]
+
+
+def clear_clients():
+    """Drop all shared clients, e.g. after forking or in tests"""
+    with _lock:
+        _bigquery_clients.clear()
+        _openai_clients.clear()
+        _async_openai_clients.clear()
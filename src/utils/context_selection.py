@@ -0,0 +1,99 @@
+import numpy as np
+
+
+def cluster_by_threshold(vectors: np.ndarray, similarity_threshold: float = 0.9):
+    """
+    Group ranked results into clusters of near-identical feedback. Results are
+    taken in rank order, and each joins the most similar existing cluster if
+    its similarity to that cluster's leader is at least similarity_threshold,
+    or else leads a new cluster. Leaders are therefore the most relevant
+    result of their cluster.
+
+    Args:
+        vectors (np.ndarray): (n, size) vectors of the results, in rank order
+        similarity_threshold (float): cosine similarity to join a cluster at
+
+    Returns:
+        tuple[np.ndarray, list[int]]: cluster index per result, and the
+            result index of each cluster's leader
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    labels = np.zeros(len(vectors), dtype=np.int64)
+    leaders = []
+    if len(vectors) == 0:
+        return labels, leaders
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0, 1, norms)
+
+    leader_vectors = np.empty_like(unit)
+    for idx, vector in enumerate(unit):
+        if leaders:
+            similarities = leader_vectors[: len(leaders)] @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] >= similarity_threshold:
+                labels[idx] = best
+                continue
+        labels[idx] = len(leaders)
+        leader_vectors[len(leaders)] = vector
+        leaders.append(idx)
+    return labels, leaders
+
+
+def select_context(
+    feedback: list[str],
+    vectors: np.ndarray,
+    count_tokens,
+    token_budget: int,
+    similarity_threshold: float = 0.9,
+    weights: list[int] = None,
+) -> list[dict]:
+    """
+    Pick one representative per cluster of near-identical feedback, largest
+    clusters first, until the token budget is spent, so repeated comments
+    don't crowd out smaller themes
+
+    Args:
+        feedback (list[str]): feedback of the results, in rank order
+        vectors (np.ndarray): (n, size) vectors of the results, in rank order
+        count_tokens (callable): returns the number of tokens in a string
+        token_budget (int): tokens available for the feedback
+        similarity_threshold (float): cosine similarity to cluster at
+        weights (list[int], optional): number of records each result stands
+            for, e.g. duplicate_count from a deduplicated collection.
+            Defaults to 1 each.
+
+    Returns:
+        list[dict]: "feedback" of each selected representative and "count",
+            the number of records in its cluster, largest first
+    """
+    labels, leaders = cluster_by_threshold(vectors, similarity_threshold)
+    if weights is None:
+        weights = np.ones(len(feedback), dtype=np.int64)
+    counts = np.bincount(labels, weights=weights, minlength=len(leaders)).astype(int)
+
+    selected = []
+    used_tokens = 0
+    # Largest clusters first, then the most relevant
+    for cluster in sorted(range(len(leaders)), key=lambda c: (-counts[c], leaders[c])):
+        text = feedback[leaders[cluster]]
+        tokens = count_tokens(format_context_record(text, counts[cluster]))
+        if used_tokens + tokens > token_budget:
+            continue
+        used_tokens += tokens
+        selected.append({"feedback": text, "count": int(counts[cluster])})
+    return selected
+
+
+def format_context_record(feedback: str, count: int) -> str:
+    """
+    Format a selected record for the summary prompt, with the number of
+    records it represents
+
+    Args:
+        feedback (str): the representative feedback
+        count (int): number of records in its cluster
+
+    Returns:
+        str: the record for the prompt
+    """
+    return f"[{count} record{'s' if count != 1 else ''}] {feedback}"
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+
+DEFAULT_LABEL_STORE_PATH = "data/label_store.sqlite"
+
+
+def normalise_feedback(text: str) -> str:
+    """
+    Normalise feedback text so trivially different copies share a label:
+    lower case, with whitespace collapsed and trimmed
+
+    Args:
+        text (str): feedback text
+
+    Returns:
+        str: normalised text
+    """
+    return re.sub(r"\s+", " ", str(text)).strip().lower()
+
+
+def label_key(text: str, prompt_version: str) -> str:
+    """
+    Cache key of a feedback text's labels under a prompt version
+
+    Args:
+        text (str): feedback text
+        prompt_version (str): version of the labelling prompt and examples
+
+    Returns:
+        str: sha256 hex digest
+    """
+    content = f"{prompt_version}\n{normalise_feedback(text)}"
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class LabelStore:
+    """
+    SQLite store of OpenAI labels, keyed by label_key, so labelling runs can
+    resume and duplicate texts are labelled once
+    """
+
+    def __init__(self, path: str = DEFAULT_LABEL_STORE_PATH):
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS labels (
+                key TEXT PRIMARY KEY,
+                prompt_version TEXT NOT NULL,
+                labels TEXT NOT NULL,
+                urgency INTEGER,
+                created TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        self.connection.commit()
+
+    def get_many(self, keys: list) -> dict:
+        """
+        Look up stored labels
+
+        Args:
+            keys (list[str]): keys from label_key
+
+        Returns:
+            dict: key to {"labels", "urgency"}, for the keys that are stored
+        """
+        found = {}
+        unique_keys = list(dict.fromkeys(keys))
+        with self.lock:
+            # Stay under SQLite's limit on query parameters
+            for start in range(0, len(unique_keys), 500):
+                chunk = unique_keys[start : start + 500]
+                rows = self.connection.execute(
+                    f"SELECT key, labels, urgency FROM labels WHERE key IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                )
+                for key, labels, urgency in rows:
+                    found[key] = {"labels": json.loads(labels), "urgency": urgency}
+        return found
+
+    def put(self, key: str, prompt_version: str, labels: list, urgency: int):
+        """
+        Store labels, committing immediately so they survive an interrupted run
+
+        Args:
+            key (str): key from label_key
+            prompt_version (str): version of the labelling prompt and examples
+            labels (list[str]): labels of the text
+            urgency (int): urgency of the text
+        """
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO labels (key, prompt_version, labels, urgency) VALUES (?, ?, ?, ?)",
+                (key, prompt_version, json.dumps(labels), urgency),
+            )
+            self.connection.commit()
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM labels").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,69 @@
+import pandas as pd
+
+from src.common import renaming_dict, urgency_translate
+
+SCORE_COLUMN = "Similarity score"
+DATE_COLUMN = "created_date"
+DUPLICATES_COLUMN = "Similar comments"
+
+# Numeric urgency, as a string, to its human readable label
+INVERTED_URGENCY_TRANSLATE = {value: key for key, value in urgency_translate.items()}
+
+
+def results_to_dataframe(results: list) -> pd.DataFrame:
+    """
+    Build a table of search results with the displayed fields, renamed, plus
+    the similarity score and a parsed created date. Filter search results have
+    no score, so are given a score of 1. Results of a deduplicated collection
+    also get the number of similar comments grouped into each.
+
+    Args:
+        results (list): results of get_semantically_similar_results or
+            filter_search, as points or dicts with a payload
+
+    Returns:
+        pd.DataFrame: one row per result, with the renaming_dict columns,
+            "Similarity score" and "created_date", and "Similar comments" if
+            any payload has a duplicate_count
+    """
+    payloads = []
+    scores = []
+    for result in results:
+        if not isinstance(result, dict):
+            result = dict(result)
+        payloads.append(result["payload"])
+        scores.append(result["score"] if result.get("score") is not None else 1.0)
+
+    df = pd.DataFrame.from_records(payloads, columns=list(renaming_dict.keys()))
+    df = df.rename(columns=renaming_dict)
+    df[SCORE_COLUMN] = pd.Series(scores, index=df.index, dtype="float64")
+    df[DATE_COLUMN] = pd.to_datetime(df[renaming_dict["created"]], format="%Y-%m-%d")
+
+    counts = [(payload or {}).get("duplicate_count") for payload in payloads]
+    if any(count is not None for count in counts):
+        df[DUPLICATES_COLUMN] = pd.Series(
+            [(count or 1) - 1 for count in counts], index=df.index, dtype="int64"
+        )
+
+    # Reformat urgency to human readable, keeping values without a label
+    urgency = df[renaming_dict["urgency"]]
+    df[renaming_dict["urgency"]] = (
+        urgency.astype(str).map(INVERTED_URGENCY_TRANSLATE).fillna(urgency)
+    )
+    return df
+
+
+def format_results_for_display(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Drop the parsed date, as it duplicates the date column, and show the
+    similarity score as a percentage to no decimal places
+
+    Args:
+        df (pd.DataFrame): results from results_to_dataframe
+
+    Returns:
+        pd.DataFrame: the results to display
+    """
+    df = df.drop(columns=[DATE_COLUMN])
+    df[SCORE_COLUMN] = (df[SCORE_COLUMN] * 100).map("{:.0f}%".format)
+    return df
@@ -1,3 +1,5 @@
+import heapq
+import math
 import random
 from collections import Counter, defaultdict
 
@@ -122,3 +124,223 @@ def get_stratified_sample(
             sampled_records.extend(additional_samples)
 
     return sampled_records
+
+
+def allocate_quotas(label_counts: dict, total_sample_size: int) -> dict:
+    """
+    Split a sample size across labels in proportion to their counts using the
+    largest remainder method, so the quotas sum to exactly total_sample_size
+
+    Args:
+        label_counts (dict): label to number of occurrences
+        total_sample_size (int): the desired total number of records to sample
+
+    Returns:
+        dict: label to number of records to sample with that label
+    """
+    total_labels = sum(label_counts.values())
+    if total_labels == 0:
+        return {}
+    exact = {
+        label: count * total_sample_size / total_labels
+        for label, count in label_counts.items()
+    }
+    quotas = {label: int(share) for label, share in exact.items()}
+    shortfall = total_sample_size - sum(quotas.values())
+    # Give the remaining places to the labels with the largest remainders
+    by_remainder = sorted(
+        exact, key=lambda label: exact[label] - quotas[label], reverse=True
+    )
+    for label in by_remainder[:shortfall]:
+        quotas[label] += 1
+    return quotas
+
+
+def get_quota_stratified_sample(
+    records,
+    total_sample_size=20,
+    id_key="feedback_record_id",
+    label_key="labels",
+    seed=None,
+):
+    """
+    Stratified sample in linear time, for large record sets with many labels.
+
+    Quotas per label are allocated in one step with allocate_quotas. The
+    records are then shuffled once and taken in that order while any of their
+    labels still has quota, charging the label with the most quota left. If
+    multi-label records leave the sample short, it is filled with the next
+    unsampled records in the same order. No id is sampled twice.
+
+    Args:
+        records (list of dict): A list where each dict is a record containing at least a 'labels'
+                                key with its value being a list of labels and an 'id' key.
+        total_sample_size (int): The desired total number of records to sample.
+        id_key (str): The name of the key containing the unique id. Required to ensure
+                        there are no duplicates in the sample.
+        label_key (str): The name of the key containing the labels.
+        seed (int, optional): random seed
+
+    Returns:
+        list of dict: up to total_sample_size sampled records, without any duplicates
+    """
+    rng = random.Random(seed)
+    label_counts = Counter(label for record in records for label in record[label_key])
+    quotas = allocate_quotas(label_counts, total_sample_size)
+
+    order = list(range(len(records)))
+    rng.shuffle(order)
+
+    sampled_records = []
+    sampled_ids = set()
+    for idx in order:
+        if len(sampled_records) >= total_sample_size:
+            break
+        record = records[idx]
+        if record[id_key] in sampled_ids:
+            continue
+        open_labels = [label for label in record[label_key] if quotas[label] > 0]
+        if open_labels:
+            quotas[max(open_labels, key=quotas.get)] -= 1
+            sampled_records.append(record)
+            sampled_ids.add(record[id_key])
+
+    # Fill any shortfall from the records not yet sampled
+    for idx in order:
+        if len(sampled_records) >= total_sample_size:
+            break
+        record = records[idx]
+        if record[id_key] not in sampled_ids:
+            sampled_records.append(record)
+            sampled_ids.add(record[id_key])
+
+    return sampled_records
+
+
+class Reservoir:
+    """
+    Uniform sample of up to sample_size items from a stream of unknown
+    length, using Algorithm L: after the reservoir fills, it jumps straight to
+    the next item to keep rather than drawing a random number per item
+    """
+
+    def __init__(self, sample_size: int, rng: random.Random = None):
+        self.sample_size = sample_size
+        self.rng = rng or random.Random()
+        self.items = []
+        self.seen = 0
+        self.weight = 1.0
+        self.next_index = None
+
+    def _skip(self):
+        self.weight *= math.exp(math.log(self.rng.random()) / self.sample_size)
+        gap = math.floor(math.log(self.rng.random()) / math.log1p(-self.weight))
+        self.next_index = self.seen + gap
+
+    def add(self, item):
+        """
+        Offer the next item of the stream
+
+        Args:
+            item: the item
+        """
+        self.seen += 1
+        if self.sample_size <= 0:
+            return
+        if len(self.items) < self.sample_size:
+            self.items.append(item)
+            if len(self.items) == self.sample_size:
+                self._skip()
+        elif self.seen == self.next_index + 1:
+            self.items[self.rng.randrange(self.sample_size)] = item
+            self._skip()
+
+
+def reservoir_sample(records, sample_size: int, seed=None) -> list:
+    """
+    Uniform random sample from any iterable of records, e.g. iter_bigquery_rows,
+    in one pass and O(sample_size) memory
+
+    Args:
+        records (Iterable[dict]): records to sample from
+        sample_size (int): desired sample size
+        seed (int, optional): random seed
+
+    Returns:
+        list: up to sample_size records
+    """
+    reservoir = Reservoir(sample_size, random.Random(seed))
+    for record in records:
+        reservoir.add(record)
+    return reservoir.items
+
+
+def weighted_reservoir_sample(records, sample_size: int, weight, seed=None) -> list:
+    """
+    Weighted random sample without replacement from any iterable of records,
+    in one pass and O(sample_size) memory (Efraimidis-Spirakis A-Res). Records
+    with a weight of 0 or less are never sampled.
+
+    Args:
+        records (Iterable[dict]): records to sample from
+        sample_size (int): desired sample size
+        weight (str or callable): key of the record's weight, or a function
+            of the record returning its weight
+        seed (int, optional): random seed
+
+    Returns:
+        list: up to sample_size records, highest priority first
+    """
+    rng = random.Random(seed)
+    get_weight = weight if callable(weight) else lambda record: record[weight]
+    heap = []
+    for idx, record in enumerate(records):
+        record_weight = get_weight(record)
+        if record_weight <= 0:
+            continue
+        # log(u) / w orders records as u ** (1 / w) does, without underflow
+        priority = math.log(1 - rng.random()) / record_weight
+        if len(heap) < sample_size:
+            heapq.heappush(heap, (priority, idx, record))
+        elif priority > heap[0][0]:
+            heapq.heapreplace(heap, (priority, idx, record))
+    return [record for _, _, record in sorted(heap, reverse=True)]
+
+
+def stratified_reservoir_sample(
+    records, sample_sizes, stratum_key="primary_department", seed=None
+) -> dict:
+    """
+    Uniform random sample of each stratum, e.g. each department or label,
+    from any iterable of records, in one pass and O(total sample size) memory
+
+    Args:
+        records (Iterable[dict]): records to sample from
+        sample_sizes (int or dict): sample size for every stratum, or stratum
+            to sample size. Strata missing from a dict are not sampled.
+        stratum_key (str or callable): key of the record's stratum, or a
+            function of the record returning it. If the value is a list, e.g.
+            of labels, the record is offered to each of its strata.
+        seed (int, optional): random seed
+
+    Returns:
+        dict: stratum to its sampled records
+    """
+    rng = random.Random(seed)
+    get_stratum = (
+        stratum_key if callable(stratum_key) else lambda record: record[stratum_key]
+    )
+    reservoirs = {}
+    for record in records:
+        strata = get_stratum(record)
+        for stratum in strata if isinstance(strata, list) else [strata]:
+            if stratum not in reservoirs:
+                if isinstance(sample_sizes, dict):
+                    if stratum not in sample_sizes:
+                        continue
+                    size = sample_sizes[stratum]
+                else:
+                    size = sample_sizes
+                reservoirs[stratum] = Reservoir(size, rng)
+            reservoirs[stratum].add(record)
+    return {stratum: reservoir.items for stratum, reservoir in reservoirs.items()}
@@ -0,0 +1,316 @@
+import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Same columns and types as query_all_feedback
+FEEDBACK_SCHEMA = pa.schema(
+    [
+        ("feedback_type", pa.string()),
+        ("created", pa.date32()),
+        ("url", pa.string()),
+        ("full_url", pa.string()),
+        ("feedback_record_id", pa.string()),
+        ("feedback", pa.string()),
+        ("urgency", pa.int64()),
+        ("department", pa.string()),
+        ("primary_department", pa.string()),
+        ("document_type", pa.string()),
+        ("embeddings", pa.list_(pa.float32())),
+        ("sentiment", pa.string()),
+        ("spam_classification", pa.string()),
+        ("spam_probability", pa.float64()),
+        ("publishing_app", pa.string()),
+        ("locale", pa.string()),
+        ("page_title", pa.string()),
+        ("taxons", pa.string()),
+    ]
+)
+
+FEEDBACK_TYPES = ["Help page", "Was this page useful", "Contact", "Coronavirus"]
+FEEDBACK_TYPE_WEIGHTS = [0.55, 0.35, 0.08, 0.02]
+DOCUMENT_TYPES = [
+    "guide",
+    "answer",
+    "transaction",
+    "detailed_guide",
+    "form",
+    "news_story",
+    "html_publication",
+    "simple_smart_answer",
+    "travel_advice",
+    "statutory_guidance",
+]
+PUBLISHING_APPS = ["publisher", "whitehall", "smartanswers", "travel-advice-publisher"]
+SENTIMENTS = ["negative", "neutral", "positive"]
+SENTIMENT_WEIGHTS = [0.6, 0.3, 0.1]
+LOCALES = ["en", "cy"]
+LOCALE_WEIGHTS = [0.97, 0.03]
+
+TOPIC_WORDS = [
+    "passport",
+    "visa",
+    "tax",
+    "benefits",
+    "universal credit",
+    "driving licence",
+    "vehicle tax",
+    "pension",
+    "student finance",
+    "council tax",
+    "childcare",
+    "self assessment",
+    "national insurance",
+    "MOT",
+    "immigration",
+    "business rates",
+    "VAT",
+    "apprenticeships",
+    "housing",
+    "court",
+]
+COMPLAINTS = [
+    "I cannot find how to",
+    "The page does not explain how to",
+    "There is no way to",
+    "The link is broken when I try to",
+    "It took weeks to",
+    "Why is it so hard to",
+    "Please make it easier to",
+    "I was charged twice when trying to",
+]
+ACTIONS = ["apply for", "renew", "pay for", "check", "update", "cancel", "claim"]
+
+# Share of records that are spam, and the urgency distribution produced by
+# CAST(ROUND(RAND() * 3) AS INT64) in query_all_feedback
+SPAM_SHARE = 0.1
+URGENCY_WEIGHTS = [1 / 6, 1 / 3, 1 / 3, 1 / 6]
+
+
+def _zipf_weights(n: int, exponent: float) -> np.ndarray:
+    """Normalised Zipf weights for ranks 1..n"""
+    weights = 1 / np.arange(1, n + 1) ** exponent
+    return weights / weights.sum()
+
+
+def build_corpus_profile(
+    n_pages: int = 20000,
+    n_departments: int = 300,
+    n_topics: int = 200,
+    embedding_size: int = 768,
+    zipf_exponent: float = 1.1,
+    seed: int = 0,
+) -> dict:
+    """
+    Build the fixed parts of a synthetic corpus: pages with a popularity,
+    department, document type and topic, and a unit-length centroid per topic
+
+    Args:
+        n_pages (int): number of distinct urls
+        n_departments (int): number of publishing departments
+        n_topics (int): number of embedding clusters
+        embedding_size (int): embedding dimension. Defaults to 768.
+        zipf_exponent (float): skew of page and department popularity
+        seed (int): random seed
+
+    Returns:
+        dict: page and topic arrays used by generate_feedback_batches
+    """
+    rng = np.random.default_rng(seed)
+
+    departments = np.array([f"Department {idx}" for idx in range(n_departments)])
+    # A few departments publish most pages
+    page_department = rng.choice(
+        n_departments, size=n_pages, p=_zipf_weights(n_departments, zipf_exponent)
+    )
+    page_topic = rng.integers(0, n_topics, size=n_pages)
+    topic_words = np.array(TOPIC_WORDS)[np.arange(n_topics) % len(TOPIC_WORDS)]
+    urls = np.array(
+        [
+            f"/{topic_words[topic].replace(' ', '-')}/page-{idx}"
+            for idx, topic in enumerate(page_topic)
+        ]
+    )
+    page_titles = np.array(
+        [
+            f"{topic_words[topic].capitalize()}: guidance {idx}"
+            for idx, topic in enumerate(page_topic)
+        ]
+    )
+
+    centroids = rng.normal(size=(n_topics, embedding_size)).astype(np.float32)
+    centroids /= np.linalg.norm(centroids, axis=1, keepdims=True)
+
+    return {
+        "urls": urls,
+        "page_titles": page_titles,
+        "page_weights": _zipf_weights(n_pages, zipf_exponent)[rng.permutation(n_pages)],
+        "page_department": departments[page_department],
+        "page_document_type": rng.choice(DOCUMENT_TYPES, size=n_pages),
+        "page_publishing_app": rng.choice(PUBLISHING_APPS, size=n_pages),
+        "page_topic": page_topic,
+        "topic_words": topic_words,
+        "centroids": centroids,
+    }
+
+
+def _choose(rng, values: list, weights: list, size: int) -> np.ndarray:
+    """Draw values with the given weights"""
+    return np.asarray(values)[rng.choice(len(values), size=size, p=weights)]
+
+
+def generate_feedback_batch(
+    profile: dict,
+    start_id: int,
+    n_rows: int,
+    rng: np.random.Generator,
+    start_date: datetime.date = datetime.date(2023, 8, 1),
+    end_date: datetime.date = datetime.date(2024, 5, 1),
+    noise: float = 0.6,
+) -> pa.RecordBatch:
+    """
+    Generate one batch of synthetic feedback records
+
+    Args:
+        profile (dict): corpus profile from build_corpus_profile
+        start_id (int): feedback_record_id of the first record in the batch
+        n_rows (int): number of records
+        rng (np.random.Generator): random generator
+        start_date (datetime.date): earliest created date
+        end_date (datetime.date): latest created date
+        noise (float): spread of embeddings around their topic centroid
+
+    Returns:
+        pa.RecordBatch: records with FEEDBACK_SCHEMA
+    """
+    pages = rng.choice(len(profile["urls"]), size=n_rows, p=profile["page_weights"])
+    urls = profile["urls"][pages]
+    topics = profile["page_topic"][pages]
+
+    # Feedback volume grows over the period, so later dates are more common
+    n_days = (end_date - start_date).days
+    days = np.floor(np.sqrt(rng.random(n_rows)) * (n_days + 1)).astype(np.int32)
+    created = np.datetime64(start_date, "D") + days
+
+    spam = rng.random(n_rows) < SPAM_SHARE
+    spam_probability = np.where(
+        spam, rng.beta(8, 2, size=n_rows), rng.beta(1, 12, size=n_rows)
+    )
+
+    # Clustered embeddings: topic centroid plus noise, normalised
+    size = profile["centroids"].shape[1]
+    embeddings = profile["centroids"][topics] + rng.normal(
+        scale=noise / np.sqrt(size), size=(n_rows, size)
+    ).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    complaints = _choose(rng, COMPLAINTS, None, n_rows)
+    actions = _choose(rng, ACTIONS, None, n_rows)
+    feedback = [
+        "Buy cheap followers now!!!"
+        if is_spam
+        else f"{complaint} {action} {profile['topic_words'][topic]}"
+        for is_spam, complaint, action, topic in zip(spam, complaints, actions, topics)
+    ]
+
+    columns = {
+        "feedback_type": _choose(rng, FEEDBACK_TYPES, FEEDBACK_TYPE_WEIGHTS, n_rows),
+        "created": created,
+        "url": urls,
+        "full_url": np.char.add("https://www.gov.uk", urls),
+        "feedback_record_id": np.arange(start_id, start_id + n_rows).astype(str),
+        "feedback": feedback,
+        "urgency": rng.choice(4, size=n_rows, p=URGENCY_WEIGHTS),
+        "department": profile["page_department"][pages],
+        "primary_department": profile["page_department"][pages],
+        "document_type": profile["page_document_type"][pages],
+        "embeddings": pa.ListArray.from_arrays(
+            np.arange(0, (n_rows + 1) * size, size, dtype=np.int32),
+            pa.array(embeddings.ravel(), type=pa.float32()),
+        ),
+        "sentiment": _choose(rng, SENTIMENTS, SENTIMENT_WEIGHTS, n_rows),
+        "spam_classification": np.where(spam, "spam", "not spam"),
+        "spam_probability": spam_probability,
+        "publishing_app": profile["page_publishing_app"][pages],
+        "locale": _choose(rng, LOCALES, LOCALE_WEIGHTS, n_rows),
+        "page_title": profile["page_titles"][pages],
+        "taxons": np.char.add("/", profile["topic_words"][topics]),
+    }
+    return pa.RecordBatch.from_arrays(
+        [
+            pa.array(columns[field.name], type=field.type)
+            if not isinstance(columns[field.name], pa.Array)
+            else columns[field.name]
+            for field in FEEDBACK_SCHEMA
+        ],
+        schema=FEEDBACK_SCHEMA,
+    )
+
+
+def generate_feedback_batches(
+    n_rows: int, batch_size: int = 20000, seed: int = 0, **profile_kwargs
+):
+    """
+    Generate synthetic feedback records in batches, so any number of rows can
+    be produced in bounded memory
+
+    Args:
+        n_rows (int): total number of records
+        batch_size (int): records per batch
+        seed (int): random seed
+        **profile_kwargs: passed to build_corpus_profile
+
+    Yields:
+        pa.RecordBatch: records with FEEDBACK_SCHEMA
+    """
+    profile = build_corpus_profile(seed=seed, **profile_kwargs)
+    rng = np.random.default_rng(seed + 1)
+    for start in range(0, n_rows, batch_size):
+        yield generate_feedback_batch(
+            profile, start, min(batch_size, n_rows - start), rng
+        )
+
+
+def write_synthetic_feedback(
+    output_path: str,
+    n_rows: int,
+    batch_size: int = 20000,
+    seed: int = 0,
+    **profile_kwargs,
+):
+    """
+    Stream synthetic feedback records to a Parquet file, one row group per batch
+
+    Args:
+        output_path (str): Parquet file to write
+        n_rows (int): total number of records
+        batch_size (int): records per batch
+        seed (int): random seed
+        **profile_kwargs: passed to build_corpus_profile
+    """
+    with pq.ParquetWriter(output_path, FEEDBACK_SCHEMA) as writer:
+        for batch in generate_feedback_batches(
+            n_rows, batch_size=batch_size, seed=seed, **profile_kwargs
+        ):
+            writer.write_batch(batch)
+            print(
+                f"Written {batch.num_rows} records, up to id {batch['feedback_record_id'][-1]}"
+            )
+
+
+def read_feedback_batches(parquet_path: str, batch_size: int = 20000):
+    """
+    Read a feedback Parquet file in batches of records, in the format
+    returned by query_bigquery
+
+    Args:
+        parquet_path (str): Parquet file to read
+        batch_size (int): records per batch
+
+    Yields:
+        list[dict]: records
+    """
+    parquet_file = pq.ParquetFile(parquet_path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size):
+        yield batch.to_pylist()
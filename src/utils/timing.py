@@ -0,0 +1,218 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+
+class TimingRegistry:
+    """Thread-safe histograms of stage durations, one per stage"""
+
+    def __init__(self, buckets: list[float] = DEFAULT_BUCKETS):
+        self.buckets = sorted(buckets)
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Record one duration for a stage
+
+        Args:
+            stage (str): name of the stage, e.g. "search"
+            seconds (float): the duration
+        """
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = {
+                    # The last count is the +Inf bucket
+                    "counts": [0] * (len(self.buckets) + 1),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            histogram = self.histograms[stage]
+            histogram["counts"][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def snapshot(self) -> dict:
+        """
+        Copy the current histograms
+
+        Returns:
+            dict: stage to {"counts", "sum", "count"}, with non-cumulative bucket counts
+        """
+        with self.lock:
+            return {
+                stage: {
+                    "counts": list(histogram["counts"]),
+                    "sum": histogram["sum"],
+                    "count": histogram["count"],
+                }
+                for stage, histogram in self.histograms.items()
+            }
+
+    def render_prometheus(self, name: str = "feedback_app_stage_duration_seconds"):
+        """
+        Render the histograms in the Prometheus text exposition format
+
+        Args:
+            name (str): metric name
+
+        Returns:
+            str: the metrics page
+        """
+        lines = [
+            f"# HELP {name} Duration of each stage of a request",
+            f"# TYPE {name} histogram",
+        ]
+        for stage, histogram in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ["+Inf"], histogram["counts"]):
+                cumulative += count
+                lines.append(
+                    f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram["sum"]}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram["count"]}')
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the app and the metrics endpoint
+TIMINGS = TimingRegistry()
+
+
+def format_timing_log(
+    stage: str, seconds: float, user_id=None, session_id=None, **fields
+) -> str:
+    """
+    Format a timing as a log line, with the same user_id and session_id
+    fields as the app's other log lines
+
+    Args:
+        stage (str): name of the stage
+        seconds (float): the duration
+        user_id (str, optional): browser session id of the user
+        session_id (str, optional): Streamlit session id
+        **fields: any other key=value pairs to log, e.g. n_results
+
+    Returns:
+        str: the log message
+    """
+    extra = "".join(f" {key}={value}" for key, value in fields.items())
+    return f"user_id:{user_id} | session_id:{session_id} | timing | stage={stage} duration_ms={seconds * 1000:.1f}{extra}"
+
+
+@contextmanager
+def span(
+    stage: str,
+    logger=None,
+    user_id=None,
+    session_id=None,
+    registry: TimingRegistry = TIMINGS,
+    **fields,
+):
+    """
+    Time a block of code, recording it in the registry and logging it.
+    Fields added to the yielded dict inside the block are logged too.
+
+    Args:
+        stage (str): name of the stage, e.g. "encode"
+        logger (logging.Logger, optional): logger to write the timing to
+        user_id (str, optional): browser session id of the user
+        session_id (str, optional): Streamlit session id
+        registry (TimingRegistry): registry to record to. Defaults to TIMINGS.
+        **fields: any other key=value pairs to log
+
+    Yields:
+        dict: fields to log with the timing
+    """
+    fields = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        seconds = time.perf_counter() - start
+        registry.observe(stage, seconds)
+        if logger is not None:
+            logger.info(
+                format_timing_log(stage, seconds, user_id, session_id, **fields)
+            )
+
+
+def time_stream(
+    stream,
+    stage: str,
+    logger=None,
+    user_id=None,
+    session_id=None,
+    registry: TimingRegistry = TIMINGS,
+):
+    """
+    Wrap a generator, recording the time to its first item as
+    "<stage>_first_item" and the time to exhaust it as "<stage>"
+
+    Args:
+        stream (Iterable): the generator, e.g. a streamed OpenAI completion
+        stage (str): name of the stage, e.g. "openai"
+        logger (logging.Logger, optional): logger to write the timings to
+        user_id (str, optional): browser session id of the user
+        session_id (str, optional): Streamlit session id
+        registry (TimingRegistry): registry to record to. Defaults to TIMINGS.
+
+    Yields:
+        the items of the stream
+    """
+    start = time.perf_counter()
+    first_item = True
+    with span(stage, logger, user_id, session_id, registry):
+        for item in stream:
+            if first_item:
+                seconds = time.perf_counter() - start
+                registry.observe(f"{stage}_first_item", seconds)
+                if logger is not None:
+                    logger.info(
+                        format_timing_log(
+                            f"{stage}_first_item", seconds, user_id, session_id
+                        )
+                    )
+                first_item = False
+            yield item
+
+
+def start_metrics_server(port: int, registry: TimingRegistry = TIMINGS):
+    """
+    Serve the registry's histograms at http://<host>:<port>/metrics from a
+    background thread
+
+    Args:
+        port (int): port to listen on
+        registry (TimingRegistry): registry to serve. Defaults to TIMINGS.
+
+    Returns:
+        ThreadingHTTPServer: the running server
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Don't log every scrape
+            pass
+
+    server = ThreadingHTTPServer(("", port), MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    print(f"Serving timing metrics on port {port} at /metrics")
+    return server
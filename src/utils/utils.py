@@ -2,7 +2,7 @@ import os
 import csv
 import json
 
-from qdrant_client import QdrantClient
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from sentence_transformers import SentenceTransformer
 
 
@@ -25,8 +25,68 @@ def load_config(config_file_path):
     return config
 
 
-def load_qdrant_client(qdrant_host: str, port: int) -> QdrantClient:
-    client = QdrantClient(qdrant_host, port=port)
+def get_qdrant_transport_config() -> dict:
+    """
+    Read the Qdrant transport settings from environment variables:
+    QDRANT_PREFER_GRPC ("true" to use gRPC) and QDRANT_GRPC_PORT (default 6334).
+
+    Returns:
+        dict: "prefer_grpc" and "grpc_port" keyword arguments for the Qdrant clients.
+    """
+    return {
+        "prefer_grpc": os.getenv("QDRANT_PREFER_GRPC", "false").lower()
+        in ("1", "true", "yes"),
+        "grpc_port": int(os.getenv("QDRANT_GRPC_PORT", 6334)),
+    }
+
+
+def load_qdrant_client(
+    qdrant_host: str, port: int, prefer_grpc: bool = None, grpc_port: int = None
+) -> QdrantClient:
+    """
+    Load a Qdrant client, over gRPC if configured.
+
+    Args:
+        qdrant_host (str): The Qdrant host.
+        port (int): The HTTP port.
+        prefer_grpc (bool, optional): Use gRPC. Defaults to QDRANT_PREFER_GRPC.
+        grpc_port (int, optional): The gRPC port. Defaults to QDRANT_GRPC_PORT.
+
+    Returns:
+        QdrantClient: The client.
+    """
+    config = get_qdrant_transport_config()
+    client = QdrantClient(
+        qdrant_host,
+        port=port,
+        prefer_grpc=config["prefer_grpc"] if prefer_grpc is None else prefer_grpc,
+        grpc_port=config["grpc_port"] if grpc_port is None else grpc_port,
+    )
+    return client
+
+
+def load_async_qdrant_client(
+    qdrant_host: str, port: int, prefer_grpc: bool = None, grpc_port: int = None
+) -> AsyncQdrantClient:
+    """
+    Load an async Qdrant client, over gRPC if configured.
+
+    Args:
+        qdrant_host (str): The Qdrant host.
+        port (int): The HTTP port.
+        prefer_grpc (bool, optional): Use gRPC. Defaults to QDRANT_PREFER_GRPC.
+        grpc_port (int, optional): The gRPC port. Defaults to QDRANT_GRPC_PORT.
+
+    Returns:
+        AsyncQdrantClient: The client.
+    """
+    config = get_qdrant_transport_config()
+    client = AsyncQdrantClient(
+        qdrant_host,
+        port=port,
+        prefer_grpc=config["prefer_grpc"] if prefer_grpc is None else prefer_grpc,
+        grpc_port=config["grpc_port"] if grpc_port is None else grpc_port,
+    )
     return client
 
 
@@ -0,0 +1,208 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import httpx
+import openai
+
+import src.utils.async_call_openai as labelling
+from src.utils.async_call_openai import (
+    TokenBucket,
+    iter_records,
+    label_records,
+    parse_packed_labels,
+)
+from src.utils.label_store import LabelStore, label_key
+
+
+def _status_error(error_class, status_code):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    response = httpx.Response(status_code, request=request)
+    return error_class("error", response=response, body=None)
+
+
+class FakeCompletions:
+    """Echoes the record id back as the label, failing as configured per id"""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def create(self, messages, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            record = json.loads(
+                messages[1]["content"].split("label:\n")[1].split("\n\n")[0]
+            )
+            await asyncio.sleep(0.001 * (5 - int(record["id"]) % 5))
+            if self.failures.get(record["id"]):
+                raise self.failures[record["id"]].pop(0)
+            content = json.dumps({"id": record["id"], "labels": ["x"], "urgency": 1})
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+            )
+        finally:
+            self.in_flight -= 1
+
+
+def test_iter_records_parses_json_array():
+    records = json.dumps([{"id": "1", "feedback": "a}, b"}, {"id": "2"}])
+
+    assert [json.loads(record)["id"] for record in iter_records(records)] == ["1", "2"]
+
+
+def test_label_records_retries_and_keeps_order(monkeypatch):
+    monkeypatch.setattr(labelling, "backoff_seconds", lambda attempt, error: 0)
+    completions = FakeCompletions(
+        {
+            "2": [_status_error(openai.RateLimitError, 429)],
+            "3": [_status_error(openai.InternalServerError, 503)],
+            "4": [_status_error(openai.BadRequestError, 400)],
+        }
+    )
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    records = [json.dumps({"id": str(idx), "feedback": "text"}) for idx in range(10)]
+
+    responses = asyncio.run(
+        label_records("[]", records, "key", concurrency=3, client=client)
+    )
+
+    assert [response["open_labelled_records"] is None for response in responses] == [
+        idx == 4 for idx in range(10)
+    ]
+    assert [
+        json.loads(response["open_labelled_records"])["id"]
+        for response in responses
+        if response["open_labelled_records"]
+    ] == [str(idx) for idx in range(10) if idx != 4]
+    assert "error" in responses[4]
+    assert completions.calls == 12
+    assert completions.max_in_flight <= 3
+
+
+def test_token_bucket_waits_for_refill():
+    async def acquire_twice():
+        bucket = TokenBucket(600)
+        await bucket.acquire(600)
+        start = asyncio.get_running_loop().time()
+        await bucket.acquire(5)
+        return asyncio.get_running_loop().time() - start
+
+    assert 0.4 < asyncio.run(acquire_twice()) < 1
+
+
+class FakePackedCompletions:
+    """Labels packed records, leaving out the given ids the first time"""
+
+    def __init__(self, dropped_ids):
+        self.dropped_ids = set(dropped_ids)
+        self.packs = []
+
+    async def create(self, messages, **kwargs):
+        records = json.loads(
+            messages[1]["content"].split("label:\n")[1].split("\n\n")[0]
+        )
+        self.packs.append([record["id"] for record in records])
+        labelled = []
+        for record in records:
+            if record["id"] in self.dropped_ids:
+                self.dropped_ids.remove(record["id"])
+                continue
+            labelled.append({"id": record["id"], "labels": ["x"], "urgency": 2})
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(
+                    message=SimpleNamespace(content=json.dumps({"records": labelled}))
+                )
+            ],
+            usage=SimpleNamespace(prompt_tokens=100, completion_tokens=20),
+        )
+
+
+def test_packed_labelling_requeues_missing_records():
+    completions = FakePackedCompletions(dropped_ids=["3", "7"])
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    records = [json.dumps({"id": str(idx), "feedback": "text"}) for idx in range(10)]
+
+    responses = asyncio.run(
+        label_records("[]", records, "key", pack_size=4, client=client)
+    )
+
+    assert [json.loads(r["open_labelled_records"])["id"] for r in responses] == [
+        str(idx) for idx in range(10)
+    ]
+    assert completions.packs == [
+        ["0", "1", "2", "3"],
+        ["4", "5", "6", "7"],
+        ["8", "9"],
+        ["3", "7"],
+    ]
+
+
+def test_parse_packed_labels_ignores_unknown_and_incomplete_records():
+    content = json.dumps(
+        {
+            "records": [
+                {"id": "1", "labels": ["a"], "urgency": 1},
+                {"id": "2", "labels": ["b"]},
+                {"id": "9", "labels": ["c"], "urgency": 3},
+            ]
+        }
+    )
+
+    assert parse_packed_labels(content, ["1", "2"]) == {
+        "1": {"id": "1", "labels": ["a"], "urgency": 1}
+    }
+    assert parse_packed_labels("not json", ["1"]) == {}
+
+
+def test_label_store_serves_duplicates_and_resumed_runs(tmp_path):
+    store = LabelStore(str(tmp_path / "labels.sqlite"))
+    records = [
+        json.dumps({"id": str(idx), "feedback": text})
+        for idx, text in enumerate(["spam", "Test", " test ", "spam", "other"])
+    ]
+
+    completions = FakeCompletions({})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    first_run = asyncio.run(
+        label_records("[]", records, "key", store=store, client=client)
+    )
+
+    assert completions.calls == 3
+    assert len(store) == 3
+    assert [json.loads(r["open_labelled_records"])["id"] for r in first_run] == [
+        "0",
+        "1",
+        "2",
+        "3",
+        "4",
+    ]
+    assert [bool(r.get("cached")) for r in first_run] == [
+        False,
+        False,
+        True,
+        True,
+        False,
+    ]
+
+    completions = FakeCompletions({})
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    second_run = asyncio.run(
+        label_records("[]", records, "key", store=store, client=client)
+    )
+
+    assert completions.calls == 0
+    assert [json.loads(r["open_labelled_records"]) for r in second_run] == [
+        json.loads(r["open_labelled_records"]) for r in first_run
+    ]
+
+
+def test_label_key_normalises_text_and_depends_on_prompt_version():
+    assert label_key("  No\nthanks ", "v1") == label_key("no thanks", "v1")
+    assert label_key("no thanks", "v1") != label_key("no thanks", "v2")
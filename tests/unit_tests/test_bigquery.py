@@ -0,0 +1,78 @@
+import json
+
+from src.utils.bigquery import iter_insert_batches, write_labels_to_bigquery
+
+
+class FakeBigQueryClient:
+    """Accepts inserted rows, rejecting rows whose id is in reject_ids"""
+
+    def __init__(self, reject_ids=()):
+        self.reject_ids = set(reject_ids)
+        self.inserted = []
+        self.batches = 0
+        self.loaded = None
+
+    def get_table(self, table_id):
+        return table_id
+
+    def insert_rows_json(self, table, rows, row_ids=None):
+        self.batches += 1
+        errors = []
+        for index, row in enumerate(rows):
+            if row["id"] in self.reject_ids:
+                errors.append({"index": index, "errors": ["invalid"]})
+            else:
+                self.inserted.append(row)
+        return errors
+
+    def load_table_from_json(self, rows, table, job_config=None):
+        self.loaded = rows
+        return self
+
+    def result(self):
+        return None
+
+
+def _response(record_id, urgency=1):
+    return {
+        "open_labelled_records": json.dumps(
+            {"id": record_id, "labels": ["Passport"], "urgency": urgency}
+        )
+    }
+
+
+def test_write_labels_streams_batches_and_returns_failures():
+    responses = [_response(str(idx)) for idx in range(7)]
+    responses[2] = {"open_labelled_records": None, "error": "rate limited"}
+    responses[4] = {"open_labelled_records": "{'id': 'not json'}"}
+    client = FakeBigQueryClient(reject_ids={"5"})
+
+    failures = write_labels_to_bigquery(
+        "dataset.table", responses, "project", batch_size=2, client=client
+    )
+
+    assert [failure["index"] for failure in failures] == [2, 4, 5]
+    assert failures[0]["error"] == "rate limited"
+    assert [row["id"] for row in client.inserted] == ["0", "1", "3", "6"]
+    assert client.batches == 3
+
+
+def test_write_labels_uses_load_job_for_many_rows():
+    responses = [_response(str(idx), urgency="2") for idx in range(5)]
+    client = FakeBigQueryClient()
+
+    failures = write_labels_to_bigquery(
+        "dataset.table", responses, "project", load_job_min_rows=5, client=client
+    )
+
+    assert failures == []
+    assert client.batches == 0
+    assert client.loaded[0] == {"id": "0", "labels": ["Passport"], "urgency": 2}
+
+
+def test_iter_insert_batches_bounds_bytes():
+    rows = [(idx, {"id": "x" * 100}) for idx in range(5)]
+
+    batches = list(iter_insert_batches(rows, batch_size=10, max_bytes=250))
+
+    assert [len(batch) for batch in batches] == [2, 2, 1]
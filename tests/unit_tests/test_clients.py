@@ -0,0 +1,28 @@
+import asyncio
+
+from src.utils.clients import (
+    clear_clients,
+    get_async_openai_client,
+    get_openai_client,
+)
+
+
+def test_openai_client_is_shared_per_api_key():
+    clear_clients()
+    client = get_openai_client("key-a")
+
+    assert get_openai_client("key-a") is client
+    assert get_openai_client("key-b") is not client
+
+
+def test_async_openai_client_is_shared_within_an_event_loop():
+    clear_clients()
+
+    async def get_clients():
+        return get_async_openai_client("key-a"), get_async_openai_client("key-a")
+
+    first, second = asyncio.run(get_clients())
+    other_loop, _ = asyncio.run(get_clients())
+
+    assert first is second
+    assert other_loop is not first
@@ -0,0 +1,52 @@
+import numpy as np
+
+from src.utils.context_selection import (
+    cluster_by_threshold,
+    format_context_record,
+    select_context,
+)
+
+
+def _count_words(text):
+    return len(text.split())
+
+
+def test_cluster_by_threshold_leaders_are_most_relevant():
+    vectors = np.array([[1.0, 0.0], [0.0, 1.0], [0.99, 0.05], [1.0, 0.01]])
+
+    labels, leaders = cluster_by_threshold(vectors, similarity_threshold=0.95)
+
+    assert labels.tolist() == [0, 1, 0, 0]
+    assert leaders == [0, 1]
+
+
+def test_select_context_prefers_large_clusters_within_budget():
+    feedback = ["spam spam", "broken link", "spam spam!", "spam spam?", "long " * 10]
+    vectors = np.array(
+        [
+            [1.0, 0.0, 0.0],
+            [0.0, 1.0, 0.0],
+            [1.0, 0.01, 0.0],
+            [1.0, 0.0, 0.01],
+            [0, 0, 1],
+        ]
+    )
+
+    selected = select_context(feedback, vectors, _count_words, token_budget=8)
+
+    assert selected == [
+        {"feedback": "spam spam", "count": 3},
+        {"feedback": "broken link", "count": 1},
+    ]
+
+
+def test_select_context_counts_weights():
+    vectors = np.array([[1.0, 0.0], [0.0, 1.0]])
+
+    selected = select_context(
+        ["a", "b"], vectors, _count_words, token_budget=100, weights=[1, 5]
+    )
+
+    assert [record["count"] for record in selected] == [5, 1]
+    assert format_context_record("b", 5) == "[5 records] b"
+    assert format_context_record("a", 1) == "[1 record] a"
@@ -0,0 +1,122 @@
+import numpy as np
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance
+
+from src.collection_utils.deduplicate import (
+    cluster_near_duplicates,
+    count_records,
+    deduplicate_records,
+    duplicates_collection_name,
+    get_duplicate_members,
+)
+from src.collection_utils.set_collection import (
+    create_collection,
+    create_vectors_from_data,
+    upsert_to_collection_from_vectors,
+)
+
+
+def _records():
+    rng = np.random.default_rng(0)
+    base = rng.normal(size=(3, 32))
+    records = []
+    # Five copies of text 0 on /a, two of text 1 on /a, one of text 0 on /b
+    for idx, (text, url) in enumerate(
+        [(0, "/a")] * 5 + [(1, "/a")] * 2 + [(0, "/b"), (2, "/a")]
+    ):
+        records.append(
+            {
+                "feedback_record_id": str(idx),
+                "created": f"2024-01-0{idx + 1}",
+                "url": url,
+                "embeddings": (base[text] + rng.normal(scale=0.01, size=32)).tolist(),
+            }
+        )
+    return records
+
+
+def test_cluster_near_duplicates_groups_similar_embeddings():
+    rng = np.random.default_rng(1)
+    base = rng.normal(size=(2, 64))
+    embeddings = np.vstack([base[0] + rng.normal(scale=0.01, size=(4, 64)), base[1]])
+
+    labels = cluster_near_duplicates(embeddings)
+
+    assert len(set(labels[:4])) == 1
+    assert labels[4] != labels[0]
+
+
+def test_deduplicate_records_keeps_latest_representative_per_group():
+    representatives, members = deduplicate_records(
+        _records(), group_fields=["url"], threshold=0.95
+    )
+    by_id = {record["feedback_record_id"]: record for record in representatives}
+
+    assert sorted(by_id) == ["4", "6", "7", "8"]
+    assert by_id["4"]["duplicate_count"] == 5
+    assert sorted(by_id["4"]["duplicate_ids"]) == [0, 1, 2, 3]
+    assert by_id["7"]["duplicate_count"] == 1
+    assert sorted(member["duplicate_of"] for member in members) == [4, 4, 4, 4, 6]
+
+
+def test_default_grouping_merges_within_a_day():
+    """Test that duplicates are only merged on the same day, and that the
+    representative holds its members' different wording."""
+    records = _records()[:5]
+    for record, created in zip(records, ["2024-01-01"] * 4 + ["2024-01-02"]):
+        record["created"] = created
+    for record, feedback in zip(records, ["Too slow", "too slow", "Too slow"]):
+        record["feedback"] = feedback
+
+    representatives, members = deduplicate_records(records, threshold=0.95)
+    by_id = {record["feedback_record_id"]: record for record in representatives}
+
+    assert sorted(by_id) == ["0", "4"]
+    assert by_id["0"]["duplicate_count"] == 4
+    assert by_id["0"]["duplicate_feedback"] == "too slow"
+    assert "duplicate_feedback" not in by_id["4"]
+    assert {member["duplicate_of"] for member in members} == {0}
+
+
+def test_duplicate_members_are_retrievable():
+    client = QdrantClient(":memory:")
+    _, members = deduplicate_records(_records(), group_fields=["url"], threshold=0.95)
+    create_collection(
+        client,
+        duplicates_collection_name("test"),
+        size=32,
+        distance_metric=Distance.COSINE,
+    )
+    upsert_to_collection_from_vectors(
+        client,
+        duplicates_collection_name("test"),
+        create_vectors_from_data(members, "feedback_record_id", "embeddings"),
+    )
+
+    points = get_duplicate_members(client, "test", 4, payload_fields=["created"])
+
+    assert sorted(point.id for point in points) == [0, 1, 2, 3]
+
+
+def test_count_records_includes_duplicates():
+    """Test that record counts add the matching duplicates to the points."""
+    client = QdrantClient(":memory:")
+    representatives, members = deduplicate_records(
+        _records(), group_fields=["url"], threshold=0.95
+    )
+    for name, records in [
+        ("test", representatives),
+        (duplicates_collection_name("test"), members),
+    ]:
+        create_collection(client, name, size=32, distance_metric=Distance.COSINE)
+        upsert_to_collection_from_vectors(
+            client,
+            name,
+            create_vectors_from_data(records, "feedback_record_id", "embeddings"),
+        )
+
+    assert count_records(client, "test", {"url": ["/a"]}) == 8
+    assert count_records(client, "test", {"url": ["/b"]}) == 1
+
+    client.delete_collection(duplicates_collection_name("test"))
+    assert count_records(client, "test", {"url": ["/a"]}) == 3
@@ -0,0 +1,227 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from src.collection_utils.evaluate_collection import (
+    EVALUATION_THRESHOLDS,
+    process_labels,
+    process_labels_async,
+)
+from src.collection_utils.evaluation_results import (
+    append_checkpoint,
+    load_checkpoints,
+    merge_checkpoints,
+    metric_values_to_matrix,
+    remaining_labels,
+    shard_checkpoint_path,
+)
+
+LABELS = ["tax", "passport", "slow", "broken", "unencodable", "visa", "benefits"]
+REGEX_IDS = {label: [str(idx) for idx in range(len(label))] for label in LABELS}
+
+
+class FakeModel:
+    def encode(self, label):
+        if label == "unencodable":
+            raise ValueError("cannot encode")
+        return [float(LABELS.index(label))]
+
+
+def fake_points(query_vector, score_threshold):
+    """Points 0-9, scored so each label retrieves a different set"""
+    label_idx = int(query_vector[0])
+    scores = [((point_id + 1) * (label_idx + 3) % 11) / 10 for point_id in range(10)]
+    return [
+        SimpleNamespace(id=point_id, score=score)
+        for point_id, score in enumerate(scores)
+        if score >= score_threshold
+    ]
+
+
+class FakeClient:
+    """Fails for "broken", and for "slow", which times out in the async client"""
+
+    def __init__(self, failing=("slow", "broken")):
+        self.failing = failing
+
+    def search(self, query_vector, score_threshold, **kwargs):
+        if LABELS[int(query_vector[0])] in self.failing:
+            raise RuntimeError("search failed")
+        return fake_points(query_vector, score_threshold)
+
+
+class FakeAsyncClient:
+    async def search(self, query_vector, score_threshold, **kwargs):
+        label = LABELS[int(query_vector[0])]
+        if label == "slow":
+            await asyncio.sleep(1)
+        if label == "broken":
+            raise RuntimeError("search failed")
+        # Finish out of order
+        await asyncio.sleep(0.001 * ((int(score_threshold * 10) * 7) % 5))
+        return fake_points(query_vector, score_threshold)
+
+
+def test_process_labels_async_matches_process_labels():
+    """Test that the concurrent runner returns the sequential runner's outputs, in order."""
+    expected = process_labels(LABELS, REGEX_IDS, FakeModel(), FakeClient(), "test")
+    results = asyncio.run(
+        process_labels_async(
+            LABELS,
+            REGEX_IDS,
+            FakeModel(),
+            FakeAsyncClient(),
+            "test",
+            max_concurrency=4,
+            request_timeout=0.05,
+        )
+    )
+
+    assert results == expected
+    precision_values = results[0]
+    assert [list(values)[0] for values in precision_values] == LABELS
+    assert list(precision_values[0]["tax"]) == list(EVALUATION_THRESHOLDS)
+    # Failed and timed out searches have no metrics, unencodable labels no thresholds
+    assert set(precision_values[2]["slow"].values()) == {None}
+    assert set(precision_values[3]["broken"].values()) == {None}
+    assert precision_values[4]["unencodable"] == {}
+
+
+def test_sharded_checkpoints_merge_in_label_order(tmp_path):
+    """Test that two shards checkpointed separately merge into the unsharded results."""
+    paths = []
+    for shard_index in range(2):
+        path = shard_checkpoint_path(str(tmp_path), shard_index, 2)
+        process_labels(
+            LABELS[shard_index::2],
+            REGEX_IDS,
+            FakeModel(),
+            FakeClient(),
+            "test",
+            checkpoint_path=path,
+        )
+        paths.append(path)
+
+    merged = merge_checkpoints(paths, LABELS, EVALUATION_THRESHOLDS)
+    expected = process_labels(LABELS, REGEX_IDS, FakeModel(), FakeClient(), "test")
+    for metric, values in zip(["precision", "recall", "f2"], expected):
+        _, matrix = metric_values_to_matrix(values, EVALUATION_THRESHOLDS)
+        np.testing.assert_array_equal(merged[metric], matrix)
+
+    # A stale shard from a run with another shard count overlaps these
+    stale_path = str(tmp_path / "shard_0_of_3.jsonl")
+    process_labels(
+        LABELS[::3],
+        REGEX_IDS,
+        FakeModel(),
+        FakeClient(),
+        "test",
+        checkpoint_path=stale_path,
+    )
+    with pytest.raises(ValueError, match="another checkpoint"):
+        merge_checkpoints(paths + [stale_path], LABELS, EVALUATION_THRESHOLDS)
+
+
+def test_resume_skips_completed_labels(tmp_path):
+    """Test that resuming skips checkpointed labels, ignoring a truncated last line."""
+    path = str(tmp_path / "shard_0_of_1.jsonl")
+    client = FakeClient(failing=())
+    process_labels(
+        LABELS[:3], REGEX_IDS, FakeModel(), client, "test", checkpoint_path=path
+    )
+    # A run killed mid-write leaves a partial line
+    with open(path, "a") as f:
+        f.write('{"label": "broken", "thresholds": [0.0')
+
+    assert list(load_checkpoints([path])) == LABELS[:3]
+    remaining = remaining_labels(LABELS, path, EVALUATION_THRESHOLDS)
+    assert remaining == LABELS[3:]
+
+    # The resumed run appends after the partial line, which stays skipped
+    process_labels(
+        remaining, REGEX_IDS, FakeModel(), client, "test", checkpoint_path=path
+    )
+    assert list(load_checkpoints([path])) == LABELS
+    assert remaining_labels(LABELS, path, EVALUATION_THRESHOLDS) == ["unencodable"]
+    with open(path) as f:
+        assert sum(1 for line in f) == len(LABELS) + 1
+
+
+def test_resume_retries_failed_labels(tmp_path):
+    """Test that labels whose searches failed are checkpointed as failed and
+    retried on resume, with the retry's results merged."""
+    path = str(tmp_path / "shard_0_of_1.jsonl")
+    asyncio.run(
+        process_labels_async(
+            LABELS,
+            REGEX_IDS,
+            FakeModel(),
+            FakeAsyncClient(),
+            "test",
+            request_timeout=0.05,
+            checkpoint_path=path,
+        )
+    )
+    failed = ["slow", "broken", "unencodable"]
+    assert remaining_labels(LABELS, path, EVALUATION_THRESHOLDS) == failed
+    assert sorted(load_checkpoints([path])) == sorted(LABELS)
+
+    # The failures were transient, so the retry succeeds, except for encoding
+    process_labels(
+        failed,
+        REGEX_IDS,
+        FakeModel(),
+        FakeClient(failing=()),
+        "test",
+        checkpoint_path=path,
+    )
+    assert remaining_labels(LABELS, path, EVALUATION_THRESHOLDS) == ["unencodable"]
+    merged = merge_checkpoints([path], LABELS, EVALUATION_THRESHOLDS)
+    expected = process_labels(
+        LABELS, REGEX_IDS, FakeModel(), FakeClient(failing=()), "test"
+    )
+    _, matrix = metric_values_to_matrix(expected[0], EVALUATION_THRESHOLDS)
+    np.testing.assert_array_equal(merged["precision"], matrix)
+    assert not np.isnan(merged["precision"][LABELS.index("slow")]).any()
+
+
+def test_threshold_grid_mismatch_fails(tmp_path):
+    """Test that resuming or merging a checkpoint from another threshold grid fails clearly."""
+    path = str(tmp_path / "shard_0_of_1.jsonl")
+    thresholds = np.array([0.0, 0.5, 1.0])
+    append_checkpoint(
+        path, ["tax"], thresholds, {"precision": np.array([[0.1, 0.2, 0.3]])}
+    )
+    with open(path) as f:
+        assert json.loads(f.readline())["thresholds"] == [0.0, 0.5, 1.0]
+
+    with pytest.raises(ValueError, match="thresholds"):
+        remaining_labels(LABELS, path, EVALUATION_THRESHOLDS)
+    with pytest.raises(ValueError, match="thresholds"):
+        merge_checkpoints([path], LABELS, EVALUATION_THRESHOLDS)
+    assert remaining_labels(["tax", "visa"], path, thresholds) == ["visa"]
+
+
+def test_full_batches_have_no_empty_batch(tmp_path, capsys):
+    """Test that a label count divisible by the batch size gives no empty batch."""
+
+    class Model:
+        def encode(self, label):
+            return [0.0]
+
+    labels = [f"label-{idx}" for idx in range(100)]
+    path = str(tmp_path / "shard_0_of_1.jsonl")
+    process_labels(
+        labels,
+        {label: ["0"] for label in labels},
+        Model(),
+        FakeClient(),
+        "test",
+        checkpoint_path=path,
+    )
+
+    assert capsys.readouterr().out.count("Metrics calculated for labels") == 1
+    assert list(load_checkpoints([path])) == labels
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from src.collection_utils.evaluate_collection import (
+    EVALUATION_THRESHOLDS,
+    calculate_mean_values,
+    create_boxplot_data,
+    create_line_data,
+    get_threshold_values,
+)
+from src.collection_utils.evaluation_results import (
+    evaluation_results_exist,
+    load_evaluation_results,
+    metric_values_to_matrix,
+    save_evaluation_results,
+)
+
+
+def make_metric_values(n_labels=5, seed=0):
+    """Metric values in the process_labels format"""
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            f"label-{idx}": {
+                threshold: float(rng.random()) for threshold in EVALUATION_THRESHOLDS
+            }
+        }
+        for idx in range(n_labels)
+    ]
+
+
+def old_boxplot_data(metric_values):
+    """The per-metric boxplot builder replaced by create_boxplot_data"""
+    values = [list(item.values())[0] for item in metric_values]
+    return {
+        round(threshold, 2): [
+            value for item in values for key, value in item.items() if key == threshold
+        ]
+        for threshold in np.arange(0, 1.1, 0.1)
+    }
+
+
+def old_line_data(metric_values):
+    """The per-metric line builder replaced by create_line_data"""
+    sums = {}
+    for item in metric_values:
+        for values in item.values():
+            for threshold, value in values.items():
+                total, count = sums.get(threshold, (0, 0))
+                sums[threshold] = (total + value, count + 1)
+    return {
+        round(threshold, 2): round(total / count, 2)
+        for threshold, (total, count) in sums.items()
+    }
+
+
+def test_plot_data_matches_old_builders():
+    """Test that the matrix based plot data equals the old per-metric outputs."""
+    metric_values = make_metric_values()
+    _, matrix = metric_values_to_matrix(metric_values, EVALUATION_THRESHOLDS)
+
+    boxplot_data = create_boxplot_data(matrix, EVALUATION_THRESHOLDS)
+    expected = old_boxplot_data(metric_values)
+    assert list(boxplot_data) == list(expected)
+    for threshold, values in expected.items():
+        assert list(boxplot_data[threshold]) == pytest.approx(values)
+
+    assert create_line_data(matrix, EVALUATION_THRESHOLDS) == pytest.approx(
+        old_line_data(metric_values)
+    )
+    assert list(
+        get_threshold_values(matrix, EVALUATION_THRESHOLDS, 0.3)
+    ) == pytest.approx(expected[0.3])
+
+
+def test_missing_values_are_ignored():
+    """Test that failed searches are NaN and left out of the means and boxplots."""
+    metric_values = [
+        {"a": {0.0: 0.2, 0.1: None}},
+        {"b": {0.0: 0.4, 0.1: None}},
+        {"c": {}},
+    ]
+    thresholds = np.array([0.0, 0.1, 0.2])
+    labels, matrix = metric_values_to_matrix(metric_values, thresholds)
+
+    assert labels == ["a", "b", "c"]
+    assert np.isnan(matrix[:, 1:]).all() and np.isnan(matrix[2]).all()
+    means = calculate_mean_values(matrix)
+    assert means[0] == pytest.approx(0.3)
+    assert np.isnan(means[1:]).all()
+    boxplot_data = create_boxplot_data(matrix, thresholds)
+    assert list(boxplot_data[0.0]) == pytest.approx([0.2, 0.4])
+    assert len(boxplot_data[0.1]) == 0
+    assert len(get_threshold_values(matrix, thresholds, 0.5)) == 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    """Test that saved results load back, memory-mapped, unchanged."""
+    labels, matrix = metric_values_to_matrix(
+        make_metric_values(), EVALUATION_THRESHOLDS
+    )
+    matrix[1, 2] = np.nan
+    results_dir = str(tmp_path / "results")
+    assert not evaluation_results_exist(results_dir)
+
+    save_evaluation_results(
+        results_dir,
+        labels,
+        EVALUATION_THRESHOLDS,
+        {"precision": matrix, "recall": matrix * 2, "f2": matrix / 2},
+    )
+    assert evaluation_results_exist(results_dir)
+
+    results = load_evaluation_results(results_dir)
+    assert results["labels"] == labels
+    assert np.array_equal(results["thresholds"], EVALUATION_THRESHOLDS)
+    assert isinstance(results["precision"], np.memmap)
+    np.testing.assert_array_equal(results["recall"], matrix * 2)
+
+    with pytest.raises(ValueError):
+        save_evaluation_results(
+            results_dir, labels[:2], EVALUATION_THRESHOLDS, {"precision": matrix}
+        )
@@ -0,0 +1,45 @@
+import re
+
+import pytest
+
+from src.collection_utils.ground_truth import build_ground_truth_index
+
+
+# Mock data to use across tests
+@pytest.fixture
+def get_data():
+    data = [
+        {"id": "1", "labels": "Tax, Tax credits"},
+        {"id": "2", "labels": "Universal Credit, Login"},
+        {"id": "3", "labels": "passport application, Spam"},
+        {"id": "4", "labels": "Application (online), tax"},
+        {"id": "5", "labels": "aaa"},
+    ]
+    return data
+
+
+def brute_force_ids(label, data):
+    pattern = re.escape(label)
+    return [
+        record["id"]
+        for record in data
+        if re.search(pattern, record["labels"], flags=re.IGNORECASE)
+    ]
+
+
+def test_ids_match_literal_search(get_data):
+    """Test that each label maps to the records containing it, in record order."""
+    labels = ["tax", "Credit", "application", "Application (online)", "aa", "None"]
+    ids, _ = build_ground_truth_index(get_data, labels)
+    for label in labels:
+        assert ids[label] == brute_force_ids(label, get_data), label
+
+
+def test_counts_are_non_overlapping(get_data):
+    """Test that counts match re.findall over the labels."""
+    labels = ["tax", "aa", "credit"]
+    _, counts = build_ground_truth_index(get_data, labels)
+    all_labels = " ".join(record["labels"] for record in get_data)
+    for label in labels:
+        expected = len(re.findall(re.escape(label), all_labels, flags=re.IGNORECASE))
+        assert counts[label] == {"label": label, "n_matches": expected}
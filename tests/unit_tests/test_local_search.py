@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from src.collection_utils.evaluate_collection import process_labels
+from src.collection_utils.local_search import (
+    LocalSearchClient,
+    export_collection,
+    save_local_collection,
+)
+from src.collection_utils.query_collection import (
+    filter_search,
+    get_semantically_similar_results,
+)
+
+
+def make_points(n_points=200, size=8, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n_points, size)).astype(np.float32)
+    payloads = []
+    for idx in range(n_points):
+        payload = {
+            "url": f"/page-{idx % 5}",
+            "urgency": int(idx % 4),
+            "labels": [f"label-{idx % 3}", f"label-{idx % 7}"],
+            "feedback": f"feedback {idx}",
+        }
+        if idx % 10 == 0:
+            del payload["url"]
+        payloads.append(payload)
+    return list(range(1, n_points + 1)), embeddings, payloads
+
+
+# A Qdrant collection and a local collection of the same points
+@pytest.fixture(params=[Distance.DOT, Distance.COSINE])
+def get_clients(request, tmp_path):
+    ids, embeddings, payloads = make_points()
+    qdrant = QdrantClient(":memory:")
+    qdrant.create_collection(
+        "test", vectors_config=VectorParams(size=8, distance=request.param)
+    )
+    qdrant.upsert(
+        "test",
+        [
+            PointStruct(id=id, vector=vector.tolist(), payload=payload)
+            for id, vector, payload in zip(ids, embeddings, payloads)
+        ],
+    )
+    save_local_collection(
+        str(tmp_path / "test"), ids, embeddings, payloads, request.param.value
+    )
+    return qdrant, LocalSearchClient(str(tmp_path))
+
+
+@pytest.mark.parametrize(
+    "filter_dict",
+    [{}, {"url": ["/page-1", "/page-2"]}, {"labels": ["label-5"], "urgency": [0, 3]}],
+)
+def test_semantic_search_matches_qdrant(get_clients, filter_dict):
+    """Test that the local search returns Qdrant's results, scores and payloads."""
+    qdrant, local = get_clients
+    query = np.random.default_rng(1).normal(size=8).tolist()
+    expected = get_semantically_similar_results(qdrant, "test", query, 0.1, filter_dict)
+    results = get_semantically_similar_results(local, "test", query, 0.1, filter_dict)
+
+    assert [result.id for result in results] == [result.id for result in expected]
+    assert [result.score for result in results] == pytest.approx(
+        [result.score for result in expected], abs=1e-5
+    )
+    assert [result.payload for result in results] == [
+        result.payload for result in expected
+    ]
+
+
+def test_filter_search_matches_qdrant(get_clients):
+    """Test that filter searches return Qdrant's points and selected payload fields."""
+    qdrant, local = get_clients
+    filter_dict = {"url": ["/page-3"], "labels": ["label-0"]}
+    expected, _ = filter_search(qdrant, "test", filter_dict, payload_fields=["url"])
+    results, offset = filter_search(local, "test", filter_dict, payload_fields=["url"])
+
+    assert offset is None
+    assert [(r.id, r.payload) for r in results] == [(r.id, r.payload) for r in expected]
+    assert filter_search(local, "test", {}) is None
+
+
+def test_top_k_and_export(get_clients, tmp_path):
+    """Test the top k search of an exported collection against a full sort."""
+    qdrant, _ = get_clients
+    export_collection(qdrant, "test", str(tmp_path / "exported" / "test"), 64)
+    collection = LocalSearchClient(str(tmp_path / "exported")).get_collection("test")
+    assert len(collection) == 200
+
+    query = np.random.default_rng(2).normal(size=8)
+    rows, scores = collection.search(query, limit=10)
+    all_scores = collection.score(query)
+    assert list(scores) == pytest.approx(sorted(all_scores, reverse=True)[:10])
+    assert len(rows) == 10
+    assert collection.payloads(rows[:1], payload_fields=[]) == [None]
+
+
+def test_threshold_sweep_matches_qdrant(get_clients):
+    """Test that the evaluation threshold sweep gives Qdrant's metrics locally."""
+    qdrant, local = get_clients
+
+    class Model:
+        def encode(self, label):
+            return np.random.default_rng(len(label)).normal(size=8).tolist()
+
+    labels = ["tax", "passport"]
+    regex_ids = {"tax": ["1", "2", "3"], "passport": ["4", "5"]}
+    assert process_labels(labels, regex_ids, Model(), local, "test") == process_labels(
+        labels, regex_ids, Model(), qdrant, "test"
+    )
@@ -0,0 +1,65 @@
+import pytest
+
+from src.utils.process_results import (
+    format_results_for_display,
+    results_to_dataframe,
+)
+
+
+# Mock search results to use across tests
+@pytest.fixture
+def get_results():
+    def result(id, score, created, urgency):
+        payload = {
+            "created": created,
+            "feedback": f"feedback {id}",
+            "url": "/page",
+            "page_title": "Page",
+            "urgency": urgency,
+            "feedback_type": "Help page",
+            "primary_department": "Department",
+            "document_type": "guide",
+            "taxons": "/taxon",
+        }
+        return {"id": id, "score": score, "payload": payload}
+
+    return [
+        result(1, 0.6, "2024-03-01", 1),
+        result(2, 0.9, "2024-02-01", 3),
+        result(3, 0.9, "2024-03-01", -1),
+        result(4, 0.3, "2024-03-01", 2),
+        result(5, 0.7, "2023-12-01", 2),
+        {"id": 6, "payload": result(6, None, "2024-01-01", 0)["payload"]},
+    ]
+
+
+def test_results_to_dataframe(get_results):
+    """Test that results are renamed and mapped, in the order given."""
+    df = results_to_dataframe(get_results)
+    assert list(df["Feedback comment"]) == [f"feedback {id}" for id in range(1, 7)]
+    assert list(df["Urgency"]) == ["Low", "High", "Unknown", "Medium", "Medium", "None"]
+    # Filter search results have no score
+    assert df["Similarity score"].iloc[-1] == 1.0
+    assert "taxons" not in df.columns
+
+
+def test_format_results_for_display(get_results):
+    """Test that the parsed date is dropped and scores shown as percentages."""
+    displayed = format_results_for_display(results_to_dataframe(get_results))
+    assert "created_date" not in displayed.columns
+    assert list(displayed["Similarity score"]) == [
+        "60%",
+        "90%",
+        "90%",
+        "30%",
+        "70%",
+        "100%",
+    ]
+
+
+def test_duplicate_counts(get_results):
+    """Test that deduplicated results show how many similar comments they group."""
+    assert "Similar comments" not in results_to_dataframe(get_results).columns
+    get_results[0]["payload"]["duplicate_count"] = 4
+    df = results_to_dataframe(get_results)
+    assert list(df["Similar comments"]) == [3, 0, 0, 0, 0, 0]
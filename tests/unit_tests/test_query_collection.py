@@ -0,0 +1,171 @@
+import datetime
+
+import pytest
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from src.collection_utils.query_collection import (
+    count_results,
+    count_similar_results,
+    fetch_results_page,
+    parse_keywords,
+    search_results_page,
+)
+
+
+# Local in-memory collection to use across tests
+@pytest.fixture
+def get_client():
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "test", vectors_config=VectorParams(size=2, distance=Distance.DOT)
+    )
+    rows = [
+        (1, [0.9, 0.0], "2024-01-10", "/a"),
+        (2, [0.5, 0.0], "2024-02-10", "/a"),
+        (3, [0.9, 0.0], "2024-03-10", "/a"),
+        (4, [0.7, 0.0], "2023-12-10", "/a"),
+        (5, [0.8, 0.0], "2024-02-10", "/b"),
+    ]
+    client.upsert(
+        "test",
+        [
+            PointStruct(
+                id=id,
+                vector=vector,
+                payload={"created": created, "url": url, "feedback": f"feedback {id}"},
+            )
+            for id, vector, created, url in rows
+        ],
+    )
+    return client
+
+
+def result_ids(results):
+    return [result["id"] for result in results]
+
+
+def test_top_k_results(get_client):
+    """Test that results are filtered on date server side, ranked by score, and
+    that a limit selects the top k."""
+    query = {
+        "filter_dict": {"url": ["/a"]},
+        "query_embedding": [1.0, 0.0],
+        "score_threshold": 0.0,
+        "start_date": datetime.date(2024, 1, 1),
+        "end_date": datetime.date(2024, 3, 31),
+    }
+    results = search_results_page(get_client, "test", payload_fields=[], **query)
+    assert sorted(result_ids(results)[:2]) == [1, 3]
+    assert result_ids(results)[2] == 2
+    assert [result["score"] for result in results] == pytest.approx([0.9, 0.9, 0.5])
+    top_k = search_results_page(get_client, "test", limit=2, **query)
+    assert sorted(result_ids(top_k)) == [1, 3]
+
+    # Filter searches are ranked by date alone
+    results = search_results_page(get_client, "test", {"url": ["/a"]})
+    assert result_ids(results) == [3, 2, 1, 4]
+    assert (
+        count_results(
+            get_client, "test", {"url": ["/a"]}, start_date=datetime.date(2024, 1, 1)
+        )
+        == 3
+    )
+
+
+def test_keyword_and_hybrid_ranking(get_client):
+    """Test that keywords pre-filter results, ranked by date without a query
+    embedding and by score with one."""
+    keywords = parse_keywords("Feedback 3, feedback 2 ,")
+    assert keywords == ["feedback 3", "feedback 2"]
+
+    results = search_results_page(get_client, "test", {}, keywords=keywords)
+    assert result_ids(results) == [3, 2]
+    assert count_results(get_client, "test", {}, keywords=keywords) == 2
+
+    results = search_results_page(
+        get_client, "test", {}, query_embedding=[1.0, 0.0], keywords=["feedback 2"]
+    )
+    assert result_ids(results) == [2]
+    assert results[0]["score"] == pytest.approx(0.5)
+
+
+def test_deduplicated_results(get_client):
+    """Test that keywords also match a point's duplicates, and that counts give
+    the records the points stand for."""
+    get_client.set_payload(
+        "test",
+        {"duplicate_count": 3, "duplicate_feedback": "reworded comment"},
+        points=[2],
+    )
+    results = search_results_page(
+        get_client,
+        "test",
+        {},
+        keywords=["reworded"],
+        payload_fields=["duplicate_count"],
+    )
+    assert results == [{"id": 2, "score": 1.0, "payload": {"duplicate_count": 3}}]
+
+    assert count_similar_results(
+        get_client,
+        "test",
+        {"url": ["/a"]},
+        query_embedding=[1.0, 0.0],
+        score_threshold=0.0,
+    ) == (4, 6)
+
+
+def test_search_results_page(get_client):
+    """Test that pages are fetched from Qdrant by score, or by date for
+    filter searches, and counted without fetching every result."""
+    query = {"filter_dict": {"url": ["/a"]}, "query_embedding": [1.0, 0.0]}
+    pages = [
+        search_results_page(
+            get_client,
+            "test",
+            score_threshold=0.6,
+            offset=offset,
+            limit=2,
+            payload_fields=["created"],
+            **query,
+        )
+        for offset in [0, 2]
+    ]
+    assert sorted(result["id"] for result in pages[0]) == [1, 3]
+    assert [result["id"] for result in pages[1]] == [4]
+    assert pages[1][0]["payload"] == {"created": "2023-12-10"}
+    assert pages[1][0]["score"] == pytest.approx(0.7)
+    assert count_similar_results(get_client, "test", score_threshold=0.6, **query) == (
+        3,
+        3,
+    )
+    assert count_similar_results(
+        get_client, "test", score_threshold=0.0, limit=2, **query
+    ) == (2, 2)
+
+    # Filter searches are ranked by date, newest first
+    page = search_results_page(
+        get_client, "test", {"url": ["/a"]}, offset=1, limit=2, payload_fields=[]
+    )
+    assert [(result["id"], result["score"]) for result in page] == [(2, 1.0), (1, 1.0)]
+
+
+def test_fetch_results_page(get_client):
+    """Test that a page of payloads is fetched in ranking order."""
+    page = fetch_results_page(
+        get_client, "test", [5, 2], [0.8, 0.5], payload_fields=["feedback"]
+    )
+    assert page == [
+        {"id": 5, "score": 0.8, "payload": {"feedback": "feedback 5"}},
+        {"id": 2, "score": 0.5, "payload": {"feedback": "feedback 2"}},
+    ]
+    assert fetch_results_page(get_client, "test", [], []) == []
+
+
+def test_fetch_results_page_with_vectors(get_client):
+    """Test that vectors are returned when requested."""
+    page = fetch_results_page(
+        get_client, "test", [5], [0.8], payload_fields=[], with_vectors=True
+    )
+    assert page[0]["vector"] == pytest.approx([0.8, 0.0])
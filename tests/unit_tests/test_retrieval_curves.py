@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from src.collection_utils.retrieval_curves import (
+    compute_precision_recall_curve,
+    curve_metrics_at_thresholds,
+)
+
+
+# Mock ranking to use across tests
+@pytest.fixture
+def get_ranking():
+    scores = np.array([0.9, 0.8, 0.8, 0.6, 0.4, 0.2])
+    relevant = np.array([True, False, True, True, False, True])
+    n_relevant = 5  # one relevant record is never retrieved
+    return scores, relevant, n_relevant
+
+
+def brute_force_metrics(scores, relevant, n_relevant, threshold):
+    retrieved = scores >= threshold
+    true_positives = (retrieved & relevant).sum()
+    precision = true_positives / retrieved.sum() if retrieved.sum() else 0
+    recall = true_positives / n_relevant
+    f2 = (
+        5 * precision * recall / (4 * precision + recall)
+        if (4 * precision + recall) > 0
+        else 0
+    )
+    return precision, recall, f2
+
+
+def test_metrics_at_thresholds(get_ranking):
+    """Test that thresholded metrics match counting retrieved records directly."""
+    scores, relevant, n_relevant = get_ranking
+    thresholds = np.arange(0, 1.01, 0.05)
+    precision, recall, f2 = curve_metrics_at_thresholds(
+        scores, relevant, n_relevant, thresholds
+    )
+    for idx, threshold in enumerate(thresholds):
+        expected = brute_force_metrics(scores, relevant, n_relevant, threshold)
+        assert np.allclose([precision[idx], recall[idx], f2[idx]], expected)
+
+
+def test_curve_has_one_point_per_distinct_score(get_ranking):
+    """Test that tied scores form a single cut-off and average precision is correct."""
+    scores, relevant, n_relevant = get_ranking
+    curve = compute_precision_recall_curve(scores, relevant, n_relevant)
+    assert np.allclose(curve["thresholds"], [0.9, 0.8, 0.6, 0.4, 0.2])
+    assert np.allclose(curve["precision"], [1, 2 / 3, 3 / 4, 3 / 5, 4 / 6])
+    assert curve["average_precision"] == pytest.approx((1 + 2 / 3 + 3 / 4 + 4 / 6) / 5)
@@ -0,0 +1,72 @@
+import numpy as np
+
+from src.collection_utils.retrieval_metrics import (
+    build_id_positions,
+    calculate_metric_matrices,
+    ids_to_bitsets,
+)
+
+
+def test_bitset_metrics_match_set_intersections():
+    """Test that bitset metrics match set based precision and recall."""
+    rng = np.random.default_rng(0)
+    all_ids = [str(i) for i in range(50)]
+    regex_ids = {
+        label: list(rng.choice(all_ids, size=rng.integers(1, 20), replace=False))
+        for label in ["a", "b", "c"]
+    }
+    # IDs outside the relevant sets still count towards the number retrieved
+    retrieved = [
+        [
+            list(rng.choice(all_ids + ["x", "y"], size=n, replace=False))
+            for n in [0, 5, 30]
+        ]
+        for _ in regex_ids
+    ]
+
+    id_positions = build_id_positions(regex_ids.values())
+    retrieved_bitsets = ids_to_bitsets(
+        [ids for label_ids in retrieved for ids in label_ids], id_positions
+    ).reshape(3, 3, -1)
+    relevant_bitsets = ids_to_bitsets(list(regex_ids.values()), id_positions)
+    retrieved_counts = np.array(
+        [[len(ids) for ids in label_ids] for label_ids in retrieved]
+    )
+    relevant_counts = [len(ids) for ids in regex_ids.values()]
+
+    precision, recall, _ = calculate_metric_matrices(
+        retrieved_bitsets, retrieved_counts, relevant_bitsets, relevant_counts
+    )
+
+    for row, relevant in enumerate(regex_ids.values()):
+        for col, ids in enumerate(retrieved[row]):
+            true_positives = len(set(ids).intersection(relevant))
+            expected_precision = true_positives / len(ids) if ids else 0
+            assert precision[row, col] == expected_precision
+            assert recall[row, col] == true_positives / len(relevant)
+
+
+def test_failed_searches_are_missing():
+    """Test that NaN retrieved counts give NaN metrics."""
+    id_positions = build_id_positions([["1", "2"]])
+    retrieved_bitsets = ids_to_bitsets([["1"], []], id_positions).reshape(1, 2, -1)
+    relevant_bitsets = ids_to_bitsets([["1", "2"]], id_positions)
+    precision, recall, f2 = calculate_metric_matrices(
+        retrieved_bitsets, np.array([[1, np.nan]]), relevant_bitsets, [2]
+    )
+    assert precision[0, 0] == 1 and recall[0, 0] == 0.5
+    assert np.isnan([precision[0, 1], recall[0, 1], f2[0, 1]]).all()
+
+
+def test_ids_to_bitsets_matches_packbits():
+    """Test that bits are set as np.packbits would pack boolean masks."""
+    id_positions = {str(i): i for i in range(13)}
+    id_lists = [["0", "7", "8", "12", "unknown"], [], ["3", "3"]]
+    masks = np.zeros((3, 13), dtype=bool)
+    masks[0, [0, 7, 8, 12]] = True
+    masks[2, 3] = True
+
+    bitsets = ids_to_bitsets(id_lists, id_positions)
+    assert bitsets.dtype == np.uint8
+    np.testing.assert_array_equal(bitsets, np.packbits(masks, axis=-1))
+    assert ids_to_bitsets([], id_positions).shape == (0, 2)
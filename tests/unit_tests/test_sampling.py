@@ -1,6 +1,15 @@
+from collections import Counter
+
 import pytest
 
-from src.utils.sample import get_stratified_sample
+from src.utils.sample import (
+    allocate_quotas,
+    get_quota_stratified_sample,
+    get_stratified_sample,
+    reservoir_sample,
+    stratified_reservoir_sample,
+    weighted_reservoir_sample,
+)
 
 
 # Mock data to use across tests
@@ -22,3 +31,63 @@ def test_sample_size(get_labels):
     sample_size = 4
     samples = get_stratified_sample(get_labels, sample_size)
     assert len(samples) == sample_size, "Sample size does not match requested size."
+
+
+def test_allocate_quotas_sums_to_sample_size():
+    quotas = allocate_quotas({"A": 5, "B": 3, "C": 2, "D": 1}, 7)
+
+    assert sum(quotas.values()) == 7
+    assert quotas == {"A": 3, "B": 2, "C": 1, "D": 1}
+
+
+@pytest.mark.parametrize("sample_size", [1, 4, 6, 10])
+def test_quota_sample_has_no_duplicates(get_labels, sample_size):
+    samples = get_quota_stratified_sample(get_labels, sample_size, seed=0)
+    ids = [record["feedback_record_id"] for record in samples]
+
+    assert len(ids) == min(sample_size, len(get_labels))
+    assert len(set(ids)) == len(ids)
+
+
+def test_quota_sample_follows_label_proportions():
+    records = [
+        {"feedback_record_id": idx, "labels": ["A" if idx < 800 else "B"]}
+        for idx in range(1000)
+    ]
+
+    samples = get_quota_stratified_sample(records, 50, seed=1)
+
+    assert sum(record["labels"] == ["A"] for record in samples) == 40
+
+
+def test_reservoir_sample_reads_a_stream_uniformly():
+    counts = Counter()
+    for seed in range(2000):
+        sample = reservoir_sample(iter(range(10)), 5, seed=seed)
+        assert len(set(sample)) == 5
+        counts.update(sample)
+
+    assert reservoir_sample(iter(range(3)), 5) == [0, 1, 2]
+    assert all(900 < count < 1100 for count in counts.values())
+
+
+def test_weighted_reservoir_sample_favours_heavy_records():
+    records = [{"id": idx, "weight": 9 if idx == 0 else 1} for idx in range(10)]
+    first = Counter(
+        weighted_reservoir_sample(iter(records), 1, "weight", seed=seed)[0]["id"]
+        for seed in range(2000)
+    )
+
+    assert 0.4 < first[0] / 2000 < 0.6
+    assert weighted_reservoir_sample(records, 3, lambda r: r["id"] == 0) == [records[0]]
+
+
+def test_stratified_reservoir_sample_samples_each_stratum(get_labels):
+    samples = stratified_reservoir_sample(
+        iter(get_labels), {"A": 2, "C": 1}, stratum_key="labels", seed=0
+    )
+
+    assert set(samples) == {"A", "C"}
+    assert len(samples["A"]) == 2
+    assert all("A" in record["labels"] for record in samples["A"])
+    assert len(samples["C"]) == 1
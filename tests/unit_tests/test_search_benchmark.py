@@ -0,0 +1,154 @@
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import Distance, PointStruct, VectorParams
+
+from src.collection_utils.local_search import LocalSearchClient, export_collection
+from src.collection_utils.search_benchmark import (
+    create_benchmark_collection,
+    filter_combination,
+    generate_synthetic_workload,
+    hash_query_embedding,
+    measure_recall,
+    parse_query_log,
+    run_query,
+    summarise_recall,
+    summarise_results,
+)
+
+
+def test_parse_query_log():
+    """Test that semantic, keyword, hybrid and filter searches are read from app log lines."""
+    lines = [
+        "2024-05-01 10:00:00 | __main__ | INFO | user_id:a | session_id:b | running semantic search for 'tax refund' with filters {'url': [], 'urgency': [None, 2], 'spam_classification': ['not spam']}...\n",
+        "2024-05-01 10:00:01 | __main__ | INFO | user_id:a | session_id:b | running semantic search for 'tax refund' returned 12 results\n",
+        "2024-05-01 10:00:02 | __main__ | INFO | user_id | a | session_id:b | running filter search with filters {'url': ['/tax'], 'urgency': []}...\n",
+        "2024-05-01 10:00:03 | __main__ | INFO | user_id | a | session_id:b | running filter search with filters {'url': ['/tax'], 'urgency': []} returned 3 results\n",
+        "2024-05-01 10:00:04 | __main__ | INFO | user_id:a | session_id:b | running keyword search for 'refund, late' with filters {'url': []}...\n",
+        "2024-05-01 10:00:05 | __main__ | INFO | user_id:a | session_id:b | running hybrid search for 'refund' with filters {'url': ['/tax']}...\n",
+    ]
+    workload = parse_query_log(lines)
+    assert workload == [
+        {
+            "search_type": "semantic",
+            "search_terms": "tax refund",
+            "filter_dict": {
+                "url": [],
+                "urgency": [None, 2],
+                "spam_classification": ["not spam"],
+            },
+        },
+        {
+            "search_type": "filter",
+            "search_terms": "",
+            "filter_dict": {"url": ["/tax"], "urgency": []},
+        },
+        {
+            "search_type": "keyword",
+            "search_terms": "refund, late",
+            "filter_dict": {"url": []},
+        },
+        {
+            "search_type": "hybrid",
+            "search_terms": "refund",
+            "filter_dict": {"url": ["/tax"]},
+        },
+    ]
+    assert filter_combination(workload[0]) == "semantic: urgency"
+    assert filter_combination(workload[1]) == "filter: url"
+    assert filter_combination(workload[3]) == "hybrid: url"
+
+
+def test_run_query_replays_keyword_searches():
+    """Test that keyword and hybrid queries are replayed with their keywords."""
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "test", vectors_config=VectorParams(size=2, distance=Distance.DOT)
+    )
+    client.upsert(
+        "test",
+        [
+            PointStruct(
+                id=id,
+                vector=[1.0, float(id)],
+                payload={"created": "2024-05-01", "url": url, "feedback": feedback},
+            )
+            for id, url, feedback in [
+                (1, "/tax", "refund is late"),
+                (2, "/tax", "late again"),
+                (3, "/visa", "no refund"),
+            ]
+        ],
+    )
+    keyword = {
+        "search_type": "keyword",
+        "search_terms": "refund, late",
+        "filter_dict": {"url": []},
+    }
+    hybrid = {
+        "search_type": "hybrid",
+        "search_terms": "refund",
+        "filter_dict": {"url": ["/tax"]},
+    }
+
+    result = run_query(client, "test", keyword, [-1.0, 0.0], 0.5)
+    assert result["error"] is None
+    assert result["n_results"] == 3
+    # Hybrid searches have no score threshold, so the negative score is kept
+    result = run_query(client, "test", hybrid, [-1.0, 0.0], 0.5)
+    assert result["n_results"] == 1
+
+
+def test_summarise_results():
+    """Test that latency percentiles and result sizes are summarised per combination."""
+    results = [
+        {
+            "combination": "semantic: url",
+            "latency": 0.01,
+            "n_results": 4,
+            "error": None,
+        },
+        {
+            "combination": "semantic: url",
+            "latency": 0.03,
+            "n_results": 2,
+            "error": None,
+        },
+        {
+            "combination": "filter: url",
+            "latency": 0.02,
+            "n_results": 1,
+            "error": "timeout",
+        },
+    ]
+    summaries = {
+        summary["combination"]: summary for summary in summarise_results(results, 2.0)
+    }
+    assert summaries["semantic: url"]["p50_ms"] == 20.0
+    assert summaries["semantic: url"]["mean_results"] == 3
+    assert summaries["semantic: url"]["throughput_qps"] == 1.0
+    assert summaries["filter: url"]["errors"] == 1
+    assert "p50_ms" not in summaries["filter: url"]
+    assert summaries["all"]["queries"] == 3
+
+
+def test_measure_recall(tmp_path):
+    """Test that an exact Qdrant search has full recall against the local search."""
+    client = QdrantClient(":memory:")
+    create_benchmark_collection(client, "benchmark", 300, size=16)
+    export_collection(client, "benchmark", str(tmp_path / "benchmark"))
+    workload = generate_synthetic_workload(20)
+    query_embeddings = [
+        hash_query_embedding(query["search_terms"], size=16) for query in workload
+    ]
+
+    results = measure_recall(
+        client,
+        LocalSearchClient(str(tmp_path)),
+        "benchmark",
+        workload,
+        query_embeddings,
+    )
+    assert len(results) == sum(q["search_type"] == "semantic" for q in workload)
+    assert all(result["recall"] == 1.0 for result in results)
+    summaries = summarise_recall(results)
+    assert summaries[-1]["combination"] == "all"
+    assert summaries[-1]["mean_recall"] == 1.0
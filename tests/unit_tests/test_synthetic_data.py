@@ -0,0 +1,30 @@
+import numpy as np
+import pyarrow.parquet as pq
+
+from src.utils.synthetic_data import (
+    FEEDBACK_SCHEMA,
+    read_feedback_batches,
+    write_synthetic_feedback,
+)
+
+
+def test_write_synthetic_feedback(tmp_path):
+    """Test that records are streamed to Parquet with the feedback schema."""
+    path = str(tmp_path / "feedback.parquet")
+    write_synthetic_feedback(
+        path, n_rows=250, batch_size=100, n_pages=50, n_departments=5, n_topics=4
+    )
+
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.schema_arrow == FEEDBACK_SCHEMA
+    assert parquet_file.metadata.num_rows == 250
+    assert parquet_file.metadata.num_row_groups == 3
+
+    records = [record for batch in read_feedback_batches(path) for record in batch]
+    assert [record["feedback_record_id"] for record in records] == [
+        str(idx) for idx in range(250)
+    ]
+    embeddings = np.array([record["embeddings"] for record in records])
+    assert embeddings.shape == (250, 768)
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1, atol=1e-5)
+    assert {record["urgency"] for record in records} <= {0, 1, 2, 3}
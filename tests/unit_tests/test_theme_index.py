@@ -0,0 +1,89 @@
+import numpy as np
+
+from src.collection_utils.theme_index import (
+    build_theme_index,
+    cluster_keywords,
+    get_themes,
+    load_theme_index,
+    minibatch_kmeans,
+    save_theme_index,
+    url_prefix,
+)
+
+
+def _records():
+    rng = np.random.default_rng(0)
+    centres = np.eye(4, dtype=np.float32) * 5
+    topics = [("passport renewal delayed", "/passport/renew"), ("vat rates", "/vat")]
+    ids, vectors, payloads = [], [], []
+    for idx in range(120):
+        topic = idx % 2
+        ids.append(idx)
+        vectors.append(centres[topic + 2 * (idx % 3 == 0)] + rng.normal(size=4))
+        payloads.append(
+            {
+                "url": topics[topic][1],
+                "primary_department": "HMRC",
+                "feedback": topics[topic][0],
+            }
+        )
+    return np.array(ids), np.array(vectors, dtype=np.float32), payloads
+
+
+def test_url_prefix():
+    assert url_prefix("/browse/tax/vat") == "/browse"
+    assert url_prefix("/browse/tax/vat", depth=2) == "/browse/tax"
+    assert url_prefix(None) == "/"
+
+
+def test_minibatch_kmeans_separates_clusters():
+    rng = np.random.default_rng(0)
+    vectors = np.vstack(
+        [rng.normal(loc=loc, size=(300, 2)) for loc in ([0, 0], [10, 0], [0, 10])]
+    )
+
+    _, labels = minibatch_kmeans(vectors, 3, batch_size=100)
+
+    assert len(set(labels)) == 3
+    for start in (0, 300, 600):
+        assert len(set(labels[start : start + 300])) == 1
+
+
+def test_cluster_keywords_prefers_distinctive_words():
+    keywords = cluster_keywords(
+        [["passport renewal form", "passport delay"], ["vat rates", "vat form"]],
+        n_keywords=1,
+    )
+
+    assert keywords == [["passport"], ["vat"]]
+
+
+def test_theme_index_round_trip(tmp_path):
+    ids, vectors, payloads = _records()
+    index = build_theme_index(ids, vectors, payloads, max_clusters=4)
+    path = str(tmp_path / "themes.json")
+    save_theme_index(index, path)
+
+    loaded = load_theme_index(path)
+    themes = get_themes(
+        loaded, urls=["/passport/apply", "/other"], departments=["HMRC"]
+    )
+
+    assert set(themes) == {"/passport", "HMRC"}
+    assert sum(theme["size"] for theme in themes["HMRC"]) == 120
+    assert sum(theme["size"] for theme in themes["/passport"]) == 60
+    assert themes["HMRC"][0]["centroid"].shape == (4,)
+    assert all(theme["representative_ids"] for theme in themes["HMRC"])
+
+
+def test_theme_sizes_count_duplicates():
+    """Test that deduplicated points count as the records they stand for."""
+    ids, vectors, payloads = _records()
+    for payload in payloads:
+        if payload["url"] == "/passport/renew":
+            payload["duplicate_count"] = 3
+    index = build_theme_index(ids, vectors, payloads, max_clusters=4)
+
+    assert sum(theme["size"] for theme in index["primary_department"]["HMRC"]) == 240
+    assert sum(theme["size"] for theme in index["url_prefix"]["/passport"]) == 180
+    assert sum(theme["size"] for theme in index["url_prefix"]["/vat"]) == 60
@@ -0,0 +1,45 @@
+import logging
+import urllib.request
+
+from src.utils.timing import TimingRegistry, span, start_metrics_server, time_stream
+
+
+def test_span_records_and_logs(caplog):
+    """Test that a span records its duration and logs it with the user fields."""
+    registry = TimingRegistry(buckets=[0.1, 1])
+    logger = logging.getLogger("test_timing")
+    with caplog.at_level(logging.INFO, logger="test_timing"):
+        with span("search", logger, "user", "session", registry=registry) as timing:
+            timing["n_results"] = 3
+
+    histogram = registry.snapshot()["search"]
+    assert histogram["count"] == 1
+    assert histogram["counts"] == [1, 0, 0]
+    assert caplog.messages[0].startswith(
+        "user_id:user | session_id:session | timing | stage=search duration_ms="
+    )
+    assert caplog.messages[0].endswith(" n_results=3")
+
+
+def test_time_stream_and_metrics_endpoint():
+    """Test that streams are timed to first item and served as Prometheus histograms."""
+    registry = TimingRegistry(buckets=[0.1, 1])
+    assert list(time_stream(iter("abc"), "openai", registry=registry)) == [
+        "a",
+        "b",
+        "c",
+    ]
+    assert set(registry.snapshot()) == {"openai", "openai_first_item"}
+
+    server = start_metrics_server(0, registry)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        page = urllib.request.urlopen(url).read().decode("utf-8")
+    finally:
+        server.shutdown()
+    assert (
+        'feedback_app_stage_duration_seconds_bucket{stage="openai",le="+Inf"} 1' in page
+    )
+    assert (
+        'feedback_app_stage_duration_seconds_count{stage="openai_first_item"} 1' in page
+    )